@@ -0,0 +1,77 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+ Measure how many analog samples per second a FilterPipeline filters,
+ for each stage and for a combined pipeline, at several batch sizes.
+ The sample loop calls add() per sample and run() per batch, the way
+ the clients use the pipeline.
+
+ Usage: python benchmarks/analog_filter_throughput.py [--samples 200000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.signal_filters import FilterPipeline
+
+PIPELINES = [('moving_average', [('moving_average', 8)]),
+             ('median', [('median', 5)]),
+             ('ema', [('ema', .2)]),
+             ('low_pass', [('low_pass', 10)]),
+             ('median+ema+low_pass', [('median', 5), ('ema', .2), ('low_pass', 10)])]
+
+
+def measure(filters, batch, samples):
+    """
+    :return: samples filtered per second
+    """
+    pipeline = FilterPipeline(filters)
+    values = [value & 0xfff for value in range(samples)]
+    start = time.perf_counter()
+    time_stamp = 0.0
+    for count, value in enumerate(values, 1):
+        time_stamp += .001
+        pipeline.add(value, time_stamp)
+        if not count % batch:
+            pipeline.run()
+    pipeline.run()
+    return samples / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=200000,
+                        help='samples filtered for each measurement')
+    parser.add_argument('--batches', type=int, nargs='+',
+                        default=[1, 16, FilterPipeline.MAX_BATCH],
+                        help='batch sizes to measure')
+    args = parser.parse_args()
+
+    print(f'{"pipeline":>20} {"batch":>6} {"samples/s":>12}')
+    for name, filters in PIPELINES:
+        for batch in args.batches:
+            rate = measure(filters, batch, args.samples)
+            print(f'{name:>20} {batch:6d} {rate:12.0f}')
+
+
+if __name__ == '__main__':
+    main()
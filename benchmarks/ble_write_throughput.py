@@ -0,0 +1,128 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+ Measure how many commands per second BleAioTransport writes, against a
+ fake bleak client that simulates GATT timing. A write with response
+ takes two connection intervals, one for the write and one for the
+ response. A write without response takes one.
+
+ The per command writes with response that the transport used to make are
+ compared with MTU packed writes, with and without response, for bursts
+ of 4 byte commands such as a configuration replay.
+
+ Usage: python benchmarks/ble_write_throughput.py [--interval .0075]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_aio_esp32 import ble_aio_transport
+# noinspection PyUnresolvedReferences
+from telemetrix_aio_esp32.ble_aio_transport import BleAioTransport
+
+# a SET_PIN_MODE frame
+COMMAND = bytes([3, 1, 4, 1])
+
+
+class FakeBleakClient:
+    """
+    Stands in for BleakClient with simulated GATT write timing.
+    """
+
+    interval = .0075
+
+    mtu_size = 23
+
+    properties = ['write', 'write-without-response']
+
+    def __init__(self, device, disconnected_callback=None):
+        self.address = device
+        characteristic = SimpleNamespace(properties=self.properties)
+        self.services = SimpleNamespace(get_characteristic=lambda uuid: characteristic)
+
+    async def connect(self):
+        pass
+
+    async def start_notify(self, uuid, handler):
+        pass
+
+    async def write_gatt_char(self, uuid, payload, response=False):
+        await asyncio.sleep(self.interval * (2 if response else 1))
+
+
+async def receive(sender, data):
+    pass
+
+
+async def commands_per_second(mode, burst, commands):
+    """
+    :param mode: 'per command', 'packed' or 'packed, no response'
+
+    :return: commands written per second
+    """
+    transport = BleAioTransport(ble_mac_address='CC:CC:CC:CC:CC:CC',
+                                receive_callback=receive)
+    with contextlib.redirect_stdout(io.StringIO()):
+        await transport.connect()
+    if mode == 'packed':
+        transport.write_without_response = False
+
+    start = time.perf_counter()
+    for _ in range(commands // burst):
+        if mode == 'per command':
+            for _ in range(burst):
+                await transport.client.write_gatt_char(transport.UART_TX_UUID,
+                                                       COMMAND, response=True)
+        else:
+            await transport.write(COMMAND * burst)
+    return commands / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=float, default=.0075,
+                        help='simulated BLE connection interval in seconds')
+    parser.add_argument('--mtu', type=int, nargs='+', default=[23, 247],
+                        help='negotiated MTU sizes to measure')
+    parser.add_argument('--burst', type=int, default=50,
+                        help='commands written together')
+    parser.add_argument('--commands', type=int, default=500,
+                        help='commands written for each measurement')
+    args = parser.parse_args()
+
+    FakeBleakClient.interval = args.interval
+    ble_aio_transport.BleakClient = FakeBleakClient
+
+    print(f'{"mtu":>4} {"mode":>20} {"commands/s":>11}')
+    for mtu in args.mtu:
+        FakeBleakClient.mtu_size = mtu
+        for mode in ('per command', 'packed', 'packed, no response'):
+            rate = asyncio.run(commands_per_second(mode, args.burst, args.commands))
+            print(f'{mtu:4d} {mode:>20} {rate:11.0f}')
+
+
+if __name__ == '__main__':
+    main()
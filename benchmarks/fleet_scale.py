@@ -0,0 +1,90 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+ Start a BoardFleet of simulated boards and measure the fleet connect
+ time, the bus report rate and the CPU used by the event loop.
+
+ The boards are simulated by the board farm process of
+ reactor_scaling.py, which streams analog reports to every connection.
+
+ Usage: python benchmarks/fleet_scale.py [--boards 250] [--rate 50]
+                                         [--duration 5]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from reactor_scaling import PIN, board_farm
+# noinspection PyUnresolvedReferences
+from telemetrix_aio_esp32.board_fleet import BoardFleet
+
+
+async def run_fleet(port, count, duration):
+    fleet = BoardFleet(loop=asyncio.get_running_loop())
+    for board_id in range(count):
+        fleet.add_board(board_id, transport_address='127.0.0.1', ip_port=port,
+                        restart_on_shutdown=False, shutdown_on_exception=False)
+    connected = await fleet.start()
+    for board_id in connected:
+        await fleet.get_board(board_id).set_pin_mode_analog_input(
+            PIN, callback=fleet.bus_callback(board_id))
+
+    await asyncio.sleep(1)
+    start_reports = (await fleet.metrics())['reports']
+    start_cpu = time.process_time()
+    await asyncio.sleep(duration)
+    cpu = (time.process_time() - start_cpu) / duration
+    metrics = await fleet.metrics()
+    await fleet.shutdown()
+    return metrics, (metrics['reports'] - start_reports) / duration, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boards', type=int, default=250,
+                        help='number of simulated boards')
+    parser.add_argument('--rate', type=int, default=50,
+                        help='reports per second sent by each board')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds to measure')
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    farm = multiprocessing.Process(target=board_farm, args=(port_queue, args.rate),
+                                   daemon=True)
+    farm.start()
+    port = port_queue.get()
+
+    metrics, rate, cpu = asyncio.run(run_fleet(port, args.boards, args.duration))
+    farm.terminate()
+
+    print(f'boards connected:     {metrics["connected"]} of {metrics["boards"]}')
+    print(f'fleet connect time:   {metrics["fleet_connect_time"]:.2f} s')
+    print(f'slowest board:        {metrics["slowest_connect_time"]:.2f} s')
+    print(f'bus reports/s:        {rate:.0f} of {args.boards * args.rate} sent')
+    print(f'event loop cpu:       {cpu * 100:.1f} %')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+ Compare the thread count and CPU use of N sync WI-FI boards, each with
+ its own receive and report threads, with N boards sharing an IoReactor.
+
+ The boards are simulated by a separate process that streams analog
+ reports to every connection at a fixed rate, so only the client's CPU
+ time is measured.
+
+ Usage: python benchmarks/reactor_scaling.py [--boards 10 50 100 200]
+                                             [--rate 100] [--duration 5]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32.io_reactor import IoReactor
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.packet_framer import PacketFramer
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+PIN = 36
+
+# shortest time between the report bursts of a simulated board
+BURST_INTERVAL = .01
+
+
+def board_farm(port_queue, rate):
+    """
+    Simulated boards process. Every accepted connection is a board that
+    answers the firmware version request and streams rate analog reports
+    per second once the analog pin mode is set.
+    """
+    listener = socket.create_server(('127.0.0.1', 0), backlog=1024)
+    port_queue.put(listener.getsockname()[1])
+
+    burst = max(1, int(rate * BURST_INTERVAL))
+    interval = burst / rate
+    frames = b''.join(bytes([4, PrivateConstants.ANALOG_REPORT, PIN, 0, value])
+                      for value in range(burst))
+
+    def serve(connection):
+        framer = PacketFramer()
+        streaming = False
+        connection.settimeout(interval)
+        next_burst = time.monotonic()
+        while True:
+            try:
+                data = connection.recv(4096)
+                if not data:
+                    return
+                for command in framer.feed(data):
+                    if not command:
+                        continue
+                    if command[0] == PrivateConstants.GET_FIRMWARE_VERSION:
+                        connection.sendall(bytes([4, PrivateConstants.FIRMWARE_REPORT,
+                                                  2, 0, 0]))
+                    elif command[0] == PrivateConstants.SET_PIN_MODE:
+                        streaming = True
+            except socket.timeout:
+                pass
+            except OSError:
+                return
+            if streaming and time.monotonic() >= next_burst:
+                next_burst += interval
+                try:
+                    connection.sendall(frames)
+                except OSError:
+                    return
+
+    while True:
+        connection, _ = listener.accept()
+        threading.Thread(target=serve, args=(connection,), daemon=True).start()
+
+
+def measure(port, count, reactor, duration):
+    """
+    :return: (threads, CPU seconds per second, reports per second)
+    """
+    counts = [0]
+
+    def count_report(report):
+        counts[0] += 1
+
+    boards = [TelemetrixEsp32(transport_address='127.0.0.1', ip_port=port,
+                              restart_on_shutdown=False,
+                              shutdown_on_exception=False, reactor=reactor)
+              for _ in range(count)]
+    for board in boards:
+        board.set_pin_mode_analog_input(PIN, callback=count_report)
+    time.sleep(1)
+
+    threads = threading.active_count()
+    start_count = counts[0]
+    start_cpu = time.process_time()
+    time.sleep(duration)
+    cpu = (time.process_time() - start_cpu) / duration
+    delivered = (counts[0] - start_count) / duration
+
+    for board in boards:
+        board.shutdown()
+    return threads, cpu, delivered
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boards', type=int, nargs='+', default=[10, 50, 100, 200],
+                        help='board counts to measure')
+    parser.add_argument('--rate', type=int, default=100,
+                        help='reports per second sent by each board')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds to measure each configuration')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='reactor dispatch workers')
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    farm = multiprocessing.Process(target=board_farm, args=(port_queue, args.rate),
+                                   daemon=True)
+    farm.start()
+    port = port_queue.get()
+
+    # the boards print their connection messages - keep the table readable
+    results = []
+    for count in args.boards:
+        for mode in ('threads', 'reactor'):
+            reactor = IoReactor(args.workers) if mode == 'reactor' else None
+            results.append((count, mode) + measure(port, count, reactor,
+                                                   args.duration))
+            if reactor:
+                reactor.stop()
+
+    print(f'{"boards":>6} {"mode":>8} {"threads":>8} {"cpu %":>8} {"reports/s":>10}')
+    for count, mode, threads, cpu, delivered in results:
+        print(f'{count:6d} {mode:>8} {threads:8d} {cpu * 100:8.1f} {delivered:10.0f}')
+    farm.terminate()
+
+
+if __name__ == '__main__':
+    main()
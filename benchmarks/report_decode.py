@@ -0,0 +1,88 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+ Measure the decode time of each fixed layout report type, for the
+ precompiled structs in report_decoders and for the list based decoding
+ they replaced.
+
+ Usage: python benchmarks/report_decode.py [--reports 500000]
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common import report_decoders
+
+
+def list_pin_value(data):
+    data = list(data)
+    return data[0], (data[1] << 8) + data[2]
+
+
+def list_dht_data(data):
+    f_humidity = bytearray(data[2:6])
+    f_temperature = bytearray(data[6:])
+    return (data[0], data[1], struct.unpack('<f', f_humidity)[0],
+            struct.unpack('<f', f_temperature)[0])
+
+
+def list_stepper_value(data):
+    return data[0], int.from_bytes(bytes(data[1:]), byteorder='big', signed=True)
+
+
+# report type, report data, list decode, struct decoder
+REPORT_TYPES = [
+    ('analog', bytes([36, 0x0f, 0xff]), list_pin_value, report_decoders.PIN_VALUE),
+    ('touch', bytes([4, 0x01, 0x20]), list_pin_value, report_decoders.PIN_VALUE),
+    ('sonar', bytes([12, 0x00, 0x96]), list_pin_value, report_decoders.PIN_VALUE),
+    ('debug', bytes([1, 0x12, 0x34]), list_pin_value, report_decoders.DEBUG_VALUE),
+    ('dht', bytes([0, 4]) + struct.pack('<ff', 45.5, 21.25), list_dht_data,
+     report_decoders.DHT_DATA),
+    ('stepper', bytes([1]) + (-12345).to_bytes(4, 'big', signed=True),
+     list_stepper_value, report_decoders.STEPPER_VALUE),
+]
+
+
+def nanoseconds_per_decode(decode, data, count):
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        decode(data)
+    return (time.perf_counter_ns() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reports', type=int, default=500000,
+                        help='reports decoded for each measurement')
+    args = parser.parse_args()
+
+    print(f'{"report":>8} {"list ns":>8} {"struct ns":>10} {"speedup":>8}')
+    for name, data, list_decode, decoder in REPORT_TYPES:
+        list_time = nanoseconds_per_decode(list_decode, data, args.reports)
+        struct_time = nanoseconds_per_decode(decoder.unpack_from, data, args.reports)
+        print(f'{name:>8} {list_time:8.0f} {struct_time:10.0f} '
+              f'{list_time / struct_time:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+ Compare report lists with report objects (report_objects=True).
+ For analog, DHT and stepper reports, measure the memory allocated per
+ report and the reports per second through the TelemetrixEsp32 report
+ handler, including a callback that reads every field.
+
+ Usage: python benchmarks/report_objects.py [--reports 200000]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+
+PIN = 36
+
+DHT_PIN = 4
+
+MOTOR = 1
+
+# name, handler name, report data, and callbacks that read the fields
+# of a report list and of a report object
+REPORT_TYPES = [
+    ('analog', '_analog_message', bytes([PIN, 0x0f, 0xff]),
+     lambda report: (report[1], report[2], report[3]),
+     lambda report: (report.pin, report.value, report.timestamp)),
+    ('dht', '_dht_report', bytes([0, DHT_PIN]) + struct.pack('<ff', 45.5, 21.25),
+     lambda report: (report[2], report[3], report[4], report[5]),
+     lambda report: (report.pin, report.humidity, report.temperature,
+                     report.timestamp)),
+    ('stepper', '_stepper_current_position_report', bytes([MOTOR, 0, 0, 1, 0]),
+     lambda report: (report[1], report[2], report[3]),
+     lambda report: (report.motor_id, report.value, report.timestamp)),
+]
+
+
+def make_client(report_objects, callback):
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = TelemetrixEsp32(transport_address='127.0.0.1', autostart=False,
+                                 restart_on_shutdown=False,
+                                 shutdown_on_exception=False,
+                                 report_objects=report_objects)
+    client.analog_callbacks[PIN] = callback
+    client.dht_callbacks[DHT_PIN] = callback
+    client.stepper_info_list[MOTOR]['current_position_callback'] = callback
+    return client
+
+
+def bytes_per_report(report_objects, handler_name, data, count):
+    """
+    :return: bytes allocated for each report kept by the callback
+    """
+    kept = []
+    handler = getattr(make_client(report_objects, kept.append), handler_name)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(count):
+        handler(data)
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # the list that holds the reports is not part of their cost
+    return (allocated - sys.getsizeof(kept)) / count
+
+
+def reports_per_second(report_objects, handler_name, data, callback, count):
+    """
+    :return: reports handled per second by a callback that reads their fields
+    """
+    handler = getattr(make_client(report_objects, callback), handler_name)
+    start = time.perf_counter()
+    for _ in range(count):
+        handler(data)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reports', type=int, default=200000,
+                        help='reports handled for each measurement')
+    args = parser.parse_args()
+
+    print(f'{"report":>8} {"format":>7} {"bytes/report":>13} {"reports/s":>11}')
+    for name, handler_name, data, *callbacks in REPORT_TYPES:
+        for report_objects, callback in zip((False, True), callbacks):
+            size = bytes_per_report(report_objects, handler_name, data,
+                                    min(args.reports, 50000))
+            rate = reports_per_second(report_objects, handler_name, data, callback,
+                                      args.reports)
+            report_format = 'object' if report_objects else 'list'
+            print(f'{name:>8} {report_format:>7} {size:13.1f} {rate:11.0f}')
+
+
+if __name__ == '__main__':
+    main()
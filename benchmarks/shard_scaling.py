@@ -0,0 +1,176 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+ Compare the aggregate report rate of N boards decoded in one process
+ with N ShardedBoard worker processes, for N = 1, 2, 4 and 8.
+
+ Each board is simulated by a process that streams analog reports over
+ TCP as fast as the client reads them. Results depend on the number of
+ cores: sharding can only scale up to the cores available.
+
+ Usage: python benchmarks/shard_scaling.py [--duration 5] [--boards 1 2 4 8]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32.board_shard import ShardedBoard
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.packet_framer import PacketFramer
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+PIN = 36
+
+
+def streaming_board(port_queue):
+    """
+    Simulated board process. Answers the firmware version request and
+    streams analog reports once the analog pin mode is set.
+    """
+    listener = socket.create_server(('127.0.0.1', 0))
+    port_queue.put(listener.getsockname()[1])
+    connection, _ = listener.accept()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    frames = b''.join(bytes([4, PrivateConstants.ANALOG_REPORT, PIN,
+                             value >> 8, value & 0xff])
+                      for value in range(1024))
+    streaming = threading.Event()
+
+    def read_commands():
+        framer = PacketFramer()
+        while True:
+            try:
+                data = connection.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            for command in framer.feed(data):
+                if not command:
+                    continue
+                if command[0] == PrivateConstants.GET_FIRMWARE_VERSION:
+                    connection.sendall(bytes([4, PrivateConstants.FIRMWARE_REPORT,
+                                              2, 0, 0]))
+                elif command[0] == PrivateConstants.SET_PIN_MODE:
+                    streaming.set()
+
+    threading.Thread(target=read_commands, daemon=True).start()
+    streaming.wait()
+    try:
+        while True:
+            connection.sendall(frames)
+    except OSError:
+        pass
+
+
+def start_boards(count):
+    port_queue = multiprocessing.Queue()
+    processes = []
+    for _ in range(count):
+        process = multiprocessing.Process(target=streaming_board,
+                                          args=(port_queue,), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes, [port_queue.get() for _ in range(count)]
+
+
+def run_in_process(ports, duration):
+    """
+    All boards in this process, each with its own receive and report threads.
+    """
+    counts = [0]
+
+    def count_report(report):
+        counts[0] += 1
+
+    boards = [TelemetrixEsp32(transport_address='127.0.0.1', ip_port=port,
+                              restart_on_shutdown=False,
+                              shutdown_on_exception=False)
+              for port in ports]
+    for board in boards:
+        board.set_pin_mode_analog_input(PIN, callback=count_report)
+    time.sleep(.5)
+    start_count = counts[0]
+    time.sleep(duration)
+    delivered = counts[0] - start_count
+    for board in boards:
+        board.shutdown()
+    return delivered / duration, 0
+
+
+def run_sharded(ports, duration):
+    """
+    Each board in its own worker process.
+    """
+    counts = [0]
+
+    def count_report(report):
+        counts[0] += 1
+
+    shards = [ShardedBoard(ring_capacity=65536, transport_address='127.0.0.1',
+                           ip_port=port, restart_on_shutdown=False,
+                           shutdown_on_exception=False)
+              for port in ports]
+    for shard in shards:
+        shard.set_pin_mode_analog_input(PIN, callback=count_report)
+    time.sleep(.5)
+    start_count = counts[0]
+    start_dropped = sum(shard.dropped_reports() for shard in shards)
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        if not sum(shard.process_reports() for shard in shards):
+            time.sleep(.001)
+    delivered = counts[0] - start_count
+    dropped = sum(shard.dropped_reports() for shard in shards) - start_dropped
+    for shard in shards:
+        shard.shutdown()
+    return delivered / duration, dropped / duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds to measure each configuration')
+    parser.add_argument('--boards', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='board counts to measure')
+    args = parser.parse_args()
+
+    print(f'cores: {os.cpu_count()}')
+    print(f'{"boards":>6} {"mode":>10} {"reports/s":>12} {"dropped/s":>12}')
+    for count in args.boards:
+        for mode, run in (('in process', run_in_process), ('sharded', run_sharded)):
+            processes, ports = start_boards(count)
+            rate, dropped = run(ports, args.duration)
+            for process in processes:
+                process.terminate()
+                process.join()
+            print(f'{count:6d} {mode:>10} {rate:12.0f} {dropped:12.0f}')
+
+
+if __name__ == '__main__':
+    main()
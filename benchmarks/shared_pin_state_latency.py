@@ -0,0 +1,123 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+ Measure the read latency of a SharedPinStateTable from another process
+ while the owning process updates it at a fixed rate.
+
+ Usage: python benchmarks/shared_pin_state_latency.py [--rate 10000]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.shared_pin_state import SharedPinStateTable
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {label: samples[int(fraction * (len(samples) - 1))] * 1e6
+            for label, fraction in (('p50', .5), ('p99', .99), ('max', 1.0))}
+
+
+def reader(name, duration):
+    """
+    Time get() and snapshot() calls until duration seconds have passed.
+    """
+    table = SharedPinStateTable(name, create=False)
+    get_times = []
+    snapshot_times = []
+    first = table.get('analog', 36)
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        table.get('analog', 36)
+        get_times.append(time.perf_counter() - start)
+        if len(get_times) % 100 == 0:
+            start = time.perf_counter()
+            table.snapshot()
+            snapshot_times.append(time.perf_counter() - start)
+    last = table.get('analog', 36)
+    table.close()
+
+    for label, times in (('get', get_times), ('snapshot', snapshot_times)):
+        stats = percentiles(times)
+        print(f'{label:>8}: {len(times):8d} reads  '
+              f'p50 {stats["p50"]:8.2f} us  p99 {stats["p99"]:8.2f} us  '
+              f'max {stats["max"]:8.2f} us')
+    if first and last:
+        print(f'   seen: {last[2] - first[2]} updates while reading')
+
+
+def writer(table, rate, running, counts):
+    """
+    Update pins at rate updates per second, spinning between updates.
+    """
+    interval = 1.0 / rate
+    next_time = time.perf_counter()
+    value = 0
+    while running.is_set():
+        now = time.perf_counter()
+        if now < next_time:
+            continue
+        next_time += interval
+        value = (value + 1) & 0xfff
+        table.update('analog', 36, value, time.time())
+        counts[0] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=int, default=10000,
+                        help='updates per second')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds to read for')
+    parser.add_argument('--reader', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.reader:
+        reader(args.reader, args.duration)
+        return
+
+    table = SharedPinStateTable()
+    running = threading.Event()
+    running.set()
+    counts = [0]
+    thread = threading.Thread(target=writer, args=(table, args.rate, running, counts),
+                              daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    try:
+        # the reader is an independent process, as an HMI or logger would be
+        subprocess.run([sys.executable, os.path.abspath(__file__),
+                        '--reader', table.name, '--duration', str(args.duration)],
+                       check=True)
+    finally:
+        running.clear()
+        thread.join()
+        elapsed = time.perf_counter() - start
+        table.close()
+    print(f' updates: {counts[0] / elapsed:8.0f} per second')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+ Measure the effect of each TransportOptions setting on command latency.
+
+ A simulated board echoes loop back commands and does not answer digital
+ writes. Each sample writes a digital write, then a loop back, and times
+ the loop back reply. With Nagle's algorithm enabled, the loop back frame
+ is held until the board acknowledges the digital write, which a delayed
+ acknowledgement can postpone by tens of milliseconds.
+
+ Usage: python benchmarks/transport_latency.py [--samples 200]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.packet_framer import PacketFramer
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.transport_options import TransportOptions
+
+SETTINGS = [('defaults', {}),
+            ('tcp_nodelay=False', {'tcp_nodelay': False}),
+            ('buffers=4096', {'receive_buffer_size': 4096,
+                              'send_buffer_size': 4096}),
+            ('keepalive=False', {'keepalive': False}),
+            ('read_timeout=.1', {'read_timeout': .1}),
+            ('write_timeout=1', {'write_timeout': 1.0})]
+
+
+def echo_board(listener):
+    """
+    Simulated board. Answers the firmware version request and echoes
+    loop back commands on each accepted connection.
+    """
+    while True:
+        try:
+            connection, _ = listener.accept()
+        except OSError:
+            return
+        threading.Thread(target=serve, args=(connection,), daemon=True).start()
+
+
+def serve(connection):
+    framer = PacketFramer()
+    while True:
+        try:
+            data = connection.recv(4096)
+        except OSError:
+            break
+        if not data:
+            break
+        for command in framer.feed(data):
+            if not command:
+                continue
+            if command[0] == PrivateConstants.GET_FIRMWARE_VERSION:
+                connection.sendall(bytes([4, PrivateConstants.FIRMWARE_REPORT,
+                                          2, 0, 0]))
+            elif command[0] == PrivateConstants.LOOP_COMMAND:
+                connection.sendall(bytes([2, PrivateConstants.LOOP_COMMAND,
+                                          command[1]]))
+    connection.close()
+
+
+def measure(port, options, samples):
+    """
+    :return: sorted loop back latencies in seconds
+    """
+    replied = threading.Event()
+
+    def loop_back_reply(data):
+        replied.set()
+
+    board = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=port,
+                            restart_on_shutdown=False,
+                            shutdown_on_exception=False, blocking_send=True,
+                            transport_options=TransportOptions(**options))
+    latencies = []
+    try:
+        for _ in range(samples):
+            replied.clear()
+            board.digital_write(2, 1)
+            start = time.perf_counter()
+            board.loop_back('A', callback=loop_back_reply)
+            replied.wait(2)
+            latencies.append(time.perf_counter() - start)
+            # let the board's delayed acknowledgement timer run out
+            time.sleep(.01)
+    finally:
+        board.shutdown()
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=200,
+                        help='loop back round trips for each setting')
+    args = parser.parse_args()
+
+    listener = socket.create_server(('127.0.0.1', 0))
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    threading.Thread(target=echo_board, args=(listener,), daemon=True).start()
+    port = listener.getsockname()[1]
+
+    print(f'{"setting":>20} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for name, options in SETTINGS:
+        latencies = measure(port, options, args.samples)
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(.99 * (len(latencies) - 1))] * 1000
+        print(f'{name:>20} {p50:8.3f} {p99:8.3f} {latencies[-1] * 1000:8.3f}')
+    listener.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -18,8 +18,12 @@
 from bleak import discover
 from bleak import BleakClient
 from bleak import BleakScanner
+from bleak.exc import BleakDBusError
 import asyncio
-import sys
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.ble_address_cache import BleAddressCache
 
 
 # noinspection PyStatementEffect,PyUnresolvedReferences,PyUnresolvedReferences
@@ -31,7 +35,8 @@ class BleAioTransport:
     """
 
     def __init__(self, ble_mac_address=None,
-                 loop=None, receive_callback=None):
+                 loop=None, receive_callback=None, address_cache=None,
+                 disconnect_callback=None):
         """
 
         :param ble_mac_address: User specified mac address. If not specified
@@ -42,6 +47,12 @@ class BleAioTransport:
         :param receive_callback: method to be called when data is received from
                                  the BLE connected server.
 
+        :param address_cache: BleAddressCache used to remember the discovered
+                              address. If None, addresses are not cached.
+
+        :param disconnect_callback: optional function called when the
+                                    connection to the server is lost.
+
         """
 
         # make sure the user specified a handler for incoming data
@@ -54,6 +65,10 @@ class BleAioTransport:
         # If set to None, then an attempt at autodiscovery will take place.
         self.ble_mac_address = ble_mac_address
 
+        self.address_cache = address_cache
+
+        self.disconnect_callback = disconnect_callback
+
         # loop management
         self.loop = loop
 
@@ -72,6 +87,18 @@ class BleAioTransport:
         # a variable to keep track if the transport is currently connected
         self.connected = False
 
+        # largest payload for a single GATT write. Updated from the
+        # negotiated MTU when connected. 20 is the payload of the default MTU.
+        self.max_write_size = 20
+
+        # True if the transmit characteristic supports write-without-response
+        self.write_without_response = False
+
+        # write statistics
+        self.gatt_writes = 0
+        self.bytes_written = 0
+        self.write_errors = 0
+
     async def notification_handler(self, sender, data):
         """
         Process incoming BLE data
@@ -87,36 +114,103 @@ class BleAioTransport:
         """
         This method will attempt a connection with the ble device if not already connected.
 
-        If a ble MAC address was provided it will use that address, and if not,
-        it will attempt to auto discover the device before connection
+        If a ble MAC address was provided it will use that address. If not,
+        the cached address of the last connection is tried first, and if that
+        fails, the device is discovered by scanning. The scan stops as soon
+        as the server is seen.
 
         """
         if self.connected:
             raise RuntimeError('ble_aio_transport: connect - Already connected')
 
-        # user did not specify a mac address, so we try to do auto-discovery of
-        # the server's mac address.
-        if not self.ble_mac_address:
-            print('Retrieving BLE Mac Address of Ble Device. Please wait...')
-            devices = await BleakScanner.discover()
-            for d in devices:
-                if d.name == 'Telemetrix4ESP32BLE':
-                    self.ble_mac_address = d.address
-
-        # now attempt to connect
-        print(f'Connecting to {self.ble_mac_address}. Please wait....')
-        self.client = BleakClient(self.ble_mac_address)
-        try:
-            await self.client.connect()
-        except bleak.exc.BleakDBusError:
-            raise KeyboardInterrupt
+        if self.ble_mac_address:
+            await self._connect_to(self.ble_mac_address)
+        else:
+            cached_address = None
+            if self.address_cache:
+                cached_address = self.address_cache.get(
+                    PrivateConstants.BLE_DEVICE_NAME)
+
+            if cached_address:
+                try:
+                    await self._connect_to(cached_address)
+                except Exception:
+                    print('Cached BLE address is not available.')
+                    self.address_cache.remove(PrivateConstants.BLE_DEVICE_NAME)
+                    cached_address = None
+
+            if not cached_address:
+                # user did not specify a mac address, so we try to do auto-discovery of
+                # the server's mac address.
+                print('Retrieving BLE Mac Address of Ble Device. Please wait...')
+                device = await BleakScanner.find_device_by_filter(
+                    self._is_server, timeout=PrivateConstants.BLE_SCAN_TIMEOUT)
+                if not device:
+                    raise RuntimeError('ble_aio_transport: Unable to find the server.')
+                await self._connect_to(device)
+
+            if self.address_cache:
+                self.address_cache.put(PrivateConstants.BLE_DEVICE_NAME,
+                                       self.client.address)
+
         self.connected = True
         print('Connection successful')
 
+        # size writes to the negotiated MTU, less the 3 byte ATT header
+        mtu_size = getattr(self.client, 'mtu_size', None)
+        if mtu_size:
+            self.max_write_size = max(mtu_size - 3, 20)
+
+        characteristic = self.client.services.get_characteristic(self.UART_TX_UUID)
+        if characteristic:
+            self.write_without_response = \
+                'write-without-response' in characteristic.properties
+
         # associate the notification handler with incoming data
         await self.client.start_notify(self.UART_RX_UUID, self.notification_handler)
         # self.loop.create_task(self.ble_read())
 
+    async def _connect_to(self, device):
+        """
+        Connect to a device.
+
+        :param device: address string or BLEDevice
+        """
+        address = getattr(device, 'address', device)
+        print(f'Connecting to {address}. Please wait....')
+        self.client = BleakClient(device, disconnected_callback=self._disconnected)
+        try:
+            await self.client.connect()
+        except BleakDBusError as e:
+            raise RuntimeError(f'ble_aio_transport: Unable to connect to {address}: '
+                               f'{e}')
+
+    def _disconnected(self, client):
+        """
+        Called by bleak when the connection is closed.
+
+        :param client: BleakClient
+        """
+        self.connected = False
+        if self.disconnect_callback:
+            self.disconnect_callback()
+
+    @staticmethod
+    def _is_server(device, advertisement_data):
+        """
+        Scanner filter that matches the Telemetrix BLE server by name,
+        or by the Nordic UART service if the device does not advertise a name.
+
+        :param device: BLEDevice
+
+        :param advertisement_data: AdvertisementData
+        """
+        name = advertisement_data.local_name or device.name
+        if name:
+            return name == PrivateConstants.BLE_DEVICE_NAME
+        return PrivateConstants.BLE_UART_SERVICE_UUID in \
+            advertisement_data.service_uuids
+
     async def disconnect(self):
         try:
             await self.client.disconnect()
@@ -132,15 +226,68 @@ class BleAioTransport:
     async def write(self, data):
 
         """
-        This method writes sends data to the BLE device
+        This method writes sends data to the BLE device.
+
+        The data is one or more length prefixed command frames. Whole frames
+        are packed into payloads of up to max_write_size bytes, and a frame is
+        only split if it is larger than a single payload. Each payload is
+        written with write-without-response if the characteristic allows it.
+        Each write is awaited before the next one is sent, so the link is
+        paced by the GATT stack rather than by fixed delays.
+
+        Write failures are counted and raised to the caller.
+
         :param data: data is in the form of a bytearray
 
         """
-        # noinspection PyBroadException
-        try:
-            await self.client.write_gatt_char(self.UART_TX_UUID, data)
-        except Exception:
-            pass
+        for payload in self._pack(data):
+            try:
+                await self.client.write_gatt_char(
+                    self.UART_TX_UUID, payload,
+                    response=not self.write_without_response)
+            except Exception:
+                self.write_errors += 1
+                raise
+            self.gatt_writes += 1
+            self.bytes_written += len(payload)
+
+    def _pack(self, data):
+        """
+        Split a block of frames into payloads without splitting frames
+        that fit into a single payload.
+
+        :param data: one or more length prefixed frames
 
-        if sys.platform.startswith('win32'):
-            await asyncio.sleep(.2)
+        :return: list of payloads
+        """
+        limit = self.max_write_size
+        if len(data) <= limit:
+            return [data]
+
+        payloads = []
+        start = 0
+        position = 0
+        end_of_data = len(data)
+        while position < end_of_data:
+            frame_end = min(position + 1 + data[position], end_of_data)
+            if frame_end - start > limit and position > start:
+                # this frame does not fit - close the current payload
+                payloads.append(data[start:position])
+                start = position
+            while frame_end - start > limit:
+                # a single frame larger than a payload must be split
+                payloads.append(data[start:start + limit])
+                start += limit
+            position = frame_end
+        if start < end_of_data:
+            payloads.append(data[start:end_of_data])
+        return payloads
+
+    def statistics(self):
+        """
+        :return: a dictionary with the number of GATT writes, bytes written
+                 and write errors
+        """
+        return {'gatt_writes': self.gatt_writes,
+                'bytes_written': self.bytes_written,
+                'write_errors': self.write_errors}
@@ -0,0 +1,228 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import time
+
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+
+
+class BoardFleet:
+    """
+    This class manages a group of ESP32 boards that share a single asyncio
+    event loop.
+
+    All boards are connected concurrently, so the time to bring up the fleet
+    is bounded by the slowest board rather than the sum of all boards.
+
+    Reports from every board can be routed onto a single dispatch bus.
+    Use bus_callback(board_id) as the callback when setting pin modes, and
+    subscribe() to receive every report from every board tagged with the
+    id of the board it came from.
+    """
+
+    def __init__(self, loop=None):
+        """
+
+        :param loop: optional user provided event loop
+        """
+        if loop is None:
+            self.loop = asyncio.get_event_loop()
+        else:
+            self.loop = loop
+
+        # board id -> TelemetrixAioEsp32 instance
+        self.boards = {}
+
+        # bus subscribers. Each is an async function called with
+        # (board_id, report)
+        self.subscribers = []
+
+        # board id -> seconds taken by start_aio
+        self.connect_times = {}
+
+        # board id -> exception raised while connecting
+        self.failed_boards = {}
+
+        # board id -> number of reports published on the bus
+        self.report_counts = {}
+
+        # seconds taken to start the whole fleet
+        self.fleet_connect_time = None
+
+        # time.monotonic() value when the fleet finished starting
+        self.start_time = None
+
+    def add_board(self, board_id, **kwargs):
+        """
+        Create a board and add it to the fleet. The board is not connected
+        until start() is called.
+
+        :param board_id: hashable id used to tag the board's reports
+
+        :param kwargs: TelemetrixAioEsp32 parameters, for example
+                       transport_address. autostart and loop are supplied
+                       by the fleet.
+
+        :return: the TelemetrixAioEsp32 instance
+        """
+        if board_id in self.boards:
+            raise RuntimeError(f'add_board: board id {board_id} is already in use')
+
+        kwargs['autostart'] = False
+        kwargs['loop'] = self.loop
+        board = TelemetrixAioEsp32(**kwargs)
+        self.boards[board_id] = board
+        self.report_counts[board_id] = 0
+        return board
+
+    async def start(self):
+        """
+        Connect to all boards concurrently.
+
+        A board that fails to connect is recorded in failed_boards
+        and does not stop the other boards from starting.
+
+        :return: list of ids of the boards that connected
+        """
+        start = time.monotonic()
+        await asyncio.gather(*[self._start_board(board_id, board)
+                               for board_id, board in self.boards.items()])
+        self.start_time = time.monotonic()
+        self.fleet_connect_time = self.start_time - start
+        return [board_id for board_id in self.boards
+                if board_id in self.connect_times]
+
+    async def _start_board(self, board_id, board):
+        """
+        Start a single board and record how long it took.
+
+        :param board_id: board id
+
+        :param board: TelemetrixAioEsp32 instance
+        """
+        start = time.monotonic()
+        try:
+            await board.start_aio()
+        except Exception as e:
+            # within a fleet, only this board is lost
+            self.failed_boards[board_id] = e
+            # stop its tasks, so nothing keeps running for a board
+            # that is not in use
+            await board.abort()
+            return
+        self.connect_times[board_id] = time.monotonic() - start
+
+    def get_board(self, board_id):
+        """
+        :param board_id: board id
+
+        :return: the TelemetrixAioEsp32 instance
+        """
+        return self.boards[board_id]
+
+    def subscribe(self, callback):
+        """
+        Receive every report published on the bus.
+
+        :param callback: async function called with (board_id, report).
+                         report is the data list normally passed to a
+                         pin callback.
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stop receiving reports from the bus.
+
+        :param callback: a previously subscribed function
+        """
+        self.subscribers.remove(callback)
+
+    def bus_callback(self, board_id):
+        """
+        Create a callback that publishes reports from a board on the bus.
+        Pass it as the callback parameter of any pin mode or request method.
+
+        :param board_id: board id
+
+        :return: async callback function
+        """
+        async def publish_report(report):
+            await self.publish(board_id, report)
+
+        return publish_report
+
+    async def publish(self, board_id, report):
+        """
+        Publish a report on the bus.
+
+        :param board_id: id of the board the report came from
+
+        :param report: report data
+        """
+        self.report_counts[board_id] += 1
+        for subscriber in self.subscribers:
+            await subscriber(board_id, report)
+
+    async def shutdown(self):
+        """
+        Shut down all connected boards concurrently.
+        """
+        await asyncio.gather(*[self.boards[board_id].shutdown()
+                               for board_id in self.connect_times],
+                             return_exceptions=True)
+
+    async def metrics(self):
+        """
+        Retrieve fleet wide metrics.
+
+        :return: dictionary with the following keys:
+
+                 boards - number of boards in the fleet
+
+                 connected - number of boards that connected
+
+                 failed - number of boards that failed to connect
+
+                 fleet_connect_time - seconds to start the whole fleet
+
+                 slowest_connect_time - longest single board start time
+
+                 reports - total reports published on the bus
+
+                 reports_per_second - bus report rate since the fleet started
+
+                 send_queue_depth - commands queued across all boards
+        """
+        total_reports = sum(self.report_counts.values())
+        if self.start_time:
+            elapsed = time.monotonic() - self.start_time
+            rate = total_reports / elapsed if elapsed else 0.0
+        else:
+            rate = 0.0
+
+        return {'boards': len(self.boards),
+                'connected': len(self.connect_times),
+                'failed': len(self.failed_boards),
+                'fleet_connect_time': self.fleet_connect_time,
+                'slowest_connect_time': max(self.connect_times.values(),
+                                            default=None),
+                'reports': total_reports,
+                'reports_per_second': rate,
+                'send_queue_depth': sum([await board.get_send_queue_depth()
+                                         for board in self.boards.values()])}
@@ -0,0 +1,114 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+
+import serial
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+
+# noinspection PyStatementEffect,PyUnresolvedReferences,PyUnresolvedReferences
+class SerialAioTransport:
+    """
+    This class encapsulates management of a USB serial connection that
+    communicates with a Telemetrix server resident on an ESP32 board.
+
+    pyserial is blocking, so opening the port, reads and writes are run in
+    the loop's default executor and never stall the event loop. Each read
+    returns everything that is waiting on the port.
+    """
+
+    def __init__(self, com_port, baud_rate=115200, loop=None):
+        """
+
+        :param com_port: serial port name, for example '/dev/ttyUSB0'
+
+        :param baud_rate: serial port baud rate
+
+        :param loop: asyncio loop
+        """
+        self.com_port = com_port
+        self.baud_rate = baud_rate
+        self.loop = loop
+
+        if not self.loop:
+            self.loop = asyncio.get_event_loop()
+
+        self.serial_port = None
+
+        # keeps concurrent writes from interleaving in the executor
+        self.write_lock = asyncio.Lock()
+
+    async def start(self):
+        """
+        This method opens the serial port and waits for the ESP32 to boot.
+
+        :return: None
+        """
+        try:
+            # the read timeout bounds how long an executor thread is held
+            self.serial_port = await self.loop.run_in_executor(
+                None, lambda: serial.Serial(self.com_port, self.baud_rate,
+                                            timeout=.1, write_timeout=1))
+        except serial.SerialException:
+            raise RuntimeError("Can't open serial port " + self.com_port)
+
+        # opening the port resets the ESP32 - wait for it to boot and
+        # discard its boot messages
+        await asyncio.sleep(PrivateConstants.SERIAL_BOOT_WAIT)
+        await self.loop.run_in_executor(None, self.serial_port.reset_input_buffer)
+        print(f'Successfully connected to: {self.com_port}')
+
+    async def write(self, data):
+        """
+        This method writes sends data to the serial device
+        :param data: bytes to write
+
+        :return: None
+        """
+        async with self.write_lock:
+            await self.loop.run_in_executor(None, self.serial_port.write, data)
+
+    async def read(self, num_bytes=1):
+        """
+        This method reads up to num_bytes of data from the serial device.
+
+        It waits for at least one byte and then returns everything
+        that is waiting, up to num_bytes.
+
+        :return: bytes read. Empty if nothing arrived within the port timeout.
+        """
+        return await self.loop.run_in_executor(None, self._read_available,
+                                               num_bytes)
+
+    def _read_available(self, num_bytes):
+        """
+        Blocking bulk read run in an executor thread.
+
+        :param num_bytes: maximum number of bytes to return
+        """
+        waiting = self.serial_port.in_waiting
+        return self.serial_port.read(min(max(waiting, 1), num_bytes))
+
+    async def close(self):
+        """
+        Close the serial port.
+        """
+        if self.serial_port:
+            self.serial_port.close()
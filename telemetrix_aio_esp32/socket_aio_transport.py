@@ -18,7 +18,8 @@
 
 
 import asyncio
-import sys
+
+from telemetrix_esp32_common.transport_options import TransportOptions
 
 
 # noinspection PyStatementEffect,PyUnresolvedReferences,PyUnresolvedReferences
@@ -27,10 +28,24 @@ class SocketAioTransport:
     This class encapsulates management of a tcp/ip connection that communicates
     with the Telemetrix4Esp32WiFi server resident on an ESP32 board.
     """
-    def __init__(self, ip_address, ip_port, loop):
+    def __init__(self, ip_address, ip_port, loop, transport_options=None):
+        """
+
+        :param ip_address: IP address of the ESP32
+
+        :param ip_port: IP port number
+
+        :param loop: asyncio loop
+
+        :param transport_options: TransportOptions instance.
+                                  If None, the defaults are used.
+        """
         self.ip_address = ip_address
         self.ip_port = ip_port
         self.loop = loop
+        if transport_options is None:
+            transport_options = TransportOptions()
+        self.transport_options = transport_options
         self.reader = None
         self.writer = None
 
@@ -41,12 +56,14 @@ class SocketAioTransport:
         :return: None
         """
         try:
-            self.reader, self.writer = await asyncio.open_connection(
-                self.ip_address, self.ip_port)
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.ip_address, self.ip_port),
+                self.transport_options.connect_timeout)
             print(f'Successfully connected to: {self.ip_address}:{self.ip_port}')
-        except OSError:
-            print("Can't open connection to " + self.ip_address)
-            sys.exit(0)
+        except (OSError, asyncio.TimeoutError):
+            raise RuntimeError("Can't open connection to " + self.ip_address)
+
+        self.transport_options.apply(self.writer.get_extra_info('socket'))
 
     async def write(self, data):
         """
@@ -67,13 +84,31 @@ class SocketAioTransport:
         # now convert the integer list to a bytearray
         to_wifi = bytearray(output_list)
         self.writer.write(to_wifi)
-        await self.writer.drain()
+        if self.transport_options.write_timeout is None:
+            await self.writer.drain()
+        else:
+            await asyncio.wait_for(self.writer.drain(),
+                                   self.transport_options.write_timeout)
 
     async def read(self, num_bytes=1):
         """
         This method reads num_bytes of data from IP device
 
+        If a read_timeout is set in the transport options and no data
+        arrives in time, asyncio.TimeoutError is raised.
+
         :return: Next byte
         """
-        buffer = await self.reader.read(num_bytes)
+        if self.transport_options.read_timeout is None:
+            buffer = await self.reader.read(num_bytes)
+        else:
+            buffer = await asyncio.wait_for(self.reader.read(num_bytes),
+                                            self.transport_options.read_timeout)
         return buffer
+
+    async def close(self):
+        """
+        Close the connection.
+        """
+        if self.writer:
+            self.writer.close()
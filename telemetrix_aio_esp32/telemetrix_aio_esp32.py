@@ -19,11 +19,33 @@ import asyncio
 import struct
 import sys
 import time
+from collections import deque
 from telemetrix_aio_esp32.socket_aio_transport import SocketAioTransport
 from telemetrix_aio_esp32.ble_aio_transport import BleAioTransport
+from telemetrix_aio_esp32.serial_aio_transport import SerialAioTransport
 
 # noinspection PyUnresolvedReferences
 from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.output_shaper import OutputShaper
+from telemetrix_esp32_common.transport_options import TransportOptions
+from telemetrix_esp32_common.packet_framer import PacketFramer
+from telemetrix_esp32_common.ble_address_cache import BleAddressCache
+from telemetrix_esp32_common.config_journal import ConfigJournal
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.report_subscriptions import ReportSubscriptions
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.pin_state import PinStateTable
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.shared_pin_state import SharedPinStateTable
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.signal_filters import FilterPipeline
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.window_stats import WindowStats
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.link_clock import LinkClock
+from telemetrix_esp32_common import report_decoders
+from telemetrix_esp32_common.reports import PinReport, DhtReport, I2cReport, \
+    SpiReport, OneWireReport, StepperReport, WindowReport
 
 
 class TelemetrixAioEsp32:
@@ -40,6 +62,15 @@ class TelemetrixAioEsp32:
                  ip_port=31336, autostart=True,
                  loop=None, shutdown_on_exception=True,
                  restart_on_shutdown=True,
+                 transport_options=None,
+                 com_port=None,
+                 auto_reconnect=False,
+                 connection_callback=None,
+                 stall_callback=None,
+                 report_objects=False,
+                 payload_format='list',
+                 pin_state_cache=False,
+                 shared_pin_state=None
                  ):
 
         """
@@ -65,7 +96,57 @@ class TelemetrixAioEsp32:
 
         :param restart_on_shutdown: restart the esp32 processor upon shutdown
 
-
+        :param transport_options: A TransportOptions instance with link
+                                  tuning parameters, such as WI-FI socket
+                                  options and the serial baud rate. If None,
+                                  the low latency defaults are used.
+
+        :param com_port: Serial port name, for example '/dev/ttyUSB0'.
+                         If specified, the USB serial transport is used and
+                         transport_is_wifi is ignored.
+
+        :param auto_reconnect: If True, a lost connection is reopened
+                               automatically, and the recorded pin mode and
+                               device configuration is replayed. The delays
+                               between attempts are set in transport_options.
+
+        :param connection_callback: optional async function called with False
+                                    when the connection is lost and with True
+                                    when it has been restored.
+
+        :param stall_callback: optional async function called with True when
+                               the link stalls and with False when replies
+                               resume. If auto_reconnect is set, a stalled
+                               link is also treated as lost and reopened.
+                               The heartbeat that detects stalls is set in
+                               transport_options.
+
+        :param report_objects: If True, callbacks receive report objects with
+                               named fields, defined in
+                               telemetrix_esp32_common.reports, instead of
+                               report lists.
+
+        :param payload_format: format of the data bytes in i2c, SPI and
+                               OneWire reports. 'list' delivers the data as
+                               individual integers in the report list.
+                               'bytes' or 'memoryview' deliver them as a
+                               single bytes or memoryview payload, suitable
+                               for struct.unpack_from or numpy.frombuffer.
+
+        :param pin_state_cache: If True, the latest value of every digital,
+                                analog, touch, sonar and DHT input is kept
+                                and can be polled with get_digital,
+                                get_analog, get_touch, get_sonar, get_dht
+                                and get_pin_snapshot. Input pins may then
+                                be set without a callback.
+
+        :param shared_pin_state: name of a shared memory segment to create.
+                                 If set, the pin state cache is enabled and
+                                 kept in the segment, so that other
+                                 processes can read it with
+                                 SharedPinStateTable(name, create=False).
+                                 Stepper positions are included. The
+                                 segment is removed by shutdown.
 
         """
 
@@ -80,9 +161,48 @@ class TelemetrixAioEsp32:
                                    "required for use of this program.")
 
         # save input parameters
+        if transport_options is None:
+            transport_options = TransportOptions()
+        self.transport_options = transport_options
 
         self.transport_is_wifi = transport_is_wifi
 
+        self.com_port = com_port
+
+        self.baud_rate = self.transport_options.baud_rate
+
+        self.transport_is_serial = com_port is not None
+
+        self.cache_ble_address = self.transport_options.cache_ble_address
+
+        self.auto_reconnect = auto_reconnect
+
+        self.reconnect_min_delay = self.transport_options.reconnect_min_delay
+
+        self.reconnect_max_delay = self.transport_options.reconnect_max_delay
+
+        self.connection_callback = connection_callback
+
+        self.heartbeat_interval = self.transport_options.heartbeat_interval
+
+        self.heartbeat_misses = self.transport_options.heartbeat_misses
+
+        self.stall_callback = stall_callback
+
+        self.report_objects = report_objects
+
+        if payload_format not in ['list', 'bytes', 'memoryview']:
+            raise RuntimeError(f'Unknown payload format: {payload_format}')
+        self.payload_format = payload_format
+
+        # latest input values, if enabled
+        if shared_pin_state:
+            self.pin_states = SharedPinStateTable(shared_pin_state)
+        elif pin_state_cache:
+            self.pin_states = PinStateTable()
+        else:
+            self.pin_states = None
+
         self.ip_port = ip_port
 
         self.autostart = autostart
@@ -106,6 +226,19 @@ class TelemetrixAioEsp32:
         # dictionaries to store the callbacks for each pin
         self.analog_callbacks = {}
 
+        # host side filters for analog inputs, keyed by pin
+        self.analog_filters = {}
+
+        # pins with filtered samples waiting to be delivered
+        self.filters_pending = set()
+
+        # per window statistics of aggregated analog, touch and sonar inputs
+        self.window_stats = WindowStats()
+
+        # task that completes windows no report arrived to complete.
+        # It is started by the first aggregated input.
+        self.window_task = None
+
         self.digital_callbacks = {}
 
         self.i2c_callback = None
@@ -127,6 +260,12 @@ class TelemetrixAioEsp32:
         # debug loopback callback method
         self.loop_back_callback = None
 
+        # (data byte, reply handler) for each loop back request waiting
+        # for its reply, in the order sent. The ESP32 answers them in
+        # order, so a reply belongs to the oldest request for its byte.
+        self.loop_back_pending = deque(
+            maxlen=PrivateConstants.MAX_LOOP_BACK_PENDING)
+
         # the trigger pin will be the key to retrieve
         # the callback for a specific HC-SR04
         self.sonar_callbacks = {}
@@ -139,17 +278,95 @@ class TelemetrixAioEsp32:
 
         self.touch_callbacks = {}
 
+        # pins with a registered callback, checked before a report is decoded
+        self.report_subscriptions = ReportSubscriptions()
+
         # flag to indicate we are in shutdown mode
         self.shutdown_flag = False
 
         self.report_buffer = []
 
+        # reassembles packets from the received byte stream and skips
+        # the reports nobody subscribed to
+        self.framer = PacketFramer(self.report_subscriptions)
+
         self.report_dispatch = {}
 
         self.the_task = None
 
         self.firmware_version = None
 
+        # rate limiter for servo_write and analog_write
+        self.output_shaper = OutputShaper()
+
+        # set when a write is held back by the output shaper
+        self.output_shaper_event = None
+
+        # task that sends held back writes. It is started by set_output_rate.
+        self.output_shaper_task = None
+
+        # queue of outgoing frames. Each entry is a list of
+        # [frame bytes, future completed when the frame is written]
+        self.send_queue = deque()
+
+        # priority lane for stop and emergency commands.
+        # It is always emptied before any frame on send_queue is written.
+        self.urgent_send_queue = deque()
+
+        # set when frames are added to a send queue
+        self.send_event = None
+
+        # task that writes queued frames to the transport
+        self.writer_task = None
+
+        # number of failed transport writes
+        self.send_errors = 0
+
+        # configuration commands to replay after a reconnect
+        self.config_journal = ConfigJournal()
+
+        # set while the link is open. The report dispatcher and
+        # writer task wait on it while a lost connection is reopened.
+        self.link_up = None
+
+        # task that reopens a lost connection
+        self.reconnect_task = None
+
+        # connection statistics
+        self.connection_drops = 0
+        self.reconnects = 0
+        self.last_recovery_time = None
+
+        # task that sends heartbeats and detects a stalled link.
+        # It is started by start_aio if heartbeat_interval is set.
+        self.heartbeat_task = None
+
+        # set while the link is stalled
+        self.link_stalled = None
+
+        # number of heartbeats sent since the last reply
+        self.heartbeats_outstanding = 0
+
+        # time.monotonic_ns() value when the last heartbeat was sent
+        self.heartbeat_sent_time = None
+
+        # converts receive stamps into report time stamps
+        self.link_clock = LinkClock()
+
+        # time.monotonic_ns() when the data being dispatched was received,
+        # and the time stamp given to its reports
+        self.receive_time_ns = time.monotonic_ns()
+        self.report_time = time.time()
+
+        # time.monotonic_ns() when the pending clock synchronization
+        # request was sent, and the event set by its reply
+        self.clock_sync_sent_time = None
+        self.clock_sync_event = None
+
+        # heartbeat statistics
+        self.stalls = 0
+        self.heartbeat_round_trip = None
+
         # To add a command to the report dispatch table, append here.
         self.report_dispatch.update(
             {PrivateConstants.LOOP_COMMAND: self._report_loop_data})
@@ -255,24 +472,26 @@ class TelemetrixAioEsp32:
         This method may be called directly, if the autostart
         parameter in __init__ is set to false.
 
-        This method instantiates the BLE transport interface
+        This method instantiates the WI-FI, BLE or serial transport interface
 
         Use this method if you wish to start TelemetrixAIO manually from
         an asyncio function.
          """
-
-        if self.transport_is_wifi:
+        if self.transport_is_wifi and not self.transport_is_serial:
             if not self.transport_address:
                 raise RuntimeError('A TCP/IP address must be specified when using '
                                    'WI-FI.')
 
-            self.transport = SocketAioTransport(self.transport_address, self.ip_port,
-                                                self.loop)
-            await self.transport.start()
-            self.the_task = self.loop.create_task(self._wifi_report_dispatcher())
-        else:
-            self.transport = BleAioTransport(receive_callback=self._ble_report_dispatcher)
-            await self.transport.connect()
+        await self._open_link()
+
+        self.link_up = asyncio.Event()
+        self.link_up.set()
+
+        if self.transport_is_serial or self.transport_is_wifi:
+            self.the_task = self.loop.create_task(self._stream_report_dispatcher())
+
+        self.send_event = asyncio.Event()
+        self.writer_task = self.loop.create_task(self._link_writer())
 
         await self._get_firmware_version()
 
@@ -281,7 +500,10 @@ class TelemetrixAioEsp32:
                 await self.shutdown()
             raise RuntimeError('Could not retrieve server firmware version')
 
-        if self.transport_is_wifi:
+        if self.transport_is_serial:
+            print(f'Telemetrix4Esp32Serial Firmware Version: {self.firmware_version[0]}'
+                  f'.{self.firmware_version[1]}.{self.firmware_version[2]}')
+        elif self.transport_is_wifi:
             print(f'Telemetrix4Esp32WIFI Firmware Version: {self.firmware_version[0]}'
                   f'.{self.firmware_version[1]}.{self.firmware_version[2]}')
         else:
@@ -292,6 +514,45 @@ class TelemetrixAioEsp32:
 
         await self._send_command(command)
 
+        self.link_stalled = asyncio.Event()
+        if self.heartbeat_interval:
+            self.heartbeat_task = self.loop.create_task(self._heartbeat())
+
+    async def _open_link(self):
+        """
+        This is a private method.
+        Create and open the serial, WI-FI or BLE transport.
+        """
+        if self.transport_is_serial:
+            self.transport = SerialAioTransport(self.com_port, self.baud_rate,
+                                                self.loop)
+            await self.transport.start()
+        elif self.transport_is_wifi:
+            self.transport = SocketAioTransport(self.transport_address, self.ip_port,
+                                                self.loop, self.transport_options)
+            await self.transport.start()
+        else:
+            address_cache = BleAddressCache() if self.cache_ble_address else None
+            self.transport = BleAioTransport(ble_mac_address=self.transport_address,
+                                             loop=self.loop,
+                                             receive_callback=self._ble_report_dispatcher,
+                                             address_cache=address_cache,
+                                             disconnect_callback=self._ble_disconnected)
+            await self.transport.connect()
+
+    async def _close_link(self):
+        """
+        This is a private method.
+        Close the transport. Errors are ignored.
+        """
+        try:
+            if self.transport_is_serial or self.transport_is_wifi:
+                await self.transport.close()
+            else:
+                await self.transport.disconnect()
+        except Exception:
+            pass
+
     async def get_event_loop(self):
         """
         Return the currently active asyncio event loop
@@ -324,7 +585,7 @@ class TelemetrixAioEsp32:
         value_msb = value >> 8
         value_lsb = value & 0xff
         command = [PrivateConstants.ANALOG_WRITE, channel, value_msb, value_lsb]
-        await self._send_command(command)
+        await self._send_shaped_command(channel, command)
 
     async def digital_write(self, pin, value):
         """
@@ -489,10 +750,9 @@ class TelemetrixAioEsp32:
             if self.shutdown_on_exception:
                 await self.shutdown()
             raise RuntimeError('loop_back: A callback function must be specified.')
-        command = [PrivateConstants.LOOP_COMMAND, ord(start_character)]
 
         self.loop_back_callback = callback
-        await self._send_command(command)
+        await self._send_loop_back(ord(start_character), callback)
 
     async def set_analog_scan_interval(self, interval):
         """
@@ -509,7 +769,46 @@ class TelemetrixAioEsp32:
                 await self.shutdown()
             raise RuntimeError('Analog interval must be between 0 and 255')
 
-    async def set_pin_mode_analog_input(self, pin_number, differential=0, callback=None):
+    async def set_analog_filter(self, pin_number, filters=None):
+        """
+        Filter the reports of an analog input on the host before they are
+        passed to its callback. Requires numpy.
+
+        Samples are filtered in batches, made of the reports received
+        together, so callbacks for a filtered pin may be delayed until
+        the batch is complete. Callback values are floats.
+        The pin state cache keeps the unfiltered values.
+
+        :param pin_number: GPIO pin number
+
+        :param filters: list of filter stages, applied in order.
+                        None removes the pin's filters.
+
+                        ('moving_average', window)
+                        ('median', window)
+                        ('ema', alpha)
+                        ('low_pass', cutoff frequency in Hz)
+
+        example: set_analog_filter(36, [('median', 5), ('ema', .2)])
+        """
+        pipeline = None
+        if filters:
+            try:
+                pipeline = FilterPipeline(filters)
+            except RuntimeError:
+                if self.shutdown_on_exception:
+                    await self.shutdown()
+                raise
+
+        if pin_number in self.analog_filters:
+            # deliver the samples queued for the current filters first
+            await self._run_analog_filter(pin_number)
+            del self.analog_filters[pin_number]
+        if pipeline:
+            self.analog_filters[pin_number] = pipeline
+
+    async def set_pin_mode_analog_input(self, pin_number, differential=0, callback=None,
+                                        aggregate=None):
         """
         Set a pin as an analog input.
 
@@ -532,15 +831,23 @@ class TelemetrixAioEsp32:
 
         The report_type for analog input pins = 2
 
+        :param aggregate: window length in seconds. If set, the callback
+                          is called once per window with the statistics of
+                          the window's reports instead of once per report:
+
+                          [report_type, pin_number, minimum, maximum, mean,
+                           count, first_time_stamp, last_time_stamp]
+
         """
 
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 await self.shutdown()
             raise RuntimeError(
                 'set_pin_mode_analog_input: A callback function must be specified.')
 
         if pin_number in self.valid_analog_in_pins:
+            await self._set_aggregation('analog', pin_number, aggregate)
             await self._set_pin_mode(pin_number, PrivateConstants.AT_ANALOG,
                                      differential, callback=callback)
         else:
@@ -581,6 +888,7 @@ class TelemetrixAioEsp32:
                         freq_array = bytearray(struct.pack("d", frequency))
                         for value in freq_array:
                             command.append(value)
+                        self._release_input(pin_number)
                         await self._send_command(command)
                     else:
                         if self.shutdown_on_exception:
@@ -700,7 +1008,7 @@ class TelemetrixAioEsp32:
                 await self.shutdown()
             raise RuntimeError('dac_disable: Invalid pin number')
 
-    async def set_pin_mode_digital_input(self, pin_number, callback):
+    async def set_pin_mode_digital_input(self, pin_number, callback=None):
         """
         Set a pin as a digital input.
 
@@ -727,7 +1035,7 @@ class TelemetrixAioEsp32:
                 await self.shutdown()
             raise RuntimeError('set_pin_mode_digital_input: Invalid GPIO pin number')
 
-    async def set_pin_mode_digital_input_pulldown(self, pin_number, callback):
+    async def set_pin_mode_digital_input_pulldown(self, pin_number, callback=None):
         """
         Set a pin as a digital input with pulldown enabled.
 
@@ -746,7 +1054,7 @@ class TelemetrixAioEsp32:
         The report_type for digital input pins = 2
 
         """
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 await self.shutdown()
             raise RuntimeError(
@@ -762,7 +1070,7 @@ class TelemetrixAioEsp32:
             raise RuntimeError(
                 'set_pin_mode_digital_input_pulldown: Invalid GPIO pin number')
 
-    async def set_pin_mode_digital_input_pullup(self, pin_number, callback):
+    async def set_pin_mode_digital_input_pullup(self, pin_number, callback=None):
         """
         Set a pin as a digital input with pullup enabled.
 
@@ -781,7 +1089,7 @@ class TelemetrixAioEsp32:
         The report_type for digital input pins = 2
 
         """
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 await self.shutdown()
             raise RuntimeError(
@@ -842,7 +1150,7 @@ class TelemetrixAioEsp32:
         command = [PrivateConstants.I2C_BEGIN]
         await self._send_command(command)
 
-    async def set_pin_mode_dht(self, pin_number, callback):
+    async def set_pin_mode_dht(self, pin_number, callback=None):
         """
 
         :param pin_number: connection pin.
@@ -879,7 +1187,7 @@ class TelemetrixAioEsp32:
 
         """
 
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 await self.shutdown()
             raise RuntimeError('set_pin_mode_dht: A Callback must be specified')
@@ -887,6 +1195,8 @@ class TelemetrixAioEsp32:
         if pin_number in self.valid_gpio_input_pins:
             if self.dht_count < PrivateConstants.MAX_DHTS - 1:
                 self.dht_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DHT_REPORT, pin_number)
                 self.dht_count += 1
 
                 command = [PrivateConstants.DHT_NEW, pin_number]
@@ -925,6 +1235,7 @@ class TelemetrixAioEsp32:
 
             command = [PrivateConstants.SERVO_ATTACH, pin_number,
                        minv[0], minv[1], maxv[0], maxv[1]]
+            self._release_input(pin_number)
             await self._send_command(command)
         else:
             if self.shutdown_on_exception:
@@ -932,7 +1243,7 @@ class TelemetrixAioEsp32:
             raise RuntimeError('set_pin_mode_servo: Invalid GPIO pin number')
 
     async def set_pin_mode_sonar(self, trigger_pin, echo_pin,
-                                 callback):
+                                 callback=None, aggregate=None):
         """
         Attach pins to a sonar device. Trigger and echo pins must not be the same value.
         Distance is reported in centimeters.
@@ -953,9 +1264,16 @@ class TelemetrixAioEsp32:
 
         report_type = 10
 
+        :param aggregate: window length in seconds. If set, the callback
+                          is called once per window with the statistics of
+                          the window's reports instead of once per report:
+
+                          [report_type, trigger_pin, minimum, maximum, mean,
+                           count, first_time_stamp, last_time_stamp]
+
         """
 
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 await self.shutdown()
             raise RuntimeError('set_pin_mode_sonar: A Callback must be specified')
@@ -963,7 +1281,10 @@ class TelemetrixAioEsp32:
         if trigger_pin in self.valid_gpio_input_pins:
             if echo_pin in self.valid_gpio_input_pins:
                 if self.sonar_count < PrivateConstants.MAX_SONARS - 1:
+                    await self._set_aggregation('sonar', trigger_pin, aggregate)
                     self.sonar_callbacks[trigger_pin] = callback
+                    self.report_subscriptions.subscribe(
+                        PrivateConstants.SONAR_DISTANCE, trigger_pin)
                     self.sonar_count += 1
 
                     command = [PrivateConstants.SONAR_NEW, trigger_pin, echo_pin]
@@ -1024,7 +1345,8 @@ class TelemetrixAioEsp32:
             self.cs_pins_enabled.append(pin)
         await self._send_command(command)
 
-    async def set_pin_mode_touch(self, pin_number, differential=0, callback=None):
+    async def set_pin_mode_touch(self, pin_number, differential=0, callback=None,
+                                 aggregate=None):
         """
         Set a pin to touch mode
 
@@ -1046,8 +1368,16 @@ class TelemetrixAioEsp32:
 
         The report_type for touch pins = 13
 
+        :param aggregate: window length in seconds. If set, the callback
+                          is called once per window with the statistics of
+                          the window's reports instead of once per report:
+
+                          [report_type, pin_number, minimum, maximum, mean,
+                           count, first_time_stamp, last_time_stamp]
+
         """
         if pin_number in self.valid_touch_pins:
+            await self._set_aggregation('touch', pin_number, aggregate)
             await self._set_pin_mode(pin_number, PrivateConstants.AT_TOUCH, differential,
                                      callback)
         else:
@@ -1055,6 +1385,22 @@ class TelemetrixAioEsp32:
                 await self.shutdown()
             raise RuntimeError('set_pin_mode_touch: Invalid GPIO pin number')
 
+    def _release_input(self, pin_number):
+        """
+        This is a private method.
+        Forget the input callbacks of a pin that is given a new mode and
+        unsubscribe from its reports, so that reports still in flight are
+        skipped before they are decoded.
+
+        :param pin_number: GPIO pin number
+        """
+        for callbacks, report_type in \
+                ((self.digital_callbacks, PrivateConstants.DIGITAL_REPORT),
+                 (self.analog_callbacks, PrivateConstants.ANALOG_REPORT),
+                 (self.touch_callbacks, PrivateConstants.TOUCH_REPORT)):
+            callbacks.pop(pin_number, None)
+            self.report_subscriptions.unsubscribe(report_type, pin_number)
+
     async def _set_pin_mode(self, pin_number, pin_state, differential, callback):
         """
         A private method to set the various pin modes.
@@ -1073,21 +1419,33 @@ class TelemetrixAioEsp32:
                          called when pin data value changes
 
         """
-        if not callback and pin_state != PrivateConstants.AT_OUTPUT:
+        if not callback and not self.pin_states and pin_state != PrivateConstants.AT_OUTPUT:
             if self.shutdown_on_exception:
                 await self.shutdown()
             raise RuntimeError('_set_pin_mode: A Callback must be specified')
         else:
+            # a previous input mode of the pin no longer reports
+            self._release_input(pin_number)
             if pin_state == PrivateConstants.AT_INPUT:
                 self.digital_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DIGITAL_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_INPUT_PULLUP:
                 self.digital_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DIGITAL_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_INPUT_PULL_DOWN:
                 self.digital_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DIGITAL_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_ANALOG:
                 self.analog_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.ANALOG_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_TOUCH:
                 self.touch_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.TOUCH_REPORT, pin_number)
 
         if pin_state == PrivateConstants.AT_INPUT:
             command = [PrivateConstants.SET_PIN_MODE, pin_number,
@@ -1621,7 +1979,7 @@ class TelemetrixAioEsp32:
             raise RuntimeError('stepper_stop: Invalid motor_id.')
 
         command = [PrivateConstants.STEPPER_STOP, motor_id]
-        await self._send_command(command)
+        await self._send_command(command, urgent=True)
 
     async def stepper_disable_outputs(self, motor_id):
         """
@@ -2181,7 +2539,63 @@ class TelemetrixAioEsp32:
 
         """
         command = [PrivateConstants.SERVO_WRITE, pin_number, angle]
-        await self._send_command(command)
+        await self._send_shaped_command(pin_number, command)
+
+    async def set_output_rate(self, max_rate, pin_number=None, output_type=None):
+        """
+        Limit the rate at which servo_write and analog_write commands are
+        sent to the ESP32.
+
+        While a pin is waiting for its next send slot, only the latest value
+        written to it is kept. Older values are discarded and counted as
+        collapsed writes.
+
+        :param max_rate: maximum number of writes per second.
+                         None or 0 removes the limit.
+
+        :param pin_number: pin (or pwm channel for analog_write) to limit.
+                           If None, the rate applies to every pin that does
+                           not have its own rate.
+
+        :param output_type: 'servo' if pin_number is a servo pin, 'analog'
+                            if it is a pwm channel. Required with pin_number,
+                            because servo pins and pwm channels are
+                            numbered separately.
+        """
+        command_ids = {'servo': (PrivateConstants.SERVO_WRITE,),
+                       'analog': (PrivateConstants.ANALOG_WRITE,)}
+        if pin_number is not None and output_type not in command_ids:
+            if self.shutdown_on_exception:
+                await self.shutdown()
+            raise RuntimeError('set_output_rate: output_type must be servo or '
+                               'analog when a pin_number is given')
+        try:
+            self.output_shaper.set_rate(max_rate, pin_number,
+                                        command_ids.get(output_type, ()))
+        except RuntimeError:
+            if self.shutdown_on_exception:
+                await self.shutdown()
+            raise
+
+        if not self.output_shaper_task or self.output_shaper_task.done():
+            self.output_shaper_event = asyncio.Event()
+            self.output_shaper_task = self.loop.create_task(
+                self._output_shaper_flusher())
+
+    async def get_output_shaper_statistics(self):
+        """
+        Retrieve the output shaper counters.
+
+        :return: dictionary with the following keys:
+
+                 collapsed_writes - writes replaced by a newer value before
+                                    being sent
+
+                 sent_writes - shaped writes sent to the ESP32
+
+                 pending_writes - writes currently waiting for a send slot
+        """
+        return self.output_shaper.statistics()
 
     async def shutdown(self):
         """
@@ -2190,16 +2604,61 @@ class TelemetrixAioEsp32:
 
         """
         self.shutdown_flag = True
+        if self.reconnect_task:
+            self.reconnect_task.cancel()
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        if self.link_up:
+            # release the writer task
+            self.link_up.set()
         # stop all reporting - both analog and digital
         command = [PrivateConstants.STOP_ALL_REPORTS]
-        await self._send_command(command)
+        await self._send_command(command, urgent=True)
         if self.restart_on_shutdown:
             # await self.ble_transport.disconnect()
             command = [PrivateConstants.RESET]
-            await self._send_command(command)
+            await self._send_command(command, urgent=True)
             await asyncio.sleep(.1)
         if self.the_task:
             self.the_task.cancel()
+        if self.output_shaper_task:
+            self.output_shaper_task.cancel()
+            # set_output_rate starts a new task
+            self.output_shaper_task = None
+        if self.window_task:
+            self.window_task.cancel()
+            self.window_task = None
+        if self.writer_task:
+            # release callers still waiting on queued frames
+            self._fail_send_queue(RuntimeError('The client has been shut down'))
+            self.writer_task.cancel()
+            # anything sent from now on is written directly
+            self.writer_task = None
+        if self.pin_states:
+            self.pin_states.close()
+
+    async def abort(self):
+        """
+        Stop all tasks and close the link without sending anything to
+        the ESP32. Use it in place of shutdown when the link can not be
+        used, for example after start_aio failed.
+        """
+        self.shutdown_flag = True
+        current_task = asyncio.current_task()
+        for task in (self.reconnect_task, self.heartbeat_task, self.the_task,
+                     self.output_shaper_task, self.window_task,
+                     self.writer_task):
+            if task and task is not current_task:
+                task.cancel()
+        self.output_shaper_task = None
+        self.window_task = None
+        # release callers still waiting on queued frames
+        self._fail_send_queue(RuntimeError('The client has been aborted'))
+        self.writer_task = None
+        if self.pin_states:
+            self.pin_states.close()
+        if self.transport:
+            await self._close_link()
 
     async def disable_all_reporting(self):
         """
@@ -2259,27 +2718,38 @@ class TelemetrixAioEsp32:
         """
         This is a private method called by the incoming data notifier
 
-        Using the report identifier, the report handler is fetched from report_dispatch.
+        A notification may hold part of a packet or several packets, so the
+        data is passed through the packet framer. Using the report identifier,
+        the report handler for each complete packet is fetched from
+        report_dispatch.
 
         :param sender: BLE sender ID
         :param data: data received over the ble link
 
         """
         self.the_sender = sender
-        report = data[1]
+        self._set_receive_time(time.monotonic_ns())
+        for packet in self.framer.feed(data):
+            if not packet:
+                continue
+            report = packet[0]
 
-        # noinspection PyArgumentList
-        await self.report_dispatch[report](data[2:])
+            # noinspection PyArgumentList
+            await self.report_dispatch[report](packet[1:])
+
+        if self.filters_pending:
+            await self._flush_analog_filters()
 
     # noinspection PyArgumentList
-    async def _wifi_report_dispatcher(self):
+    async def _stream_report_dispatcher(self):
         """
         This is a private method.
-        It continually accepts and interprets data coming from Telemetrix4Arduino,and then
-        dispatches the correct handler to process the data.
+        It continually accepts and interprets data coming from the WI-FI or
+        serial Telemetrix server, and then dispatches the correct handler to
+        process the data.
 
-        It first receives the length of the packet, and then reads in the rest of the
-        packet. A packet consists of a length, report identifier and then the report data.
+        Data is read in bulk and fed to the packet framer. A packet consists of
+        a length, report identifier and then the report data.
         Using the report identifier, the report handler is fetched from report_dispatch.
 
         :returns: This method never returns
@@ -2288,20 +2758,40 @@ class TelemetrixAioEsp32:
         while True:
             if self.shutdown_flag:
                 break
+            if not self.link_up.is_set():
+                # the connection is down - wait for it to be reopened
+                await self.link_up.wait()
+                continue
+            transport = self.transport
             try:
-                packet_length = ord(await self.transport.read())
-            except TypeError:
+                data = await transport.read(PrivateConstants.MAX_RECEIVE_SIZE)
+            except asyncio.TimeoutError:
+                continue
+            except (OSError, AttributeError):
+                # the serial device was unplugged or the socket failed.
+                # Ignore errors from a transport that was already replaced.
+                if transport is self.transport:
+                    await self._link_lost()
+                continue
+            if not data:
+                if not self.transport_is_serial and transport is self.transport:
+                    # an empty read means the server closed the connection
+                    await self._link_lost()
                 continue
-            # get the rest of the packet
-            packet = list(await self.transport.read(packet_length))
 
-            report = packet[0]
-            # print(report)
-            # handle all other messages by looking them up in the
-            # command dictionary
+            self._set_receive_time(time.monotonic_ns())
+            for packet in self.framer.feed(data):
+                if not packet:
+                    continue
+                report = packet[0]
+                # handle all other messages by looking them up in the
+                # command dictionary
 
-            # print(f'packet: {packet[1:]}')
-            await self.report_dispatch[report](packet[1:])
+                # print(f'packet: {packet[1:]}')
+                await self.report_dispatch[report](packet[1:])
+
+            if self.filters_pending:
+                await self._flush_analog_filters()
 
     '''
     Report message handlers
@@ -2313,8 +2803,9 @@ class TelemetrixAioEsp32:
 
         :param data: byte of loop back data
         """
-        if self.loop_back_callback:
-            await self.loop_back_callback(data)
+        handler = self._loop_back_handler(data)
+        if handler:
+            await handler(list(data))
 
     # noinspection PyMethodMayBeStatic
     async def _report_debug_data(self, data):
@@ -2324,8 +2815,8 @@ class TelemetrixAioEsp32:
         :param data: data[0] is a byte followed by 2
                      bytes that comprise an integer
         """
-        value = (data[1] << 8) + data[2]
-        print(f'DEBUG ID: {data[0]} Value: {value}')
+        debug_id, value = report_decoders.DEBUG_VALUE.unpack_from(data)
+        print(f'DEBUG ID: {debug_id} Value: {value}')
 
     async def _analog_message(self, data):
         """
@@ -2335,16 +2826,168 @@ class TelemetrixAioEsp32:
         :param data: message data
 
         """
-        data = list(data)
-        pin = data[0]
-        value = (data[1] << 8) + data[2]
+        pin, value = report_decoders.PIN_VALUE.unpack_from(data)
+
+        time_stamp = self.report_time
 
-        time_stamp = time.time()
+        if self.pin_states:
+            self.pin_states.update('analog', pin, value, time_stamp)
+
+        pipeline = self.analog_filters.get(pin)
+        if pipeline:
+            # the sample is delivered when its batch is filtered
+            self.filters_pending.add(pin)
+            if pipeline.add(value, time_stamp):
+                await self._run_analog_filter(pin)
+            return
+
+        await self._deliver_analog(pin, value, time_stamp)
+
+    async def _deliver_analog(self, pin, value, time_stamp):
+        """
+        This is a private method.
+        Pass an analog value to the pin's callback.
+
+        :param pin: GPIO pin number
+
+        :param value: analog value
+
+        :param time_stamp: time the value was received
+        """
+        if self.window_stats.active('analog', pin):
+            await self._aggregate('analog', PrivateConstants.AT_ANALOG, pin, value,
+                                  time_stamp, self.analog_callbacks.get(pin))
+            return
 
         # append pin number, pin value, and pin type to return value and return as a list
-        message = [PrivateConstants.AT_ANALOG, pin, value, time_stamp]
+        if self.report_objects:
+            message = PinReport(PrivateConstants.AT_ANALOG, pin, value, time_stamp)
+        else:
+            message = [PrivateConstants.AT_ANALOG, pin, value, time_stamp]
+
+        callback = self.analog_callbacks.get(pin)
+        if callback:
+            await callback(message)
+
+    async def _run_analog_filter(self, pin):
+        """
+        This is a private method.
+        Filter the samples waiting for a pin and deliver them.
+
+        :param pin: GPIO pin number
+        """
+        self.filters_pending.discard(pin)
+        pipeline = self.analog_filters.get(pin)
+        if not pipeline:
+            return
+        values, time_stamps = pipeline.run()
+        for value, time_stamp in zip(values, time_stamps):
+            await self._deliver_analog(pin, value, time_stamp)
+
+    async def _flush_analog_filters(self):
+        """
+        This is a private method.
+        Filter and deliver the samples of all pins with waiting samples.
+        It is called when no more received reports are waiting.
+        """
+        for pin in list(self.filters_pending):
+            await self._run_analog_filter(pin)
+
+    async def _set_aggregation(self, kind, pin_number, aggregate):
+        """
+        This is a private method.
+        Enable or disable window aggregation for an input.
+
+        :param kind: 'analog', 'touch' or 'sonar'
+
+        :param pin_number: GPIO pin number. For sonar, the trigger pin.
+
+        :param aggregate: window length in seconds or None
+        """
+        try:
+            self.window_stats.configure(kind, pin_number, aggregate)
+        except RuntimeError:
+            if self.shutdown_on_exception:
+                await self.shutdown()
+            raise
 
-        await self.analog_callbacks[pin](message)
+        if aggregate and (not self.window_task or self.window_task.done()):
+            self.window_task = self.loop.create_task(self._window_expirer())
+
+    async def _window_expirer(self):
+        """
+        This is a private method.
+        It reports aggregation windows that ended without a later report.
+        """
+        while not self.shutdown_flag:
+            wait_time = await self._expire_windows()
+            if wait_time is None or wait_time > .5:
+                wait_time = .5
+            await asyncio.sleep(wait_time)
+
+    async def _aggregate(self, kind, report_type, pin, value, time_stamp, callback):
+        """
+        This is a private method.
+        Add a value to the pin's window and report the window
+        statistics when the window is complete.
+
+        :param kind: 'analog', 'touch' or 'sonar'
+
+        :param report_type: report type passed to the callback
+
+        :param pin: GPIO pin number. For sonar, the trigger pin.
+
+        :param value: reported value
+
+        :param time_stamp: time the value was received
+
+        :param callback: the pin's callback
+        """
+        window = self.window_stats.add(kind, pin, value, time_stamp)
+        if window and callback:
+            await self._report_window(report_type, pin, window, callback)
+
+    async def _report_window(self, report_type, pin, window, callback):
+        """
+        This is a private method.
+        Pass the statistics of a completed window to the pin's callback.
+
+        :param report_type: report type passed to the callback
+
+        :param pin: GPIO pin number. For sonar, the trigger pin.
+
+        :param window: (minimum, maximum, mean, count, start time, end time)
+
+        :param callback: the pin's callback
+        """
+        minimum, maximum, mean, count, start, end = window
+        if self.report_objects:
+            message = WindowReport(report_type, pin, minimum, maximum, mean, count,
+                                   start, end)
+        else:
+            message = [report_type, pin, minimum, maximum, mean, count, start, end]
+        await callback(message)
+
+    async def _expire_windows(self):
+        """
+        This is a private method.
+        Report the windows that ended without a later sample to complete them.
+
+        :return: seconds until the next check is needed, or None if no
+                 input is aggregated
+        """
+        now = self.link_clock.time_stamp(time.monotonic_ns())
+        windows = self.window_stats.expire(now)
+        if windows:
+            reports = {'analog': (PrivateConstants.AT_ANALOG, self.analog_callbacks),
+                       'touch': (PrivateConstants.TOUCH_REPORT, self.touch_callbacks),
+                       'sonar': (PrivateConstants.SONAR_DISTANCE, self.sonar_callbacks)}
+            for kind, pin, window in windows:
+                report_type, callbacks = reports[kind]
+                callback = callbacks.get(pin)
+                if callback:
+                    await self._report_window(report_type, pin, window, callback)
+        return self.window_stats.wait_time(now)
 
     async def _dht_report(self, data):
         """
@@ -2374,19 +3017,30 @@ class TelemetrixAioEsp32:
         if data[0]:
             # error report
             # data[0] = report sub type, data[1] = pin, data[2] = error message
-            if self.dht_callbacks[data[1]]:
-                message = [PrivateConstants.DHT_REPORT, data[0], data[1], data[2],
-                           time.time()]
+            if self.dht_callbacks.get(data[1]):
+                if self.report_objects:
+                    message = DhtReport(PrivateConstants.DHT_REPORT, data[0], data[1],
+                                        None, None, data[2], self.report_time)
+                else:
+                    message = [PrivateConstants.DHT_REPORT, data[0], data[1], data[2],
+                               self.report_time]
                 await self.dht_callbacks[data[1]](message)
         else:
             # got valid data
-            f_humidity = bytearray(data[2:6])
-            f_temperature = bytearray(data[6:])
-            message = [PrivateConstants.DHT_REPORT, data[0], data[1],
-                       (struct.unpack('<f', f_humidity))[0],
-                       (struct.unpack('<f', f_temperature))[0],
-                       time.time()]
-            await self.dht_callbacks[data[1]](message)
+            subtype, pin, humidity, temperature = \
+                report_decoders.DHT_DATA.unpack_from(data)
+            time_stamp = self.report_time
+            if self.pin_states:
+                self.pin_states.update_dht(pin, humidity, temperature, time_stamp)
+            if self.report_objects:
+                message = DhtReport(PrivateConstants.DHT_REPORT, subtype, pin,
+                                    humidity, temperature, None, time_stamp)
+            else:
+                message = [PrivateConstants.DHT_REPORT, subtype, pin,
+                           humidity, temperature, time_stamp]
+            callback = self.dht_callbacks.get(pin)
+            if callback:
+                await callback(message)
 
     async def _digital_message(self, data):
         """
@@ -2399,9 +3053,15 @@ class TelemetrixAioEsp32:
         pin = data[0]
         value = data[1]
 
-        time_stamp = time.time()
-        if self.digital_callbacks[pin]:
-            message = [PrivateConstants.DIGITAL_REPORT, pin, value, time_stamp]
+        time_stamp = self.report_time
+        if self.pin_states:
+            self.pin_states.update('digital', pin, value, time_stamp)
+        if self.digital_callbacks.get(pin):
+            if self.report_objects:
+                message = PinReport(PrivateConstants.DIGITAL_REPORT, pin, value,
+                                    time_stamp)
+            else:
+                message = [PrivateConstants.DIGITAL_REPORT, pin, value, time_stamp]
             await self.digital_callbacks[pin](message)
 
     async def _servo_unavailable(self, report):
@@ -2432,10 +3092,18 @@ class TelemetrixAioEsp32:
         # data[3] = register
         # data[4] ... all the data bytes
 
-        data = list(data)
+        payload = self._payload(data, 3)
 
-        cb_list = [PrivateConstants.I2C_READ_REPORT, data[0], data[1]] + data[2:]
-        cb_list.append(time.time())
+        if self.report_objects:
+            cb_list = I2cReport(PrivateConstants.I2C_READ_REPORT, data[0], data[1],
+                                data[2], payload, self.report_time)
+        elif self.payload_format == 'list':
+            cb_list = [PrivateConstants.I2C_READ_REPORT, data[0], data[1],
+                       data[2]] + payload
+            cb_list.append(self.report_time)
+        else:
+            cb_list = [PrivateConstants.I2C_READ_REPORT, data[0], data[1],
+                       data[2], payload, self.report_time]
 
         await self.i2c_callback(cb_list)
 
@@ -2469,12 +3137,31 @@ class TelemetrixAioEsp32:
         callback report format: [PrivateConstants.SONAR_DISTANCE, trigger_pin, distance_value, time_stamp]
         """
 
+        trigger_pin, distance = report_decoders.PIN_VALUE.unpack_from(report)
+
+        time_stamp = self.report_time
+
+        if self.pin_states:
+            self.pin_states.update('sonar', trigger_pin, distance, time_stamp)
+
+        if self.window_stats.active('sonar', trigger_pin):
+            await self._aggregate('sonar', PrivateConstants.SONAR_DISTANCE, trigger_pin,
+                                  distance, time_stamp,
+                                  self.sonar_callbacks.get(trigger_pin))
+            return
+
         # get callback from pin number
-        cb = self.sonar_callbacks[report[0]]
+        cb = self.sonar_callbacks.get(trigger_pin)
+        if not cb:
+            return
 
         # build report data
-        cb_list = [PrivateConstants.SONAR_DISTANCE, report[0],
-                   ((report[1] << 8) + report[2]), time.time()]
+        if self.report_objects:
+            cb_list = PinReport(PrivateConstants.SONAR_DISTANCE, trigger_pin,
+                                distance, time_stamp)
+        else:
+            cb_list = [PrivateConstants.SONAR_DISTANCE, trigger_pin,
+                       distance, time_stamp]
 
         await cb(cb_list)
 
@@ -2486,30 +3173,76 @@ class TelemetrixAioEsp32:
         :param report: message data
 
         """
-        pin = report[0]
-        value = (report[1] << 8) + report[2]
+        pin, value = report_decoders.PIN_VALUE.unpack_from(report)
         # set the current value in the pin structure
-        time_stamp = time.time()
-        if self.touch_callbacks[pin]:
-            message = [PrivateConstants.TOUCH_REPORT, pin, value, time_stamp]
+        time_stamp = self.report_time
+        if self.pin_states:
+            self.pin_states.update('touch', pin, value, time_stamp)
+        if self.window_stats.active('touch', pin):
+            await self._aggregate('touch', PrivateConstants.TOUCH_REPORT, pin, value,
+                                  time_stamp, self.touch_callbacks.get(pin))
+            return
+        if self.touch_callbacks.get(pin):
+            if self.report_objects:
+                message = PinReport(PrivateConstants.TOUCH_REPORT, pin, value,
+                                    time_stamp)
+            else:
+                message = [PrivateConstants.TOUCH_REPORT, pin, value, time_stamp]
             await self.touch_callbacks[pin](message)
 
     async def _spi_report(self, report):
 
-        report = list(report)
-
-        cb_list = [PrivateConstants.SPI_REPORT, report[0]] + report[1:]
-
-        cb_list.append(time.time())
+        # report[0] = register
+        # report[1] = number of bytes read
+        # report[2] ... all the data bytes
+        payload = self._payload(report, 2)
+
+        if self.report_objects:
+            cb_list = SpiReport(PrivateConstants.SPI_REPORT, report[0], report[1],
+                                payload, self.report_time)
+        elif self.payload_format == 'list':
+            cb_list = [PrivateConstants.SPI_REPORT, report[0], report[1]] + payload
+            cb_list.append(self.report_time)
+        else:
+            cb_list = [PrivateConstants.SPI_REPORT, report[0], report[1], payload,
+                       self.report_time]
 
         await self.spi_callback(cb_list)
 
     async def _onewire_report(self, report):
-        report = list(report)
-        cb_list = [PrivateConstants.ONE_WIRE_REPORT, report[0]] + report[1:]
-        cb_list.append(time.time())
+        # report[0] = OneWire subtype
+        # report[1] ... all the data bytes
+        payload = self._payload(report, 1)
+
+        if self.report_objects:
+            cb_list = OneWireReport(PrivateConstants.ONE_WIRE_REPORT, report[0],
+                                    payload, self.report_time)
+        elif self.payload_format == 'list':
+            cb_list = [PrivateConstants.ONE_WIRE_REPORT, report[0]] + payload
+            cb_list.append(self.report_time)
+        else:
+            cb_list = [PrivateConstants.ONE_WIRE_REPORT, report[0], payload,
+                       self.report_time]
+
         await self.onewire_callback(cb_list)
 
+    def _payload(self, data, offset):
+        """
+        Extract the data bytes of an i2c, SPI or OneWire report in the
+        configured payload format.
+
+        :param data: report data bytes
+
+        :param offset: index of the first data byte
+
+        :return: list of integers, bytes or memoryview
+        """
+        if self.payload_format == 'memoryview':
+            return memoryview(data)[offset:]
+        if self.payload_format == 'bytes':
+            return bytes(data[offset:])
+        return list(data[offset:])
+
     async def _firmware_report(self, report):
         self.firmware_version = report
 
@@ -2524,17 +3257,23 @@ class TelemetrixAioEsp32:
                                  steps, time_stamp]
         """
 
-        # get callback
-        cb = self.stepper_info_list[report[0]]['distance_to_go_callback']
+        motor_id, num_steps = report_decoders.STEPPER_VALUE.unpack_from(report)
 
-        # isolate the steps bytes and covert list to bytes
-        steps = bytes(report[1:])
+        time_stamp = self.report_time
 
-        # get value from steps
-        num_steps = int.from_bytes(steps, byteorder='big', signed=True)
+        if self.pin_states:
+            self.pin_states.update('stepper_distance_to_go', motor_id,
+                                   num_steps, time_stamp)
 
-        cb_list = [PrivateConstants.STEPPER_DISTANCE_TO_GO, report[0], num_steps,
-                   time.time()]
+        # get callback
+        cb = self.stepper_info_list[motor_id]['distance_to_go_callback']
+
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_DISTANCE_TO_GO, motor_id,
+                                    num_steps, time_stamp)
+        else:
+            cb_list = [PrivateConstants.STEPPER_DISTANCE_TO_GO, motor_id, num_steps,
+                       time_stamp]
 
         await cb(cb_list)
 
@@ -2551,17 +3290,23 @@ class TelemetrixAioEsp32:
                                  target_position, time_stamp]
         """
 
-        # get callback
-        cb = self.stepper_info_list[report[0]]['target_position_callback']
+        motor_id, target_position = report_decoders.STEPPER_VALUE.unpack_from(report)
 
-        # isolate the steps bytes and covert list to bytes
-        target = bytes(report[1:])
+        time_stamp = self.report_time
 
-        # get value from steps
-        target_position = int.from_bytes(target, byteorder='big', signed=True)
+        if self.pin_states:
+            self.pin_states.update('stepper_target_position', motor_id,
+                                   target_position, time_stamp)
 
-        cb_list = [PrivateConstants.STEPPER_TARGET_POSITION, report[0], target_position,
-                   time.time()]
+        # get callback
+        cb = self.stepper_info_list[motor_id]['target_position_callback']
+
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_TARGET_POSITION, motor_id,
+                                    target_position, time_stamp)
+        else:
+            cb_list = [PrivateConstants.STEPPER_TARGET_POSITION, motor_id, target_position,
+                       time_stamp]
 
         await cb(cb_list)
 
@@ -2578,17 +3323,23 @@ class TelemetrixAioEsp32:
                                  current_position, time_stamp]
         """
 
-        # get callback
-        cb = self.stepper_info_list[report[0]]['current_position_callback']
+        motor_id, current_position = report_decoders.STEPPER_VALUE.unpack_from(report)
 
-        # isolate the steps bytes and covert list to bytes
-        position = bytes(report[1:])
+        time_stamp = self.report_time
 
-        # get value from steps
-        current_position = int.from_bytes(position, byteorder='big', signed=True)
+        if self.pin_states:
+            self.pin_states.update('stepper_current_position', motor_id,
+                                   current_position, time_stamp)
 
-        cb_list = [PrivateConstants.STEPPER_CURRENT_POSITION, report[0], current_position,
-                   time.time()]
+        # get callback
+        cb = self.stepper_info_list[motor_id]['current_position_callback']
+
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_CURRENT_POSITION, motor_id,
+                                    current_position, time_stamp)
+        else:
+            cb_list = [PrivateConstants.STEPPER_CURRENT_POSITION, motor_id, current_position,
+                       time_stamp]
 
         await cb(cb_list)
 
@@ -2596,7 +3347,8 @@ class TelemetrixAioEsp32:
         """
         Report if the motor is currently running
 
-        :param report: data[0] = motor_id, True if motor is running or False if it is not.
+        :param report: data[0] = motor_id, data[1] = True if motor is running or
+                       False if it is not.
 
         callback report format: [18, motor_id,
                                  running_state, time_stamp]
@@ -2605,7 +3357,12 @@ class TelemetrixAioEsp32:
         # get callback
         cb = self.stepper_info_list[report[0]]['is_running_callback']
 
-        cb_list = [PrivateConstants.STEPPER_RUNNING_REPORT, report[0], time.time()]
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_RUNNING_REPORT, report[0],
+                                    report[1], self.report_time)
+        else:
+            cb_list = [PrivateConstants.STEPPER_RUNNING_REPORT, report[0], report[1],
+                       self.report_time]
 
         await cb(cb_list)
 
@@ -2622,22 +3379,607 @@ class TelemetrixAioEsp32:
         # get callback
         cb = self.stepper_info_list[report[0]]['motion_complete_callback']
 
-        cb_list = [PrivateConstants.STEPPER_RUN_COMPLETE_REPORT, report[0],
-                   time.time()]
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_RUN_COMPLETE_REPORT,
+                                    report[0], None, self.report_time)
+        else:
+            cb_list = [PrivateConstants.STEPPER_RUN_COMPLETE_REPORT, report[0],
+                       self.report_time]
 
         await cb(cb_list)
 
-    async def _send_command(self, command):
+    async def _send_shaped_command(self, pin_number, command):
+        """
+        This is a private utility method.
+        Send a command through the output shaper.
+
+        :param pin_number: pin the command controls
+
+        :param command:  command data in the form of a list
+        """
+        command = self.output_shaper.submit((command[0], pin_number), command,
+                                            time.monotonic())
+        if command:
+            await self._send_command(command)
+        else:
+            # the write is held back - make sure the flusher knows about it
+            self.output_shaper_event.set()
+
+    async def _output_shaper_flusher(self):
+        """
+        This is a private method.
+        It sends the writes held back by the output shaper when their
+        send slot arrives.
+        """
+        while not self.shutdown_flag:
+            self.output_shaper_event.clear()
+            for command in self.output_shaper.due(time.monotonic()):
+                await self._send_command(command)
+
+            deadline = self.output_shaper.next_deadline()
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(self.output_shaper_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def send(self, command, urgent=False):
+        """
+        Send a raw command to the ESP32.
+
+        :param command: command data in the form of a list.
+                        The first element is the command id.
+
+        :param urgent: If True, the command is written ahead of all
+                       queued normal priority commands.
+        """
+        await self._send_command(list(command), urgent)
+
+    async def get_digital(self, pin_number):
+        """
+        Retrieve the latest value of a digital input.
+        Requires pin_state_cache=True.
+
+        :param pin_number: GPIO pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        table = await self._pin_state_table('get_digital')
+        return table.get('digital', pin_number)
+
+    async def get_analog(self, pin_number):
+        """
+        Retrieve the latest value of an analog input.
+        Requires pin_state_cache=True.
+
+        :param pin_number: GPIO pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        table = await self._pin_state_table('get_analog')
+        return table.get('analog', pin_number)
+
+    async def get_touch(self, pin_number):
+        """
+        Retrieve the latest value of a touch pin.
+        Requires pin_state_cache=True.
+
+        :param pin_number: GPIO pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        table = await self._pin_state_table('get_touch')
+        return table.get('touch', pin_number)
+
+    async def get_sonar(self, trigger_pin):
+        """
+        Retrieve the latest sonar distance.
+        Requires pin_state_cache=True.
+
+        :param trigger_pin: sonar trigger pin
+
+        :return: (distance, time stamp, sequence number) or None if the
+                 sonar has not reported
+        """
+        table = await self._pin_state_table('get_sonar')
+        return table.get('sonar', trigger_pin)
+
+    async def get_dht(self, pin_number):
+        """
+        Retrieve the latest DHT reading.
+        Requires pin_state_cache=True.
+
+        :param pin_number: DHT pin number
+
+        :return: (humidity, temperature, time stamp, sequence number)
+                 or None if the DHT has not reported
+        """
+        table = await self._pin_state_table('get_dht')
+        return table.get_dht(pin_number)
+
+    async def get_pin_snapshot(self):
+        """
+        Copy the latest values of all inputs at once.
+        Requires pin_state_cache=True.
+
+        :return: dictionary keyed by 'digital', 'analog', 'touch', 'sonar',
+                 'dht', 'stepper_distance_to_go', 'stepper_target_position'
+                 and 'stepper_current_position'. Each entry maps a pin
+                 number or motor id to (value, time stamp, sequence number).
+                 DHT entries are
+                 (humidity, temperature, time stamp, sequence number).
+        """
+        table = await self._pin_state_table('get_pin_snapshot')
+        return table.snapshot()
+
+    async def _pin_state_table(self, caller):
+        """
+        :param caller: name of the calling method, for the error message
+
+        :return: the pin state table
+        """
+        if not self.pin_states:
+            if self.shutdown_on_exception:
+                await self.shutdown()
+            raise RuntimeError(f'{caller}: pin_state_cache is not enabled')
+        return self.pin_states
+
+    async def get_skipped_report_count(self):
+        """
+        :return: the number of reports dropped without decoding, because
+                 no callback was registered for their pin
+        """
+        return self.report_subscriptions.skipped
+
+    async def get_send_queue_depth(self):
+        """
+        :return: the number of commands waiting for the writer task
+        """
+        return len(self.send_queue) + len(self.urgent_send_queue)
+
+    async def _send_command(self, command, urgent=False):
         """
         This is a private utility method.
+        The command is framed and placed on a send queue. The method
+        returns when the writer task has written the frame.
 
 
         :param command:  command data in the form of a list
 
-        :returns: number of bytes sent
+        :param urgent: place the frame in the priority lane
         """
         # the length of the list is added at the head
         command.insert(0, len(command))
         # print(command)
         send_message = bytes(command)
-        await self.transport.write(send_message)
+
+        if self.auto_reconnect:
+            self.config_journal.record(send_message)
+
+        # the writer task is not running yet - write directly
+        if not self.writer_task:
+            await self.transport.write(send_message)
+            return
+
+        entry = [send_message, self.loop.create_future()]
+        if urgent:
+            self.urgent_send_queue.append(entry)
+        else:
+            self.send_queue.append(entry)
+        self.send_event.set()
+        await entry[1]
+
+    async def _link_writer(self):
+        """
+        This is a private method.
+        It writes queued frames to the transport.
+
+        Urgent frames are written first. Normal frames are coalesced into
+        writes of at most MAX_COALESCED_WRITE_SIZE bytes, and the urgent
+        queue is checked again before each of those writes.
+        """
+        while True:
+            await self.send_event.wait()
+            self.send_event.clear()
+
+            if self.auto_reconnect:
+                # hold queued frames while a lost connection is reopened
+                await self.link_up.wait()
+
+            while self.urgent_send_queue or self.send_queue:
+                entries = []
+                if self.urgent_send_queue:
+                    while self.urgent_send_queue:
+                        entries.append(self.urgent_send_queue.popleft())
+                else:
+                    size = 0
+                    while self.send_queue and \
+                            size < PrivateConstants.MAX_COALESCED_WRITE_SIZE:
+                        entry = self.send_queue.popleft()
+                        entries.append(entry)
+                        size += len(entry[0])
+
+                exception = None
+                try:
+                    await self.transport.write(b''.join([entry[0] for entry in entries]))
+                except asyncio.CancelledError:
+                    self._fail_entries(entries,
+                                       RuntimeError('The client has been shut down'))
+                    raise
+                except Exception as e:
+                    self.send_errors += 1
+                    exception = e
+
+                for entry in entries:
+                    if not entry[1].done():
+                        if exception:
+                            entry[1].set_exception(exception)
+                        else:
+                            entry[1].set_result(None)
+
+    def _fail_send_queue(self, exception):
+        """
+        This is a private method.
+        Remove every queued frame and fail its future.
+
+        :param exception: exception raised to the waiting callers
+        """
+        entries = list(self.urgent_send_queue) + list(self.send_queue)
+        self.urgent_send_queue.clear()
+        self.send_queue.clear()
+        self._fail_entries(entries, exception)
+
+    @staticmethod
+    def _fail_entries(entries, exception):
+        """
+        This is a private method.
+        Fail the futures of send queue entries that are not yet done.
+
+        :param entries: send queue entries
+
+        :param exception: exception raised to the waiting callers
+        """
+        for entry in entries:
+            if not entry[1].done():
+                entry[1].set_exception(exception)
+
+    def _ble_disconnected(self):
+        """
+        This is a private method.
+        It is called by the BLE transport when the server disconnects.
+        """
+        if not self.shutdown_flag:
+            self.loop.create_task(self._link_lost())
+
+    async def _link_lost(self):
+        """
+        This is a private method.
+        It is called when the connection to the ESP32 is closed.
+
+        The report dispatcher and writer task pause until the connection
+        is reopened. If auto_reconnect is set, a task is started to reopen it.
+        """
+        if self.shutdown_flag or not self.link_up.is_set():
+            return
+        self.link_up.clear()
+        self.connection_drops += 1
+
+        if self.transport_is_serial:
+            print(f'Connection to {self.com_port} was lost.')
+        elif self.transport_is_wifi:
+            print(f'Connection to {self.transport_address}:{self.ip_port} was lost.')
+        else:
+            print('BLE connection was lost.')
+
+        if self.connection_callback:
+            await self.connection_callback(False)
+
+        if self.auto_reconnect:
+            self.reconnect_task = self.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        """
+        This is a private method.
+        Reopen a lost connection.
+
+        Attempts are retried with an exponential backoff until they succeed
+        or the board is shut down. When the connection is open, the recorded
+        configuration is replayed as one batched write, and the report
+        dispatcher and writer task are released.
+
+        If the configuration creates devices, such as sonars, DHTs or
+        steppers, the ESP32 is restarted before the replay unless opening
+        the link restarted it, as opening a serial port does.
+        """
+        lost_time = time.monotonic()
+        delay = self.reconnect_min_delay
+        board_restarted = self.transport_is_serial
+
+        while not self.shutdown_flag:
+            await self._close_link()
+            try:
+                await self._open_link()
+                self.framer.reset()
+                if not board_restarted and self.config_journal.creates_devices():
+                    await self.transport.write(bytes([1, PrivateConstants.RESET]))
+                    board_restarted = True
+                    await asyncio.sleep(PrivateConstants.RESTART_WAIT)
+                    continue
+                await self._replay_configuration()
+            except Exception:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            self.reconnects += 1
+            self.last_recovery_time = time.monotonic() - lost_time
+            self.link_up.set()
+            # release any frames queued during the outage
+            self.send_event.set()
+
+            if self.connection_callback:
+                await self.connection_callback(True)
+            return
+
+    async def _replay_configuration(self):
+        """
+        This is a private method.
+        Write the recorded configuration to the newly opened link
+        in a single write.
+
+        Configuration commands still waiting on the send queue are
+        part of the replay, so they are removed from the queue.
+        """
+        frames = [bytes([1, PrivateConstants.ENABLE_ALL_REPORTS])]
+        frames += self.config_journal.frames()
+        await self.transport.write(b''.join(frames))
+
+        for entry in list(self.send_queue):
+            if self.config_journal.contains(entry[0]):
+                self.send_queue.remove(entry)
+                if not entry[1].done():
+                    entry[1].set_result(None)
+
+    async def _heartbeat(self):
+        """
+        This is a private method.
+        Send a loop back request every heartbeat_interval seconds and declare
+        the link stalled when heartbeat_misses requests in a row go unanswered.
+        """
+        while not self.shutdown_flag:
+            await asyncio.sleep(self.heartbeat_interval)
+
+            if not self.link_up.is_set():
+                # a reconnect is in progress
+                self.heartbeats_outstanding = 0
+                continue
+
+            if self.heartbeats_outstanding >= self.heartbeat_misses and \
+                    not self.link_stalled.is_set():
+                await self._link_stalled()
+                if not self.link_up.is_set():
+                    # the stalled link is being reopened
+                    continue
+
+            # heartbeats continue while stalled, so that recovery is seen
+            self.heartbeats_outstanding += 1
+            self.heartbeat_sent_time = time.monotonic_ns()
+            # do not wait for the write - a stalled writer must not
+            # stall the heartbeat
+            self.loop.create_task(self._send_heartbeat())
+
+    async def _send_heartbeat(self):
+        """
+        This is a private method.
+        Send a single heartbeat request.
+        """
+        try:
+            await self._send_loop_back(PrivateConstants.HEARTBEAT_MARKER,
+                                       self._heartbeat_reply)
+        except Exception:
+            pass
+
+    async def _send_loop_back(self, value, handler):
+        """
+        This is a private method.
+        Send a loop back request and record the handler of its reply.
+
+        :param value: data byte to loop back
+
+        :param handler: async function called with the reply data
+        """
+        # _send_command queues the request before it first awaits, so the
+        # pending requests are in the order they are written
+        entry = (value, handler)
+        self.loop_back_pending.append(entry)
+        try:
+            await self._send_command([PrivateConstants.LOOP_COMMAND, value])
+        except Exception:
+            try:
+                self.loop_back_pending.remove(entry)
+            except ValueError:
+                pass
+            raise
+
+    def _loop_back_handler(self, data):
+        """
+        This is a private method.
+        Find the handler of the request a loop back reply answers.
+        Requests sent before it are no longer answered, and are dropped.
+
+        :param data: loop back data
+
+        :return: the handler, or loop_back_callback for a reply that
+                 answers no pending request
+        """
+        if data:
+            for index, (value, handler) in enumerate(self.loop_back_pending):
+                if value == data[0]:
+                    for _ in range(index + 1):
+                        self.loop_back_pending.popleft()
+                    return handler
+        return self.loop_back_callback
+
+    async def _heartbeat_reply(self, data):
+        """
+        This is a private method.
+        A heartbeat was answered.
+
+        :param data: loop back data
+        """
+        if self.heartbeat_sent_time:
+            if self.heartbeats_outstanding == 1:
+                # the reply can only be matched to its request if no other
+                # heartbeat is outstanding
+                self.link_clock.add_exchange(self.heartbeat_sent_time,
+                                             self.receive_time_ns)
+            self.heartbeat_round_trip = \
+                (self.receive_time_ns - self.heartbeat_sent_time) / 1e9
+        self.heartbeats_outstanding = 0
+        if self.link_stalled.is_set():
+            self.link_stalled.clear()
+            if self.stall_callback:
+                await self.stall_callback(False)
+
+    async def _link_stalled(self):
+        """
+        This is a private method.
+        No heartbeat replies were received for heartbeat_misses intervals.
+        """
+        self.stalls += 1
+        self.link_stalled.set()
+        print('The link is stalled - no heartbeat replies.')
+        if self.stall_callback:
+            await self.stall_callback(True)
+
+        if self.auto_reconnect:
+            # reopen the connection - the link may be half open
+            self.link_stalled.clear()
+            self.heartbeats_outstanding = 0
+            await self._link_lost()
+
+    async def synchronize_clock(self, exchanges=8, timeout=1.0):
+        """
+        Measure the link delay with a burst of loop back exchanges and update
+        the clock estimate used for report time stamps.
+
+        Report time stamps are the wall clock time at which a report is
+        estimated to have been sent: the time its data was received, less
+        the estimated one way link delay. Heartbeats also update the
+        estimate, if heartbeat_interval is set.
+
+        The requests use the normal send lane, so that they are answered
+        in order with user loop back requests. An exchange delayed behind
+        queued commands has a longer round trip. The link delay is taken
+        from the shortest round trip, so it is not skewed by such an
+        exchange, although the jitter is raised.
+
+        :param exchanges: number of loop back exchanges
+
+        :param timeout: seconds to wait for each reply. The burst ends at
+                        the first reply that does not arrive in time.
+
+        :return: the clock estimate, as returned by get_clock_estimate
+        """
+        if not self.clock_sync_event:
+            self.clock_sync_event = asyncio.Event()
+
+        for _ in range(exchanges):
+            self.clock_sync_event.clear()
+            self.clock_sync_sent_time = time.monotonic_ns()
+            await self._send_loop_back(PrivateConstants.CLOCK_MARKER,
+                                       self._clock_sync_reply)
+            try:
+                await asyncio.wait_for(self.clock_sync_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                # a late reply is ignored
+                self.clock_sync_sent_time = None
+                break
+        return await self.get_clock_estimate()
+
+    async def get_clock_estimate(self):
+        """
+        Retrieve the estimate used to time stamp reports.
+
+        :return: dictionary with the following keys:
+
+                 offset - wall clock minus monotonic time in seconds
+
+                 drift - wall clock drift against the monotonic clock,
+                         in parts per million
+
+                 link_delay - estimated one way link delay in seconds.
+                              It is subtracted from report receive times.
+
+                 jitter - mean round trip time above the shortest,
+                          in seconds
+
+                 uncertainty - estimated +/- error in seconds that
+                               applies to every report time stamp taken
+                               under this estimate, or None before the
+                               first exchange
+
+                 exchanges - number of exchanges in the estimate
+        """
+        return self.link_clock.estimate()
+
+    async def _clock_sync_reply(self, data):
+        """
+        This is a private method.
+        A clock synchronization request was answered.
+
+        :param data: loop back data
+        """
+        if not self.clock_sync_sent_time:
+            # the reply came after synchronize_clock stopped waiting
+            return
+        self.link_clock.add_exchange(self.clock_sync_sent_time, self.receive_time_ns)
+        self.clock_sync_sent_time = None
+        self.clock_sync_event.set()
+
+    def _set_receive_time(self, receive_time):
+        """
+        This is a private method.
+        Set the receive time of the data about to be dispatched.
+
+        :param receive_time: time.monotonic_ns() when the data was received
+        """
+        self.receive_time_ns = receive_time
+        self.report_time = self.link_clock.time_stamp(receive_time)
+
+    async def get_connection_statistics(self):
+        """
+        Retrieve the connection counters.
+
+        :return: dictionary with the following keys:
+
+                 connected - True if the link is currently open
+
+                 connection_drops - number of times the connection was lost
+
+                 reconnects - number of times the connection was reopened
+
+                 last_recovery_time - seconds from detecting the last drop
+                                      to having the configuration replayed,
+                                      or None
+
+                 stalled - True if the heartbeat has stopped being answered
+
+                 stalls - number of times the link stalled
+
+                 heartbeat_round_trip - seconds taken by the last answered
+                                        heartbeat, or None
+        """
+        return {'connected': bool(self.link_up and self.link_up.is_set()),
+                'connection_drops': self.connection_drops,
+                'reconnects': self.reconnects,
+                'last_recovery_time': self.last_recovery_time,
+                'stalled': bool(self.link_stalled and self.link_stalled.is_set()),
+                'stalls': self.stalls,
+                'heartbeat_round_trip': self.heartbeat_round_trip}
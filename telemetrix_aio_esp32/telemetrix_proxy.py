@@ -0,0 +1,514 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import argparse
+import asyncio
+import sys
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.packet_framer import PacketFramer
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+
+
+class ProxyClient:
+    """
+    The state the proxy keeps for one connected local client.
+    """
+
+    def __init__(self, reader, writer):
+        """
+
+        :param reader: asyncio StreamReader
+
+        :param writer: asyncio StreamWriter
+        """
+        self.reader = reader
+        self.writer = writer
+        self.framer = PacketFramer()
+
+        # (report type, key) pairs the client receives.
+        # A key of None matches every report of that type.
+        self.subscriptions = set()
+
+        self.reports_sent = 0
+        self.reports_dropped = 0
+
+
+class TelemetrixProxy:
+    """
+    This class holds the single connection that the Telemetrix4Esp32 server
+    accepts and shares it between many local clients.
+
+    Clients connect over TCP, or over a Unix socket, and speak the normal
+    Telemetrix protocol. A TelemetrixAioEsp32 instance connected to
+    127.0.0.1 and the proxy's listen port works unchanged.
+
+    Reports are forwarded only to the clients that asked for them.
+    Subscriptions are derived from the commands each client sends. For
+    example, a client that sets pin 36 as an analog input receives the
+    analog reports for pin 36. Set filter_reports to False to send every
+    report to every client.
+
+    Client commands are merged onto the board's send queue. They are
+    arbitrated as follows:
+
+        GET_FIRMWARE_VERSION is answered from the proxy's cached version.
+
+        RESET, STOP_ALL_REPORTS and the disable all reporting request
+        are not forwarded, because they would affect the other clients.
+
+        The first client to use a pin as an output owns it until it
+        disconnects. Output commands from other clients for that pin
+        are dropped.
+
+        Loop back replies are returned to the client that sent
+        the request. Replies to the proxy's own heartbeat and clock
+        synchronization requests are handled by its board connection.
+
+    Stepper motor ids are assigned by each client, so only one client
+    should control steppers.
+    """
+
+    # report type -> index of the pin, or other key, in the report data.
+    # None means the report is not keyed.
+    REPORT_KEYS = {PrivateConstants.DIGITAL_REPORT: 0,
+                   PrivateConstants.ANALOG_REPORT: 0,
+                   PrivateConstants.TOUCH_REPORT: 0,
+                   PrivateConstants.SONAR_DISTANCE: 0,
+                   PrivateConstants.DHT_REPORT: 1,
+                   PrivateConstants.SERVO_UNAVAILABLE: 0,
+                   PrivateConstants.STEPPER_DISTANCE_TO_GO: 0,
+                   PrivateConstants.STEPPER_TARGET_POSITION: 0,
+                   PrivateConstants.STEPPER_CURRENT_POSITION: 0,
+                   PrivateConstants.STEPPER_RUNNING_REPORT: 0,
+                   PrivateConstants.STEPPER_RUN_COMPLETE_REPORT: 0,
+                   PrivateConstants.I2C_READ_REPORT: None,
+                   PrivateConstants.I2C_TOO_FEW_BYTES_RCVD: None,
+                   PrivateConstants.I2C_TOO_MANY_BYTES_RCVD: None,
+                   PrivateConstants.SPI_REPORT: None,
+                   PrivateConstants.ONE_WIRE_REPORT: None}
+
+    STEPPER_REPORTS = [PrivateConstants.STEPPER_DISTANCE_TO_GO,
+                       PrivateConstants.STEPPER_TARGET_POSITION,
+                       PrivateConstants.STEPPER_CURRENT_POSITION,
+                       PrivateConstants.STEPPER_RUNNING_REPORT,
+                       PrivateConstants.STEPPER_RUN_COMPLETE_REPORT]
+
+    I2C_REPORTS = [PrivateConstants.I2C_READ_REPORT,
+                   PrivateConstants.I2C_TOO_FEW_BYTES_RCVD,
+                   PrivateConstants.I2C_TOO_MANY_BYTES_RCVD]
+
+    # output commands whose second byte is a pin number
+    PIN_OUTPUT_COMMANDS = [PrivateConstants.DIGITAL_WRITE,
+                           PrivateConstants.SERVO_WRITE,
+                           PrivateConstants.SERVO_DETACH,
+                           PrivateConstants.DAC_WRITE,
+                           PrivateConstants.DAC_DISABLE]
+
+    def __init__(self, listen_address='127.0.0.1', listen_port=31337,
+                 unix_path=None, filter_reports=True, max_client_buffer=65536,
+                 loop=None, **kwargs):
+        """
+
+        :param listen_address: TCP address for local clients
+
+        :param listen_port: TCP port for local clients
+
+        :param unix_path: If specified, clients connect to this Unix socket
+                          path instead of TCP.
+
+        :param filter_reports: If True, clients only receive the reports
+                               for the pins and devices they configured.
+
+        :param max_client_buffer: maximum number of bytes waiting to be sent
+                                  to a client. Reports for a client that
+                                  falls further behind are dropped, so a
+                                  slow client can not stall the others.
+
+        :param loop: optional user provided event loop
+
+        :param kwargs: TelemetrixAioEsp32 parameters for the board
+                       connection, for example transport_address.
+                       autostart and loop are supplied by the proxy.
+        """
+        if loop is None:
+            self.loop = asyncio.get_event_loop()
+        else:
+            self.loop = loop
+
+        self.listen_address = listen_address
+        self.listen_port = listen_port
+        self.unix_path = unix_path
+        self.filter_reports = filter_reports
+        self.max_client_buffer = max_client_buffer
+
+        kwargs['autostart'] = False
+        kwargs['loop'] = self.loop
+        self.board = TelemetrixAioEsp32(**kwargs)
+
+        self.server = None
+
+        self.clients = []
+
+        # pin number -> client that owns it as an output
+        self.pin_owners = {}
+
+        # number of commands forwarded, answered locally or dropped
+        self.commands_forwarded = 0
+        self.commands_answered = 0
+        self.commands_rejected = 0
+
+    async def start(self):
+        """
+        Connect to the board and start accepting clients.
+        """
+        await self.board.start_aio()
+
+        # from now on, reports are forwarded instead of decoded.
+        # The proxy filters them per client, so the board passes them all.
+        # Loop back replies are left to the board, which returns each one
+        # to the handler of its request.
+        self.board.report_subscriptions.disable()
+        for report_type in self.board.report_dispatch:
+            if report_type != PrivateConstants.LOOP_COMMAND:
+                self.board.report_dispatch[report_type] = \
+                    self._make_forwarder(report_type)
+
+        if self.unix_path:
+            self.server = await asyncio.start_unix_server(self._serve_client,
+                                                          path=self.unix_path)
+            print(f'Telemetrix proxy listening on: {self.unix_path}')
+        else:
+            self.server = await asyncio.start_server(self._serve_client,
+                                                     self.listen_address,
+                                                     self.listen_port)
+            print(f'Telemetrix proxy listening on: {self.listen_address}:'
+                  f'{self.listen_port}')
+
+    async def serve_forever(self):
+        """
+        Start the proxy and run until cancelled.
+        """
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def shutdown(self):
+        """
+        Disconnect all clients and shut down the board connection.
+        """
+        if self.server:
+            self.server.close()
+        writers = [client.writer for client in self.clients]
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        if self.server:
+            await self.server.wait_closed()
+        await self.board.shutdown()
+
+    def statistics(self):
+        """
+        Retrieve the proxy counters.
+
+        :return: dictionary with the following keys:
+
+                 clients - number of connected clients
+
+                 commands_forwarded - client commands sent to the board
+
+                 commands_answered - client commands answered by the proxy
+
+                 commands_rejected - client commands that were dropped
+
+                 reports_sent - reports sent to clients
+
+                 reports_dropped - reports dropped for slow clients
+        """
+        return {'clients': len(self.clients),
+                'commands_forwarded': self.commands_forwarded,
+                'commands_answered': self.commands_answered,
+                'commands_rejected': self.commands_rejected,
+                'reports_sent': sum(client.reports_sent for client in self.clients),
+                'reports_dropped': sum(client.reports_dropped
+                                       for client in self.clients)}
+
+    async def _serve_client(self, reader, writer):
+        """
+        Handle one client connection.
+
+        :param reader: asyncio StreamReader
+
+        :param writer: asyncio StreamWriter
+        """
+        client = ProxyClient(reader, writer)
+        self.clients.append(client)
+        try:
+            while True:
+                data = await reader.read(PrivateConstants.MAX_RECEIVE_SIZE)
+                if not data:
+                    break
+                for command in client.framer.feed(data):
+                    if command:
+                        await self._handle_command(client, command)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._remove_client(client)
+
+    def _remove_client(self, client):
+        """
+        Release everything held by a client that disconnected.
+
+        :param client: ProxyClient
+        """
+        if client in self.clients:
+            self.clients.remove(client)
+        for pin in [pin for pin, owner in self.pin_owners.items()
+                    if owner is client]:
+            del self.pin_owners[pin]
+        client.writer.close()
+
+    async def _handle_command(self, client, command):
+        """
+        Arbitrate a command from a client and forward it to the board.
+
+        :param client: ProxyClient
+
+        :param command: command bytes, starting with the command id
+        """
+        command_id = command[0]
+
+        if command_id == PrivateConstants.GET_FIRMWARE_VERSION:
+            firmware = bytes(self.board.firmware_version)
+            self._send_to_client(client, bytes([len(firmware) + 1,
+                                                PrivateConstants.FIRMWARE_REPORT]) +
+                                 firmware)
+            self.commands_answered += 1
+            return
+
+        if command_id in [PrivateConstants.RESET,
+                          PrivateConstants.STOP_ALL_REPORTS]:
+            self.commands_rejected += 1
+            return
+
+        if command_id == PrivateConstants.MODIFY_REPORTING and \
+                command[1] == PrivateConstants.REPORTING_DISABLE_ALL:
+            self.commands_rejected += 1
+            return
+
+        if not self._claim_pins(client, command):
+            self.commands_rejected += 1
+            return
+
+        self._subscribe(client, command)
+
+        self.commands_forwarded += 1
+        if command_id == PrivateConstants.LOOP_COMMAND and len(command) == 2:
+            await self.board.loop_back(chr(command[1]),
+                                       callback=self._make_loop_back_reply(client))
+            return
+
+        await self.board.send(command,
+                              urgent=command_id == PrivateConstants.STEPPER_STOP)
+
+    def _claim_pins(self, client, command):
+        """
+        Check and record output pin ownership.
+
+        :param client: ProxyClient
+
+        :param command: command bytes
+
+        :return: False if the pin is owned by another client
+        """
+        command_id = command[0]
+        if command_id == PrivateConstants.SET_PIN_MODE:
+            if command[2] not in [PrivateConstants.AT_OUTPUT,
+                                  PrivateConstants.AT_PWM_OUT]:
+                return True
+        elif command_id not in self.PIN_OUTPUT_COMMANDS and \
+                command_id != PrivateConstants.SERVO_ATTACH:
+            return True
+
+        owner = self.pin_owners.setdefault(command[1], client)
+        return owner is client
+
+    def _subscribe(self, client, command):
+        """
+        Derive report subscriptions from a configuration command.
+
+        :param client: ProxyClient
+
+        :param command: command bytes
+        """
+        command_id = command[0]
+        subscriptions = client.subscriptions
+
+        if command_id == PrivateConstants.SET_PIN_MODE:
+            pin_mode = command[2]
+            if pin_mode in [PrivateConstants.AT_INPUT,
+                            PrivateConstants.AT_INPUT_PULLUP,
+                            PrivateConstants.AT_INPUT_PULL_DOWN]:
+                subscriptions.add((PrivateConstants.DIGITAL_REPORT, command[1]))
+            elif pin_mode == PrivateConstants.AT_ANALOG:
+                subscriptions.add((PrivateConstants.ANALOG_REPORT, command[1]))
+            elif pin_mode == PrivateConstants.AT_TOUCH:
+                subscriptions.add((PrivateConstants.TOUCH_REPORT, command[1]))
+        elif command_id == PrivateConstants.SERVO_ATTACH:
+            subscriptions.add((PrivateConstants.SERVO_UNAVAILABLE, command[1]))
+        elif command_id == PrivateConstants.SONAR_NEW:
+            subscriptions.add((PrivateConstants.SONAR_DISTANCE, command[1]))
+        elif command_id == PrivateConstants.DHT_NEW:
+            subscriptions.add((PrivateConstants.DHT_REPORT, command[1]))
+        elif command_id in [PrivateConstants.I2C_BEGIN, PrivateConstants.I2C_READ]:
+            for report_type in self.I2C_REPORTS:
+                subscriptions.add((report_type, None))
+        elif command_id in [PrivateConstants.SPI_INIT,
+                            PrivateConstants.SPI_READ_BLOCKING]:
+            subscriptions.add((PrivateConstants.SPI_REPORT, None))
+        elif PrivateConstants.ONE_WIRE_INIT <= command_id <= \
+                PrivateConstants.ONE_WIRE_CRC8:
+            subscriptions.add((PrivateConstants.ONE_WIRE_REPORT, None))
+        elif command_id == PrivateConstants.SET_PIN_MODE_STEPPER:
+            for report_type in self.STEPPER_REPORTS:
+                subscriptions.add((report_type, command[1]))
+
+    def _make_forwarder(self, report_type):
+        """
+        Create a report_dispatch handler that forwards
+        reports of one type to the clients.
+
+        :param report_type: report id
+
+        :return: async handler function
+        """
+        async def forward_report(data):
+            self._forward(report_type, data)
+
+        return forward_report
+
+    def _forward(self, report_type, data):
+        """
+        Send a report from the board to the clients that subscribed to it.
+
+        :param report_type: report id
+
+        :param data: report data following the report id
+        """
+        if report_type == PrivateConstants.FIRMWARE_REPORT:
+            self.board.firmware_version = data
+            return
+
+        frame = bytes([len(data) + 1, report_type]) + bytes(data)
+
+        if not self.filter_reports or report_type not in self.REPORT_KEYS:
+            for client in self.clients:
+                self._send_to_client(client, frame)
+            return
+
+        key_index = self.REPORT_KEYS[report_type]
+        key = None if key_index is None else data[key_index]
+        for client in self.clients:
+            if (report_type, key) in client.subscriptions or \
+                    (report_type, None) in client.subscriptions:
+                self._send_to_client(client, frame)
+
+    def _make_loop_back_reply(self, client):
+        """
+        Create the callback that returns a loop back reply to a client.
+
+        :param client: ProxyClient that sent the request
+
+        :return: async callback function
+        """
+        async def loop_back_reply(data):
+            self._send_to_client(client,
+                                 bytes([len(data) + 1,
+                                        PrivateConstants.LOOP_COMMAND]) +
+                                 bytes(data))
+
+        return loop_back_reply
+
+    def _send_to_client(self, client, frame):
+        """
+        Queue a frame for a client without waiting for it to be sent.
+
+        :param client: ProxyClient
+
+        :param frame: framed report bytes
+        """
+        transport = client.writer.transport
+        if transport.is_closing() or \
+                transport.get_write_buffer_size() > self.max_client_buffer:
+            client.reports_dropped += 1
+            return
+        client.writer.write(frame)
+        client.reports_sent += 1
+
+
+def telemetrix_proxy():
+    """
+    Run the proxy from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Share one Telemetrix4Esp32 connection between many clients')
+    parser.add_argument('-a', dest='transport_address', default=None,
+                        help='IP address of a WI-FI ESP32')
+    parser.add_argument('-p', dest='ip_port', type=int, default=31336,
+                        help='IP port of a WI-FI ESP32')
+    parser.add_argument('-c', dest='com_port', default=None,
+                        help='serial port of a USB connected ESP32')
+    parser.add_argument('-b', dest='ble', action='store_true',
+                        help='connect to a BLE ESP32')
+    parser.add_argument('-l', dest='listen_address', default='127.0.0.1',
+                        help='TCP address for local clients')
+    parser.add_argument('-L', dest='listen_port', type=int, default=31337,
+                        help='TCP port for local clients')
+    parser.add_argument('-u', dest='unix_path', default=None,
+                        help='Unix socket path for local clients')
+    parser.add_argument('-n', dest='filter_reports', action='store_false',
+                        help='send every report to every client')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    proxy = TelemetrixProxy(listen_address=args.listen_address,
+                            listen_port=args.listen_port,
+                            unix_path=args.unix_path,
+                            filter_reports=args.filter_reports,
+                            loop=loop,
+                            transport_is_wifi=not args.ble,
+                            transport_address=args.transport_address,
+                            ip_port=args.ip_port,
+                            com_port=args.com_port,
+                            restart_on_shutdown=False)
+    try:
+        loop.run_until_complete(proxy.serve_forever())
+    except KeyboardInterrupt:
+        loop.run_until_complete(proxy.shutdown())
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    telemetrix_proxy()
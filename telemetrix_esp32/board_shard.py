@@ -0,0 +1,323 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import multiprocessing
+import threading
+import traceback
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.report_ring import ReportRing
+
+
+class CallbackReference:
+    """
+    Stands in for a callback function when a method call is sent to the
+    worker process. The worker replaces it with a function that publishes
+    reports into the report ring, tagged with callback_id.
+    """
+
+    def __init__(self, callback_id):
+        """
+
+        :param callback_id: id of the callback in the parent process
+        """
+        self.callback_id = callback_id
+
+
+def _shard_worker(ring_name, command_queue, result_queue, board_kwargs):
+    """
+    Worker process main function. It runs a TelemetrixEsp32 instance
+    and executes the method calls sent by the parent process.
+
+    :param ring_name: shared memory name of the report ring
+
+    :param command_queue: queue of (method name, args, kwargs) requests.
+                          None requests a shutdown.
+
+    :param result_queue: queue of (True, return value) or (False, error)
+
+    :param board_kwargs: TelemetrixEsp32 parameters
+    """
+    # imported here so that the parent process does not need to load
+    # the transport libraries
+    from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+
+    ring = ReportRing(name=ring_name, create=False)
+
+    try:
+        board = TelemetrixEsp32(**board_kwargs)
+    except Exception as e:
+        result_queue.put((False, RuntimeError(f'Board start failed: {e}')))
+        ring.close()
+        return
+    result_queue.put((True, None))
+
+    def make_publisher(callback_id):
+        def publish_report(report):
+            ring.put(callback_id, report)
+
+        return publish_report
+
+    def resolve(argument):
+        if isinstance(argument, CallbackReference):
+            return make_publisher(argument.callback_id)
+        return argument
+
+    while True:
+        request = command_queue.get()
+        if request is None:
+            break
+
+        method_name, args, kwargs = request
+        args = [resolve(argument) for argument in args]
+        kwargs = {key: resolve(value) for key, value in kwargs.items()}
+        try:
+            result = getattr(board, method_name)(*args, **kwargs)
+        except Exception as e:
+            result_queue.put((False, RuntimeError(f'{method_name}: {e}')))
+        else:
+            result_queue.put((True, result))
+
+    try:
+        board.shutdown()
+    except Exception:
+        pass
+    ring.close()
+    result_queue.put((True, None))
+
+
+class ShardedBoard:
+    """
+    This class runs a TelemetrixEsp32 instance, including its transport
+    threads, report dispatcher and report handlers, in a separate worker
+    process. This spreads the decoding work of many boards across cores
+    instead of sharing a single interpreter lock.
+
+    Decoded reports are written into a shared memory ReportRing as fixed
+    size binary records. The parent process reads them without pickling and
+    calls the callbacks registered for them.
+
+    TelemetrixEsp32 API methods are called on this object as usual, for
+    example set_pin_mode_analog_input(36, callback=the_callback).
+    Each call is executed in the worker process and its return value
+    is returned. Callback functions stay in the parent process.
+
+    Callbacks are only called from process_reports(), or from the reader
+    thread when start_reader() has been called.
+
+    Reports are limited to ring_fields values. Longer reports are not
+    published and are counted by oversized_reports(). I2C, SPI and
+    OneWire reports hold one value per data byte, so set ring_fields to
+    the largest read plus their header and timestamp fields. The ring holds
+    numbers only, so report_objects and the 'bytes' and 'memoryview'
+    payload formats are not supported.
+    """
+
+    def __init__(self, ring_capacity=4096, ring_fields=ReportRing.MAX_FIELDS,
+                 start_method=None, **kwargs):
+        """
+
+        :param ring_capacity: number of reports the ring can hold before
+                              new reports are dropped
+
+        :param ring_fields: largest report, in values, the ring can hold.
+                            Up to ReportRing.FIELD_LIMIT.
+
+        :param start_method: multiprocessing start method. If None,
+                             the platform default is used.
+
+        :param kwargs: TelemetrixEsp32 parameters, for example
+                       transport_address. reactor, report_objects and
+                       payload formats other than 'list' are not supported.
+        """
+        if kwargs.get('reactor') is not None:
+            raise RuntimeError('ShardedBoard: a reactor can not be shared '
+                               'with a worker process')
+        if kwargs.get('report_objects'):
+            raise RuntimeError('ShardedBoard: report objects can not be '
+                               'published to the report ring')
+        if kwargs.get('payload_format', 'list') != 'list':
+            raise RuntimeError('ShardedBoard: only the list payload format can '
+                               'be published to the report ring')
+
+        self.ring = ReportRing(capacity=ring_capacity, max_fields=ring_fields)
+
+        context = multiprocessing.get_context(start_method)
+        self.command_queue = context.Queue()
+        self.result_queue = context.Queue()
+
+        # callback id -> callback function in this process
+        self.callbacks = {}
+
+        # callback function -> callback id
+        self.callback_ids = {}
+
+        # serializes requests to the worker
+        self.call_lock = threading.Lock()
+
+        self.reader_thread = None
+        self.reader_running = threading.Event()
+
+        self.shutdown_flag = False
+
+        # number of reports delivered to callbacks
+        self.reports_delivered = 0
+
+        self.process = context.Process(target=_shard_worker,
+                                       args=(self.ring.name, self.command_queue,
+                                             self.result_queue, kwargs))
+        self.process.daemon = True
+        self.process.start()
+
+        # wait for the board to connect
+        ok, error = self.result_queue.get()
+        if not ok:
+            self.process.join()
+            self.ring.close()
+            self.ring.unlink()
+            raise error
+
+    def __getattr__(self, method_name):
+        """
+        Forward TelemetrixEsp32 API calls to the worker process.
+
+        :param method_name: name of a TelemetrixEsp32 method
+        """
+        if method_name.startswith('_'):
+            raise AttributeError(method_name)
+
+        def remote_call(*args, **kwargs):
+            return self.call(method_name, *args, **kwargs)
+
+        return remote_call
+
+    def call(self, method_name, *args, **kwargs):
+        """
+        Execute a TelemetrixEsp32 method in the worker process.
+        Callable arguments are registered as report callbacks.
+
+        :param method_name: TelemetrixEsp32 method name
+
+        :param args: positional arguments
+
+        :param kwargs: keyword arguments
+
+        :return: the method's return value
+        """
+        if self.shutdown_flag:
+            raise RuntimeError('ShardedBoard: the board has been shut down')
+
+        args = [self._reference(argument) for argument in args]
+        kwargs = {key: self._reference(value) for key, value in kwargs.items()}
+
+        with self.call_lock:
+            self.command_queue.put((method_name, args, kwargs))
+            ok, result = self.result_queue.get()
+        if not ok:
+            raise result
+        return result
+
+    def _reference(self, argument):
+        """
+        Replace a callback function with a picklable reference to it.
+
+        :param argument: method argument
+        """
+        if not callable(argument):
+            return argument
+        callback_id = self.callback_ids.get(argument)
+        if callback_id is None:
+            callback_id = len(self.callbacks)
+            self.callbacks[callback_id] = argument
+            self.callback_ids[argument] = callback_id
+        return CallbackReference(callback_id)
+
+    def process_reports(self):
+        """
+        Read all reports waiting in the ring and call their callbacks.
+
+        :return: number of reports processed
+        """
+        reports = self.ring.get_all()
+        for callback_id, report in reports:
+            self.callbacks[callback_id](report)
+        self.reports_delivered += len(reports)
+        return len(reports)
+
+    def start_reader(self, poll_interval=.001):
+        """
+        Start a thread that calls process_reports() periodically.
+
+        :param poll_interval: seconds to sleep when the ring is empty
+        """
+        if self.reader_thread:
+            return
+        self.reader_running.set()
+        self.reader_thread = threading.Thread(target=self._reader,
+                                              args=(poll_interval,))
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+
+    def _reader(self, poll_interval):
+        """
+        Thread that delivers reports from the ring to their callbacks.
+
+        :param poll_interval: seconds to sleep when the ring is empty
+        """
+        stop = threading.Event()
+        while self.reader_running.is_set():
+            try:
+                count = self.process_reports()
+            except Exception:
+                traceback.print_exc()
+                count = 0
+            if not count:
+                stop.wait(poll_interval)
+
+    def dropped_reports(self):
+        """
+        :return: number of reports dropped because the ring was full
+        """
+        return self.ring.dropped()
+
+    def oversized_reports(self):
+        """
+        :return: number of reports not published because they have more
+                 than ring_fields values
+        """
+        return self.ring.oversized()
+
+    def shutdown(self):
+        """
+        Shut down the board, stop the worker process and
+        release the shared memory.
+        """
+        if self.shutdown_flag:
+            return
+        self.shutdown_flag = True
+        self.reader_running.clear()
+        if self.reader_thread:
+            self.reader_thread.join()
+
+        with self.call_lock:
+            self.command_queue.put(None)
+            self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.ring.close()
+        self.ring.unlink()
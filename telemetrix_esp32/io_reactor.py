@@ -0,0 +1,321 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import selectors
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+
+class IoReactor:
+    """
+    This class services the WI-FI sockets of many TelemetrixEsp32 instances
+    with a single selector thread.
+
+    Received data is framed on the selector thread, and complete packets are
+    handed to a small, fixed pool of dispatch worker threads. Each board is
+    served by the same worker from register() until unregister(), including
+    across reconnects, so its reports are processed in order.
+
+    The dispatch workers also run each board's timers: heartbeats, held
+    back output shaper writes and the end of aggregation windows.
+    The number of threads does not grow with the number of boards.
+
+    Pass an instance as the reactor parameter of TelemetrixEsp32.
+    """
+
+    def __init__(self, dispatch_workers=2):
+        """
+
+        :param dispatch_workers: number of threads that run report handlers
+        """
+        if dispatch_workers < 1:
+            raise RuntimeError('IoReactor: at least one dispatch worker is required')
+
+        self.selector = selectors.DefaultSelector()
+
+        # a socket pair used to wake the selector thread when
+        # boards are added or removed
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ, None)
+
+        # (board, True to add / False to remove) requests for the selector thread.
+        # A removed board's worker assignment is released.
+        self.pending_changes = deque()
+
+        # board -> the socket registered with the selector for it.
+        # A board's socket is replaced when it reconnects.
+        self.boards = {}
+
+        # per worker queues of (board, packet list) and their wake up events
+        self.worker_queues = [deque() for _ in range(dispatch_workers)]
+        self.worker_events = [threading.Event() for _ in range(dispatch_workers)]
+
+        # board -> index of the worker that serves it. The entry is kept while
+        # a lost connection is reopened, so the board keeps its worker.
+        self.board_workers = {}
+
+        # per worker sets of the boards it serves, and the time.monotonic()
+        # value when their timers must next be run
+        self.worker_boards = [set() for _ in range(dispatch_workers)]
+        self.worker_deadlines = [None] * dispatch_workers
+
+        self.next_worker = 0
+
+        self.running = threading.Event()
+
+        self.the_selector_thread = threading.Thread(target=self._selector_loop)
+        self.the_selector_thread.daemon = True
+
+        self.the_worker_threads = []
+        for worker in range(dispatch_workers):
+            worker_thread = threading.Thread(target=self._dispatch_worker,
+                                             args=(worker,))
+            worker_thread.daemon = True
+            self.the_worker_threads.append(worker_thread)
+
+        # number of bytes and packets received across all boards
+        self.bytes_received = 0
+        self.packets_received = 0
+
+    def start(self):
+        """
+        Start the selector and dispatch worker threads.
+        Called automatically when the first board is registered.
+        """
+        if self.running.is_set():
+            return
+        if self.the_selector_thread.ident is not None:
+            raise RuntimeError('IoReactor: a stopped reactor can not be restarted')
+        self.running.set()
+        self.the_selector_thread.start()
+        for worker_thread in self.the_worker_threads:
+            worker_thread.start()
+
+    def stop(self):
+        """
+        Stop servicing all boards, wait for the reactor threads to exit
+        and close the selector.
+        """
+        self.running.clear()
+        self._wake()
+        for event in self.worker_events:
+            event.set()
+
+        if self.the_selector_thread.ident is None:
+            # never started
+            self._close_selector()
+            return
+
+        # a callback may stop the reactor from one of its own threads
+        current_thread = threading.current_thread()
+        for thread in [self.the_selector_thread] + self.the_worker_threads:
+            if thread is not current_thread:
+                thread.join()
+
+    def register(self, board):
+        """
+        Start servicing a board's socket.
+
+        :param board: a connected WI-FI TelemetrixEsp32 instance
+        """
+        self.start()
+        if board not in self.board_workers:
+            self.board_workers[board] = self.next_worker
+            self.worker_boards[self.next_worker].add(board)
+            self.next_worker = (self.next_worker + 1) % len(self.worker_queues)
+        self.pending_changes.append((board, True))
+        self._wake()
+
+    def unregister(self, board):
+        """
+        Stop servicing a board's socket and release its worker.
+
+        :param board: a registered TelemetrixEsp32 instance
+        """
+        self.pending_changes.append((board, False))
+        self._wake()
+
+    def schedule(self, board):
+        """
+        Run a board's timers on its dispatch worker now, for example
+        after a write was held back or an aggregation window was configured.
+
+        :param board: a registered TelemetrixEsp32 instance
+        """
+        worker = self.board_workers.get(board)
+        if worker is None:
+            return
+        self.worker_deadlines[worker] = 0
+        self.worker_events[worker].set()
+
+    def thread_count(self):
+        """
+        :return: number of threads used by the reactor
+        """
+        return 1 + len(self.the_worker_threads)
+
+    def _wake(self):
+        try:
+            self.wakeup_sender.send(b'\x00')
+        except OSError:
+            pass
+
+    def _apply_changes(self):
+        while self.pending_changes:
+            board, add = self.pending_changes.popleft()
+            if add:
+                if board not in self.boards:
+                    self.selector.register(board.sock, selectors.EVENT_READ, board)
+                    self.boards[board] = board.sock
+            else:
+                self._remove(board)
+                worker = self.board_workers.pop(board, None)
+                if worker is not None:
+                    self.worker_boards[worker].discard(board)
+
+    def _remove(self, board):
+        """
+        Stop selecting a board's socket. Runs on the selector thread.
+
+        :param board: a registered TelemetrixEsp32 instance
+        """
+        if board in self.boards:
+            try:
+                self.selector.unregister(self.boards.pop(board))
+            except (KeyError, ValueError):
+                pass
+
+    def _close_selector(self):
+        self.selector.close()
+        self.wakeup_receiver.close()
+        self.wakeup_sender.close()
+
+    def _selector_loop(self):
+        """
+        Thread that waits for data on all registered sockets,
+        frames it, and queues complete packets for the dispatch workers.
+        The selector is closed when the thread exits.
+        """
+        try:
+            self._select()
+        finally:
+            self._close_selector()
+
+    def _select(self):
+        while self.running.is_set():
+            self._apply_changes()
+            for key, mask in self.selector.select(timeout=1.0):
+                board = key.data
+                if board is None:
+                    try:
+                        self.wakeup_receiver.recv(PrivateConstants.MAX_RECEIVE_SIZE)
+                    except OSError:
+                        pass
+                    continue
+
+                try:
+                    data = key.fileobj.recv(PrivateConstants.MAX_RECEIVE_SIZE)
+                except (BlockingIOError, socket.timeout):
+                    continue
+                except OSError:
+                    data = b''
+
+                if not data:
+                    # the connection was closed. The board keeps its worker
+                    # in case the connection is reopened.
+                    self._remove(board)
+                    board._link_lost()
+                    continue
+
+                receive_time = time.monotonic_ns()
+                self.bytes_received += len(data)
+                packets = board.framer.feed(data)
+                if packets:
+                    self.packets_received += len(packets)
+                    worker = self.board_workers.get(board)
+                    if worker is None:
+                        # unregistered since this select
+                        continue
+                    self.worker_queues[worker].append((board, receive_time, packets))
+                    self.worker_events[worker].set()
+
+    def _dispatch_worker(self, worker):
+        """
+        Thread that runs the report handlers of the boards assigned to it.
+
+        :param worker: index of this worker
+        """
+        work_queue = self.worker_queues[worker]
+        event = self.worker_events[worker]
+
+        while self.running.is_set():
+            event.clear()
+            while work_queue:
+                board, receive_time, packets = work_queue.popleft()
+                board._set_receive_time(receive_time)
+                for packet in packets:
+                    try:
+                        board._dispatch_packet(packet)
+                    except Exception:
+                        # a failing handler must not stop the other boards
+                        traceback.print_exc()
+                if board.filters_pending:
+                    try:
+                        board._flush_analog_filters()
+                    except Exception:
+                        traceback.print_exc()
+            timeout = self._run_timers(worker)
+            if not work_queue:
+                event.wait(timeout)
+
+    def _run_timers(self, worker):
+        """
+        Run the timers of a worker's boards when they are due.
+
+        :param worker: index of the worker
+
+        :return: seconds until the timers must be run again
+        """
+        now = time.monotonic()
+        deadline = self.worker_deadlines[worker]
+        if deadline is not None and now < deadline:
+            return min(deadline - now, 1.0)
+
+        # cleared before the boards run, so that a schedule() call made
+        # while they run is not lost
+        self.worker_deadlines[worker] = None
+        wait = 1.0
+        for board in list(self.worker_boards[worker]):
+            try:
+                board_wait = board._run_timers()
+            except Exception:
+                traceback.print_exc()
+                continue
+            if board_wait is not None:
+                wait = min(wait, board_wait)
+
+        if self.worker_deadlines[worker] is None:
+            self.worker_deadlines[worker] = now + wait
+            return wait
+        return 0
@@ -15,6 +15,7 @@
  Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 """
 
+import select
 import socket
 import struct
 import sys
@@ -22,11 +23,34 @@ import threading
 import time
 from collections import deque
 from adafruit_ble import BLERadio
+from adafruit_ble.advertising import Advertisement
 from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
 from adafruit_ble.services.nordic import UARTService
 
 # noinspection PyUnresolvedReferences
 from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.output_shaper import OutputShaper
+from telemetrix_esp32_common.transport_options import TransportOptions
+from telemetrix_esp32_common.packet_framer import PacketFramer
+from telemetrix_esp32_common.ble_address_cache import BleAddressCache
+from telemetrix_esp32_common.config_journal import ConfigJournal
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.report_subscriptions import ReportSubscriptions
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.pin_state import PinStateTable
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.shared_pin_state import SharedPinStateTable
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.signal_filters import FilterPipeline
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.window_stats import WindowStats
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.link_clock import LinkClock
+from telemetrix_esp32_common import report_decoders
+from telemetrix_esp32_common.reports import PinReport, DhtReport, I2cReport, \
+    SpiReport, OneWireReport, StepperReport, WindowReport
+
+import serial
 
 import warnings
 
@@ -45,7 +69,18 @@ class TelemetrixEsp32(threading.Thread):
                  ip_port=31336, autostart=True,
                  shutdown_on_exception=True,
                  restart_on_shutdown=True,
-                 transport_is_wifi=True
+                 transport_is_wifi=True,
+                 blocking_send=True,
+                 transport_options=None,
+                 com_port=None,
+                 reactor=None,
+                 auto_reconnect=False,
+                 connection_callback=None,
+                 stall_callback=None,
+                 report_objects=False,
+                 payload_format='list',
+                 pin_state_cache=False,
+                 shared_pin_state=None
                  ):
 
         """
@@ -70,6 +105,71 @@ class TelemetrixEsp32(threading.Thread):
 
         :param transport_is_wifi: Set to True forWI-FI or False for BLE
 
+        :param blocking_send: If True, API calls return after their command
+                              has been written to the link. If False, API calls
+                              return as soon as the command is queued for the
+                              writer thread.
+
+        :param transport_options: A TransportOptions instance with link
+                                  tuning parameters, such as WI-FI socket
+                                  options and the serial baud rate. If None,
+                                  the low latency defaults are used.
+
+        :param com_port: Serial port name, for example '/dev/ttyUSB0'.
+                         If specified, the USB serial transport is used and
+                         transport_is_wifi is ignored.
+
+        :param reactor: An IoReactor shared by many WI-FI boards. If specified,
+                        the reactor receives and dispatches this board's
+                        reports, and commands are written on the caller's
+                        thread. The reactor's dispatch workers also send
+                        heartbeats, flush the output shaper and end
+                        aggregation windows, so the board does not start
+                        its own threads.
+
+        :param auto_reconnect: If True, a lost connection is reopened
+                               automatically, and the recorded pin mode and
+                               device configuration is replayed. The delays
+                               between attempts are set in transport_options.
+
+        :param connection_callback: optional function called with False when
+                                    the connection is lost and with True when
+                                    it has been restored.
+
+        :param stall_callback: optional function called with True when the
+                               link stalls and with False when replies resume.
+                               If auto_reconnect is set, a stalled link is
+                               also treated as lost and reopened. The
+                               heartbeat that detects stalls is set in
+                               transport_options.
+
+        :param report_objects: If True, callbacks receive report objects with
+                               named fields, defined in
+                               telemetrix_esp32_common.reports, instead of
+                               report lists.
+
+        :param payload_format: format of the data bytes in i2c, SPI and
+                               OneWire reports. 'list' delivers the data as
+                               individual integers in the report list.
+                               'bytes' or 'memoryview' deliver them as a
+                               single bytes or memoryview payload, suitable
+                               for struct.unpack_from or numpy.frombuffer.
+
+        :param pin_state_cache: If True, the latest value of every digital,
+                                analog, touch, sonar and DHT input is kept
+                                and can be polled with get_digital,
+                                get_analog, get_touch, get_sonar, get_dht
+                                and get_pin_snapshot. Input pins may then
+                                be set without a callback.
+
+        :param shared_pin_state: name of a shared memory segment to create.
+                                 If set, the pin state cache is enabled and
+                                 kept in the segment, so that other
+                                 processes can read it with
+                                 SharedPinStateTable(name, create=False).
+                                 Stepper positions are included. The
+                                 segment is removed by shutdown.
+
         """
 
         if sys.platform == 'win32':
@@ -85,21 +185,58 @@ class TelemetrixEsp32(threading.Thread):
                                    "required for use of this program.")
 
         # save input parameters
+        if transport_options is None:
+            transport_options = TransportOptions()
+        self.transport_options = transport_options
+
         self.transport_address = transport_address
         self.ip_port = ip_port
         self.autostart = autostart
         self.shutdown_on_exception = shutdown_on_exception
         self.restart_on_shutdown = restart_on_shutdown,
         self.transport_is_wifi = transport_is_wifi
+        self.blocking_send = blocking_send
+        self.com_port = com_port
+        self.baud_rate = self.transport_options.baud_rate
+        self.transport_is_serial = com_port is not None
+        self.reactor = reactor
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_min_delay = self.transport_options.reconnect_min_delay
+        self.reconnect_max_delay = self.transport_options.reconnect_max_delay
+        self.connection_callback = connection_callback
+        self.heartbeat_interval = self.transport_options.heartbeat_interval
+        self.heartbeat_misses = self.transport_options.heartbeat_misses
+        self.stall_callback = stall_callback
+        self.report_objects = report_objects
+
+        if payload_format not in ['list', 'bytes', 'memoryview']:
+            raise RuntimeError(f'Unknown payload format: {payload_format}')
+        self.payload_format = payload_format
+
+        # latest input values, if enabled
+        if shared_pin_state:
+            self.pin_states = SharedPinStateTable(shared_pin_state)
+        elif pin_state_cache:
+            self.pin_states = PinStateTable()
+        else:
+            self.pin_states = None
+
+        if self.reactor and (self.transport_is_serial or not self.transport_is_wifi):
+            raise RuntimeError('A reactor may only be used with the WI-FI transport.')
+
+        # serial port for the USB serial transport. It is opened by start_tmx.
+        self.serial_port = None
 
-        if self.transport_is_wifi:
+        if self.transport_is_wifi and not self.transport_is_serial:
             if not self.transport_address:
                 raise RuntimeError("An IP address must be specified.")
 
-        else:
+        elif not self.transport_is_serial:
             self.ble = BLERadio()
             self.uart_connection = None
             self.ble_client = None
+            self.ble_address_cache = BleAddressCache() \
+                if self.transport_options.cache_ble_address else None
 
         # initialize threading parent
         threading.Thread.__init__(self)
@@ -116,12 +253,120 @@ class TelemetrixEsp32(threading.Thread):
         self.the_data_receive_thread = threading.Thread(target=self._link_receiver)
         self.the_data_receive_thread.daemon = True
 
+        # a thread to write queued commands to the link
+        self.the_data_send_thread = threading.Thread(target=self._link_writer)
+        self.the_data_send_thread.daemon = True
+
+        # queue of outgoing frames. Each entry is a list of
+        # [frame bytes, completion event or None, exception or None].
+        # deque append and popleft are thread safe. Producers only lock
+        # writer_lock, which is never held during a write.
+        self.send_queue = deque()
+
+        # priority lane for stop and emergency commands.
+        # It is always emptied before any frame on send_queue is written.
+        self.urgent_send_queue = deque()
+
+        # set when frames are added to the send queue
+        self.send_event = threading.Event()
+
+        # serializes writes to the link between the writer thread and
+        # commands sent directly during shutdown
+        self.send_lock = threading.Lock()
+
+        # True while the writer thread accepts frames. Checked and changed
+        # under writer_lock, so no frame is queued after the writer stops.
+        self.writer_running = False
+        self.writer_lock = threading.Lock()
+
+        # number of failed link writes
+        self.send_errors = 0
+
+        # configuration commands to replay after a reconnect
+        self.config_journal = ConfigJournal()
+
+        # set while the link is open. The receive and send threads
+        # wait on it while a lost connection is being reopened.
+        self.link_up = threading.Event()
+
+        # a thread that reopens a lost connection
+        self.the_reconnect_thread = None
+
+        # connection statistics
+        self.connection_drops = 0
+        self.reconnects = 0
+        self.last_recovery_time = None
+
+        # a thread to send heartbeats and detect a stalled link.
+        # It is started by start_tmx if heartbeat_interval is set
+        # and no reactor is used.
+        self.the_heartbeat_thread = threading.Thread(target=self._heartbeat)
+        self.the_heartbeat_thread.daemon = True
+
+        # set to wake the heartbeat thread at shutdown
+        self.heartbeat_event = threading.Event()
+
+        # set while the link is stalled
+        self.link_stalled = threading.Event()
+
+        # number of heartbeats sent since the last reply
+        self.heartbeats_outstanding = 0
+
+        # time.monotonic_ns() value when the last heartbeat was sent
+        self.heartbeat_sent_time = None
+
+        # time.monotonic() value when the reactor sends the next heartbeat
+        self.heartbeat_due = None
+
+        # converts receive stamps into report time stamps
+        self.link_clock = LinkClock()
+
+        # time.monotonic_ns() when the data being dispatched was received,
+        # and the time stamp given to its reports
+        self.receive_time_ns = time.monotonic_ns()
+        self.report_time = time.time()
+
+        # time.monotonic_ns() when the pending clock synchronization
+        # request was sent, and the event set by its reply
+        self.clock_sync_sent_time = None
+        self.clock_sync_event = threading.Event()
+
+        # heartbeat statistics
+        self.stalls = 0
+        self.heartbeat_round_trip = None
+
         # flag to allow the reporter and receive threads to run.
         self.run_event = threading.Event()
 
+        # rate limiter for servo_write and analog_write
+        self.output_shaper = OutputShaper()
+
+        # set when a write is held back by the output shaper
+        self.output_shaper_event = threading.Event()
+
+        # a thread to send held back writes when they become due.
+        # It is started by set_output_rate if no reactor is used.
+        self.the_output_shaper_thread = \
+            threading.Thread(target=self._output_shaper_flusher)
+        self.the_output_shaper_thread.daemon = True
+
         # dictionaries to store the callbacks for each pin
         self.analog_callbacks = {}
 
+        # host side filters for analog inputs, keyed by pin
+        self.analog_filters = {}
+
+        # pins with filtered samples waiting to be delivered
+        self.filters_pending = set()
+
+        # serializes set_analog_filter with the reporter thread's use of
+        # analog_filters and filters_pending. It is reentrant, so a
+        # callback may change the filters.
+        self.analog_filter_lock = threading.RLock()
+
+        # per window statistics of aggregated analog, touch and sonar inputs
+        self.window_stats = WindowStats()
+
         self.digital_callbacks = {}
 
         self.i2c_callback = None
@@ -143,6 +388,13 @@ class TelemetrixEsp32(threading.Thread):
         # debug loopback callback method
         self.loop_back_callback = None
 
+        # (data byte, reply handler) for each loop back request waiting
+        # for its reply, in the order sent. The ESP32 answers them in
+        # order, so a reply belongs to the oldest request for its byte.
+        self.loop_back_pending = deque(
+            maxlen=PrivateConstants.MAX_LOOP_BACK_PENDING)
+        self.loop_back_lock = threading.Lock()
+
         # the trigger pin will be the key to retrieve
         # the callback for a specific HC-SR04
         self.sonar_callbacks = {}
@@ -157,6 +409,9 @@ class TelemetrixEsp32(threading.Thread):
         # callbacks for touch pins
         self.touch_callbacks = {}
 
+        # pins with a registered callback, checked before a report is decoded
+        self.report_subscriptions = ReportSubscriptions()
+
         # flag to indicate we are in shutdown mode
         self.shutdown_flag = False
 
@@ -174,9 +429,17 @@ class TelemetrixEsp32(threading.Thread):
         # ble connection status
         self.ble_connected = False
 
-        # create a deque to receive incoming data
+        # create a deque to receive incoming packets. Each entry is a
+        # (receive time, list of packets) tuple.
         self.the_deque = deque()
 
+        # reassembles packets from the received byte stream and skips
+        # the reports nobody subscribed to
+        self.framer = PacketFramer(self.report_subscriptions)
+
+        # set when packets are added to the deque
+        self.packet_event = threading.Event()
+
         # The report dispatcher table. It maps each report type
         # to its processing method.
         # To add a command to the report dispatch table, append here.
@@ -290,57 +553,28 @@ class TelemetrixEsp32(threading.Thread):
         This method may be called directly, if the autostart
         parameter in __init__ is set to false.
 
-        This method instantiates the WI-FI transport
+        This method instantiates the WI-FI, BLE or serial transport
 
         Use this method if you wish to start manually.
          """
-
-        # WI-FI was selected
-        if self.transport_is_wifi:
-            # establish the TCP/IP socket and connect to the ESP32 board
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect((self.transport_address, self.ip_port))
-            print(f'Successfully connected to: {self.transport_address}:{self.ip_port}')
-        # BLE was selected
-        else:
+        if not self.transport_is_serial and not self.transport_is_wifi:
             if self.ble_connected:
                 raise RuntimeError('ble_aio_transport: connect - Already connected')
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                print('Retrieving BLE Mac Address of Ble Device. Please wait...')
-
-                found = False
-                first_found = None
-                # for adv in self. ble.start_scan(ProvideServicesAdvertisement):
-                for adv in self.ble.start_scan(timeout = 60):
-                    if not first_found:
-                        first_found = adv.complete_name
-                    else:
-                        if adv.complete_name == first_found:
-                            raise RuntimeError("Unable to find the server.")
-                    if not self.transport_address:
-                        if adv.complete_name == 'Telemetrix4ESP32BLE':
-                            found = True
-                    elif adv.address.string == self.transport_address:
-                        found = True
-                    if found:
-                        self.ble_connected = True
-                        uart_connection = self.ble.connect(adv)
-                        self.ble_client = uart_connection[UARTService]
-
-                        print(f'Connection successful: {adv.complete_name} - '
-                              f'{adv.address.string}')
-                        self.ble.stop_scan()
-                        time.sleep(.5)
-                        break
-                    else:
-                        continue
-                # ble.stop_scan()
 
-        # start the library threads
-        self.the_reporter_thread.start()
-        self.the_data_receive_thread.start()
-        self._run_threads()
+        self._open_link()
+        self.link_up.set()
+
+        if self.reactor:
+            # the shared reactor services the socket
+            self._run_threads()
+            self.reactor.register(self)
+        else:
+            # start the library threads
+            self.the_reporter_thread.start()
+            self.the_data_receive_thread.start()
+            self.writer_running = True
+            self.the_data_send_thread.start()
+            self._run_threads()
 
         self._get_firmware_version()
 
@@ -352,7 +586,11 @@ class TelemetrixEsp32(threading.Thread):
                 self.shutdown()
             raise RuntimeError('Could not retrieve server firmware version')
 
-        if self.transport_is_wifi:
+        if self.transport_is_serial:
+            print(f'Telemetrix4Esp32Serial Firmware Version: {self.firmware_version[0]}'
+                  f'.{self.firmware_version[1]}.{self.firmware_version[2]}')
+
+        elif self.transport_is_wifi:
             print(f'Telemetrix4Esp32WIFI Firmware Version: {self.firmware_version[0]}'
                 f'.{self.firmware_version[1]}.{self.firmware_version[2]}')
 
@@ -365,6 +603,120 @@ class TelemetrixEsp32(threading.Thread):
 
         self._send_command(command)
 
+        if self.heartbeat_interval:
+            if self.reactor:
+                self.heartbeat_due = time.monotonic() + self.heartbeat_interval
+                self.reactor.schedule(self)
+            else:
+                self.the_heartbeat_thread.start()
+
+    def _open_link(self):
+        """
+        This is a private method.
+        Open the serial, WI-FI or BLE transport.
+        """
+        # serial was selected
+        if self.transport_is_serial:
+            # the read timeout lets the receive thread check for shutdown
+            self.serial_port = serial.Serial(self.com_port, self.baud_rate,
+                                             timeout=.1, write_timeout=1)
+            # opening the port resets the ESP32 - wait for it to boot and
+            # discard its boot messages
+            time.sleep(PrivateConstants.SERIAL_BOOT_WAIT)
+            self.serial_port.reset_input_buffer()
+            print(f'Successfully connected to: {self.com_port}')
+
+        # WI-FI was selected
+        elif self.transport_is_wifi:
+            # establish the TCP/IP socket and connect to the ESP32 board
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.transport_options.apply(sock)
+            sock.settimeout(self.transport_options.connect_timeout)
+            try:
+                sock.connect((self.transport_address, self.ip_port))
+            except OSError:
+                sock.close()
+                raise
+            # the socket timeout bounds writes. Reads wait in select,
+            # so the read timeout does not apply to sendall.
+            sock.settimeout(self.transport_options.write_timeout)
+            self.sock = sock
+            print(f'Successfully connected to: {self.transport_address}:{self.ip_port}')
+        # BLE was selected
+        else:
+            self._ble_connect()
+
+    def _close_link(self):
+        """
+        This is a private method.
+        Close the transport. Errors are ignored.
+        """
+        try:
+            if self.transport_is_serial:
+                self.serial_port.close()
+            elif self.transport_is_wifi:
+                # shutdown wakes a receive thread blocked on the socket
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self.sock.close()
+            else:
+                self.ble_connected = False
+                self.uart_connection.disconnect()
+        except Exception:
+            pass
+
+    def _ble_connect(self):
+        """
+        This is a private method.
+        Find the BLE server and connect to it.
+
+        Scanning stops at the first advertisement that matches the user
+        specified address. If no address was specified, it stops at the first
+        advertisement from the cached address of the last connection, or
+        from a device named Telemetrix4ESP32BLE. A device that does not
+        advertise a name matches if it provides the Nordic UART service.
+        """
+        target_address = self.transport_address
+        cached_address = None
+        if not target_address and self.ble_address_cache:
+            cached_address = self.ble_address_cache.get(
+                PrivateConstants.BLE_DEVICE_NAME)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            print('Retrieving BLE Mac Address of Ble Device. Please wait...')
+
+            for adv in self.ble.start_scan(ProvideServicesAdvertisement, Advertisement,
+                                           timeout=PrivateConstants.BLE_SCAN_TIMEOUT):
+                address = adv.address.string
+                if target_address:
+                    found = address == target_address
+                elif address == cached_address:
+                    found = True
+                elif adv.complete_name:
+                    found = adv.complete_name == PrivateConstants.BLE_DEVICE_NAME
+                else:
+                    found = isinstance(adv, ProvideServicesAdvertisement) and \
+                            UARTService in adv.services
+
+                if found:
+                    self.ble.stop_scan()
+                    self.uart_connection = self.ble.connect(adv)
+                    self.ble_client = self.uart_connection[UARTService]
+                    self.ble_connected = True
+
+                    print(f'Connection successful: {adv.complete_name} - '
+                          f'{address}')
+                    if not target_address and self.ble_address_cache:
+                        self.ble_address_cache.put(PrivateConstants.BLE_DEVICE_NAME,
+                                                   address)
+                    time.sleep(.5)
+                    break
+            else:
+                raise RuntimeError("Unable to find the server.")
+
     def _get_firmware_version(self):
         """
         This method retrieves the Telemetrix4Esp32BLE firmware version
@@ -388,7 +740,7 @@ class TelemetrixEsp32(threading.Thread):
         value_msb = value >> 8
         value_lsb = value & 0xff
         command = [PrivateConstants.ANALOG_WRITE, pin, value_msb, value_lsb]
-        self._send_command(command)
+        self._send_shaped_command(pin, command)
 
     def digital_write(self, pin, value):
         """
@@ -553,10 +905,9 @@ class TelemetrixEsp32(threading.Thread):
             if self.shutdown_on_exception:
                 self.shutdown()
             raise RuntimeError('loop_back: A callback function must be specified.')
-        command = [PrivateConstants.LOOP_COMMAND, ord(start_character)]
 
         self.loop_back_callback = callback
-        self._send_command(command)
+        self._send_loop_back(ord(start_character), callback)
 
     def set_analog_scan_interval(self, interval):
         """
@@ -573,7 +924,47 @@ class TelemetrixEsp32(threading.Thread):
                 self.shutdown()
             raise RuntimeError('Analog interval must be between 0 and 255')
 
-    def set_pin_mode_analog_input(self, pin_number, differential=0, callback=None):
+    def set_analog_filter(self, pin_number, filters=None):
+        """
+        Filter the reports of an analog input on the host before they are
+        passed to its callback. Requires numpy.
+
+        Samples are filtered in batches, made of the reports received
+        together, so callbacks for a filtered pin may be delayed until
+        the batch is complete. Callback values are floats.
+        The pin state cache keeps the unfiltered values.
+
+        :param pin_number: GPIO pin number
+
+        :param filters: list of filter stages, applied in order.
+                        None removes the pin's filters.
+
+                        ('moving_average', window)
+                        ('median', window)
+                        ('ema', alpha)
+                        ('low_pass', cutoff frequency in Hz)
+
+        example: set_analog_filter(36, [('median', 5), ('ema', .2)])
+        """
+        pipeline = None
+        if filters:
+            try:
+                pipeline = FilterPipeline(filters)
+            except RuntimeError:
+                if self.shutdown_on_exception:
+                    self.shutdown()
+                raise
+
+        with self.analog_filter_lock:
+            if pin_number in self.analog_filters:
+                # deliver the samples queued for the current filters first
+                self._run_analog_filter(pin_number)
+                del self.analog_filters[pin_number]
+            if pipeline:
+                self.analog_filters[pin_number] = pipeline
+
+    def set_pin_mode_analog_input(self, pin_number, differential=0, callback=None,
+                                  aggregate=None):
         """
         Set a pin as an analog input.
 
@@ -594,15 +985,23 @@ class TelemetrixEsp32(threading.Thread):
 
         The report_type for analog input pins = 2
 
+        :param aggregate: window length in seconds. If set, the callback
+                          is called once per window with the statistics of
+                          the window's reports instead of once per report:
+
+                          [report_type, pin_number, minimum, maximum, mean,
+                           count, first_time_stamp, last_time_stamp]
+
         """
 
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 self.shutdown()
             raise RuntimeError(
                 'set_pin_mode_analog_input: A callback function must be specified.')
 
         if pin_number in self.valid_analog_in_pins:
+            self._set_aggregation('analog', pin_number, aggregate)
             self._set_pin_mode(pin_number, PrivateConstants.AT_ANALOG,
                                differential, callback=callback)
         else:
@@ -644,6 +1043,7 @@ class TelemetrixEsp32(threading.Thread):
                         freq_array = bytearray(struct.pack("d", frequency))
                         for value in freq_array:
                             command.append(value)
+                        self._release_input(pin_number)
                         self._send_command(command)
                     else:
                         if self.shutdown_on_exception:
@@ -752,7 +1152,7 @@ class TelemetrixEsp32(threading.Thread):
                 self.shutdown()
             raise RuntimeError('dac_disable: Invalid pin number')
 
-    def set_pin_mode_digital_input(self, pin_number, callback):
+    def set_pin_mode_digital_input(self, pin_number, callback=None):
         """
         Set a pin as a digital input.
 
@@ -779,7 +1179,7 @@ class TelemetrixEsp32(threading.Thread):
                 self.shutdown()
             raise RuntimeError('set_pin_mode_digital_input: Invalid GPIO pin number')
 
-    def set_pin_mode_digital_input_pulldown(self, pin_number, callback):
+    def set_pin_mode_digital_input_pulldown(self, pin_number, callback=None):
         """
         Set a pin as a digital input with pulldown enabled.
 
@@ -798,7 +1198,7 @@ class TelemetrixEsp32(threading.Thread):
         The report_type for digital input pins with pull_downs enabled = 2
 
         """
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 self.shutdown()
             raise RuntimeError(
@@ -814,7 +1214,7 @@ class TelemetrixEsp32(threading.Thread):
             raise RuntimeError(
                 'set_pin_mode_digital_input_pulldown: Invalid GPIO pin number')
 
-    def set_pin_mode_digital_input_pullup(self, pin_number, callback):
+    def set_pin_mode_digital_input_pullup(self, pin_number, callback=None):
         """
         Set a pin as a digital input with pullup enabled.
 
@@ -833,7 +1233,7 @@ class TelemetrixEsp32(threading.Thread):
         The report_type for digital input pins with pullups enabled = 2
 
         """
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 self.shutdown()
             raise RuntimeError(
@@ -894,7 +1294,7 @@ class TelemetrixEsp32(threading.Thread):
         command = [PrivateConstants.I2C_BEGIN]
         self._send_command(command)
 
-    def set_pin_mode_dht(self, pin_number, callback):
+    def set_pin_mode_dht(self, pin_number, callback=None):
         """
 
         :param pin_number: connection pin.
@@ -931,7 +1331,7 @@ class TelemetrixEsp32(threading.Thread):
 
         """
 
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 self.shutdown()
             raise RuntimeError('set_pin_mode_dht: A Callback must be specified')
@@ -939,6 +1339,8 @@ class TelemetrixEsp32(threading.Thread):
         if pin_number in self.valid_gpio_input_pins:
             if self.dht_count < PrivateConstants.MAX_DHTS - 1:
                 self.dht_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DHT_REPORT, pin_number)
                 self.dht_count += 1
                 command = [PrivateConstants.DHT_NEW, pin_number]
                 self._send_command(command)
@@ -976,6 +1378,7 @@ class TelemetrixEsp32(threading.Thread):
 
             command = [PrivateConstants.SERVO_ATTACH, pin_number,
                        minv[0], minv[1], maxv[0], maxv[1]]
+            self._release_input(pin_number)
             self._send_command(command)
         else:
             if self.shutdown_on_exception:
@@ -983,7 +1386,7 @@ class TelemetrixEsp32(threading.Thread):
             raise RuntimeError('set_pin_mode_servo: Invalid GPIO pin number')
 
     def set_pin_mode_sonar(self, trigger_pin, echo_pin,
-                           callback):
+                           callback=None, aggregate=None):
         """
         Attach pins to a sonar device. Trigger and echo pins must not be the same value.
         Distance is reported in centimeters.
@@ -1004,9 +1407,16 @@ class TelemetrixEsp32(threading.Thread):
 
         report_type = 10
 
+        :param aggregate: window length in seconds. If set, the callback
+                          is called once per window with the statistics of
+                          the window's reports instead of once per report:
+
+                          [report_type, trigger_pin, minimum, maximum, mean,
+                           count, first_time_stamp, last_time_stamp]
+
         """
 
-        if not callback:
+        if not callback and not self.pin_states:
             if self.shutdown_on_exception:
                 self.shutdown()
             raise RuntimeError('set_pin_mode_sonar: A Callback must be specified')
@@ -1014,7 +1424,10 @@ class TelemetrixEsp32(threading.Thread):
         if trigger_pin in self.valid_gpio_input_pins:
             if echo_pin in self.valid_gpio_input_pins:
                 if self.sonar_count < PrivateConstants.MAX_SONARS - 1:
+                    self._set_aggregation('sonar', trigger_pin, aggregate)
                     self.sonar_callbacks[trigger_pin] = callback
+                    self.report_subscriptions.subscribe(
+                        PrivateConstants.SONAR_DISTANCE, trigger_pin)
                     self.sonar_count += 1
 
                     command = [PrivateConstants.SONAR_NEW, trigger_pin, echo_pin]
@@ -1074,7 +1487,8 @@ class TelemetrixEsp32(threading.Thread):
             self.cs_pins_enabled.append(pin)
         self._send_command(command)
 
-    def set_pin_mode_touch(self, pin_number, differential=0, callback=None):
+    def set_pin_mode_touch(self, pin_number, differential=0, callback=None,
+                           aggregate=None):
         """
         Set a pin to touch mode
 
@@ -1096,8 +1510,16 @@ class TelemetrixEsp32(threading.Thread):
 
         The report_type for touch pins = 13
 
+        :param aggregate: window length in seconds. If set, the callback
+                          is called once per window with the statistics of
+                          the window's reports instead of once per report:
+
+                          [report_type, pin_number, minimum, maximum, mean,
+                           count, first_time_stamp, last_time_stamp]
+
         """
         if pin_number in self.valid_touch_pins:
+            self._set_aggregation('touch', pin_number, aggregate)
             self._set_pin_mode(pin_number, PrivateConstants.AT_TOUCH, differential,
                                callback)
         else:
@@ -1105,6 +1527,22 @@ class TelemetrixEsp32(threading.Thread):
                 self.shutdown()
             raise RuntimeError('set_pin_mode_touch: Invalid GPIO pin number')
 
+    def _release_input(self, pin_number):
+        """
+        This is a private method.
+        Forget the input callbacks of a pin that is given a new mode and
+        unsubscribe from its reports, so that reports still in flight are
+        skipped before they are decoded.
+
+        :param pin_number: GPIO pin number
+        """
+        for callbacks, report_type in \
+                ((self.digital_callbacks, PrivateConstants.DIGITAL_REPORT),
+                 (self.analog_callbacks, PrivateConstants.ANALOG_REPORT),
+                 (self.touch_callbacks, PrivateConstants.TOUCH_REPORT)):
+            callbacks.pop(pin_number, None)
+            self.report_subscriptions.unsubscribe(report_type, pin_number)
+
     def _set_pin_mode(self, pin_number, pin_state, differential, callback):
         """
         A private method to set the various pin modes.
@@ -1123,21 +1561,33 @@ class TelemetrixEsp32(threading.Thread):
                          called when pin data value changes
 
         """
-        if not callback and pin_state != PrivateConstants.AT_OUTPUT:
+        if not callback and not self.pin_states and pin_state != PrivateConstants.AT_OUTPUT:
             if self.shutdown_on_exception:
                 self.shutdown()
             raise RuntimeError('_set_pin_mode: A Callback must be specified')
         else:
+            # a previous input mode of the pin no longer reports
+            self._release_input(pin_number)
             if pin_state == PrivateConstants.AT_INPUT:
                 self.digital_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DIGITAL_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_INPUT_PULLUP:
                 self.digital_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DIGITAL_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_INPUT_PULL_DOWN:
                 self.digital_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.DIGITAL_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_ANALOG:
                 self.analog_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.ANALOG_REPORT, pin_number)
             elif pin_state == PrivateConstants.AT_TOUCH:
                 self.touch_callbacks[pin_number] = callback
+                self.report_subscriptions.subscribe(
+                    PrivateConstants.TOUCH_REPORT, pin_number)
 
         if pin_state == PrivateConstants.AT_INPUT:
             command = [PrivateConstants.SET_PIN_MODE, pin_number,
@@ -1671,7 +2121,7 @@ class TelemetrixEsp32(threading.Thread):
             raise RuntimeError('stepper_stop: Invalid motor_id.')
 
         command = [PrivateConstants.STEPPER_STOP, motor_id]
-        self._send_command(command)
+        self._send_command(command, urgent=True)
 
     def stepper_disable_outputs(self, motor_id):
         """
@@ -2230,7 +2680,79 @@ class TelemetrixEsp32(threading.Thread):
 
         """
         command = [PrivateConstants.SERVO_WRITE, pin_number, angle]
-        self._send_command(command)
+        self._send_shaped_command(pin_number, command)
+
+    def set_output_rate(self, max_rate, pin_number=None, output_type=None):
+        """
+        Limit the rate at which servo_write and analog_write commands are
+        sent to the ESP32.
+
+        While a pin is waiting for its next send slot, only the latest value
+        written to it is kept. Older values are discarded and counted as
+        collapsed writes.
+
+        :param max_rate: maximum number of writes per second.
+                         None or 0 removes the limit.
+
+        :param pin_number: pin to limit. If None, the rate applies to every pin
+                           that does not have its own rate.
+
+        :param output_type: 'servo' or 'analog' to limit only servo_write or
+                            analog_write commands for the pin.
+                            None limits both.
+        """
+        command_ids = self._output_command_ids(output_type)
+        try:
+            self.output_shaper.set_rate(max_rate, pin_number, command_ids)
+        except RuntimeError:
+            if self.shutdown_on_exception:
+                self.shutdown()
+            raise
+
+        if self.reactor:
+            # the reactor's dispatch worker flushes held back writes
+            return
+
+        if not self.the_output_shaper_thread.is_alive():
+            if self.the_output_shaper_thread.ident is not None:
+                # the thread has exited, and a thread can only be started once
+                self.the_output_shaper_thread = \
+                    threading.Thread(target=self._output_shaper_flusher)
+                self.the_output_shaper_thread.daemon = True
+            self.the_output_shaper_thread.start()
+
+    def _output_command_ids(self, output_type):
+        """
+        This is a private utility method.
+
+        :param output_type: 'servo', 'analog' or None for both
+
+        :return: ids of the commands shaped for the output type
+        """
+        command_ids = {'servo': (PrivateConstants.SERVO_WRITE,),
+                       'analog': (PrivateConstants.ANALOG_WRITE,),
+                       None: (PrivateConstants.SERVO_WRITE,
+                              PrivateConstants.ANALOG_WRITE)}
+        if output_type not in command_ids:
+            if self.shutdown_on_exception:
+                self.shutdown()
+            raise RuntimeError('set_output_rate: output_type must be servo or analog')
+        return command_ids[output_type]
+
+    def get_output_shaper_statistics(self):
+        """
+        Retrieve the output shaper counters.
+
+        :return: dictionary with the following keys:
+
+                 collapsed_writes - writes replaced by a newer value before
+                                    being sent
+
+                 sent_writes - shaped writes sent to the ESP32
+
+                 pending_writes - writes currently waiting for a send slot
+        """
+        return self.output_shaper.statistics()
 
     def shutdown(self):
         """
@@ -2242,14 +2764,31 @@ class TelemetrixEsp32(threading.Thread):
 
         self._stop_threads()
 
+        if self.reactor:
+            self.reactor.unregister(self)
+
+        # release the output shaper, writer, receiver and reporter threads
+        self.output_shaper_event.set()
+        self.send_event.set()
+        self.packet_event.set()
+        self.link_up.set()
+        self.heartbeat_event.set()
+
         # stop all reporting - both analog and digital
         command = [PrivateConstants.STOP_ALL_REPORTS]
-        self._send_command(command)
+        self._send_command(command, urgent=True)
+
+        # write anything still queued and release any waiting callers
+        self._drain_send_queue()
+
         if self.restart_on_shutdown:
             command = [PrivateConstants.RESET]
-            self._send_command(command)
+            self._send_command(command, urgent=True)
             time.sleep(.1)
 
+        if self.pin_states:
+            self.pin_states.close()
+
     def disable_all_reporting(self):
         """
         Disable reporting for all digital and analog input pins
@@ -2306,9 +2845,11 @@ class TelemetrixEsp32(threading.Thread):
 
     def _ble_report_dispatcher(self, sender=None, data=None):
         """
-        This is a private method called by the incoming data notifier
+        This is a private method called with incoming BLE data.
 
-        Using the report identifier, the report handler is fetched from report_dispatch.
+        A notification may hold part of a packet or several packets, so the
+        data is passed through the packet framer. Complete packets are placed
+        onto the deque for the reporter thread.
 
         :param sender: BLE sender ID
         :param data: data received over the ble link
@@ -2316,58 +2857,66 @@ class TelemetrixEsp32(threading.Thread):
         """
         self.the_sender = sender
         if data:
-            report = data[1]
-
-            # noinspection PyArgumentList
-            self.report_dispatch[report](data[2:])
+            self._queue_packets(self.framer.feed(data))
 
     # noinspection PyArgumentList
     def report_dispatcher(self):
         """
-        This is the reporter thread. It continuously pulls data from
-        the deque. When a full message is detected, that message is
-        processed.
+        This is the reporter thread. It continuously pulls complete packets
+        from the deque and dispatches them to their report handlers.
         """
         self.run_event.wait()
 
         while self._is_running() and not self.shutdown_flag:
+            timeout = .5
+            if self.window_stats.enabled:
+                # aggregation windows end even when no report arrives
+                wait_time = self._expire_windows()
+                if wait_time is not None:
+                    timeout = min(timeout, wait_time)
+
             if len(self.the_deque):
-                # response_data will be populated with the received data for the report
-                response_data = []
-                packet_length = self.the_deque.popleft()
-                if packet_length:
-                    # get all the data for the report and place it into response_data
-                    for i in range(packet_length):
-                        while not len(self.the_deque):
-                            time.sleep(.0001)
-                        data = self.the_deque.popleft()
-                        response_data.append(data)
-
-                    # print(f'response_data: {response_data}')
-
-                    # get the report type and look up its dispatch method
-                    # here we pop the report type off of response_data
-                    report_type = response_data.pop(0)
-                    # print(report_type)
-
-                    # retrieve the report handler from the dispatch table
-                    dispatch_entry = self.report_dispatch.get(report_type)
-
-                    # if there is additional data for the report,
-                    # it will be contained in response_data
-                    # noinspection PyArgumentList
-                    try:
-                        dispatch_entry(response_data)
-                        continue
-                    except TypeError:
-                        continue
-                else:
-                    if self.shutdown_on_exception:
-                        self.shutdown()
-                    raise RuntimeError(
-                        'A report with a packet length of zero was received.')
-            # else:
-            #     time.sleep(self.sleep_tune)
+                receive_time, packets = self.the_deque.popleft()
+                self._set_receive_time(receive_time)
+                for packet in packets:
+                    self._dispatch_packet(packet)
+                if self.filters_pending and not self.the_deque:
+                    self._flush_analog_filters()
+            else:
+                # sleep until the receiver queues a packet. The event is
+                # cleared before the deque is checked again, so a packet
+                # queued in between is not missed.
+                self.packet_event.clear()
+                if not self.the_deque:
+                    self.packet_event.wait(timeout)
+
+    # noinspection PyArgumentList
+    def _dispatch_packet(self, packet):
+        """
+        This is a private utility method.
+        Look up the handler for a packet's report type and call it.
+
+        :param packet: complete packet. The first byte is the report type.
+        """
+        if packet:
+            # the first byte of the packet is the report type
+            report_type = packet[0]
+
+            # retrieve the report handler from the dispatch table
+            dispatch_entry = self.report_dispatch.get(report_type)
+
+            # if there is additional data for the report,
+            # it follows the report type
+            # noinspection PyArgumentList
+            try:
+                dispatch_entry(packet[1:])
+            except TypeError:
+                pass
+        else:
+            if self.shutdown_on_exception:
+                self.shutdown()
+            raise RuntimeError(
+                'A report with a packet length of zero was received.')
 
     '''
     Report message handlers
@@ -2379,8 +2928,9 @@ class TelemetrixEsp32(threading.Thread):
 
         :param data: byte of loop back data
         """
-        if self.loop_back_callback:
-            self.loop_back_callback(data)
+        handler = self._loop_back_handler(data)
+        if handler:
+            handler(list(data))
 
     # noinspection PyMethodMayBeStatic
     def _report_debug_data(self, data):
@@ -2390,8 +2940,8 @@ class TelemetrixEsp32(threading.Thread):
         :param data: data[0] is a byte followed by 2
                      bytes that comprise an integer
         """
-        value = (data[1] << 8) + data[2]
-        print(f'DEBUG ID: {data[0]} Value: {value}')
+        debug_id, value = report_decoders.DEBUG_VALUE.unpack_from(data)
+        print(f'DEBUG ID: {debug_id} Value: {value}')
 
     def _analog_message(self, data):
         """
@@ -2401,16 +2951,162 @@ class TelemetrixEsp32(threading.Thread):
         :param data: message data
 
         """
-        data = list(data)
-        pin = data[0]
-        value = (data[1] << 8) + data[2]
+        pin, value = report_decoders.PIN_VALUE.unpack_from(data)
+
+        time_stamp = self.report_time
+
+        if self.pin_states:
+            self.pin_states.update('analog', pin, value, time_stamp)
+
+        if self.analog_filters:
+            with self.analog_filter_lock:
+                pipeline = self.analog_filters.get(pin)
+                if pipeline:
+                    # the sample is delivered when its batch is filtered
+                    self.filters_pending.add(pin)
+                    if pipeline.add(value, time_stamp):
+                        self._run_analog_filter(pin)
+                    return
+
+        self._deliver_analog(pin, value, time_stamp)
+
+    def _deliver_analog(self, pin, value, time_stamp):
+        """
+        This is a private method.
+        Pass an analog value to the pin's callback.
+
+        :param pin: GPIO pin number
+
+        :param value: analog value
 
-        time_stamp = time.time()
+        :param time_stamp: time the value was received
+        """
+        if self.window_stats.active('analog', pin):
+            self._aggregate('analog', PrivateConstants.AT_ANALOG, pin, value,
+                            time_stamp, self.analog_callbacks.get(pin))
+            return
 
         # append pin number, pin value, and pin type to return value and return as a list
-        message = [PrivateConstants.AT_ANALOG, pin, value, time_stamp]
+        if self.report_objects:
+            message = PinReport(PrivateConstants.AT_ANALOG, pin, value, time_stamp)
+        else:
+            message = [PrivateConstants.AT_ANALOG, pin, value, time_stamp]
+
+        callback = self.analog_callbacks.get(pin)
+        if callback:
+            callback(message)
+
+    def _run_analog_filter(self, pin):
+        """
+        This is a private method.
+        Filter the samples waiting for a pin and deliver them.
+
+        :param pin: GPIO pin number
+        """
+        with self.analog_filter_lock:
+            self.filters_pending.discard(pin)
+            pipeline = self.analog_filters.get(pin)
+            if not pipeline:
+                return
+            values, time_stamps = pipeline.run()
+            for value, time_stamp in zip(values, time_stamps):
+                self._deliver_analog(pin, value, time_stamp)
+
+    def _flush_analog_filters(self):
+        """
+        This is a private method.
+        Filter and deliver the samples of all pins with waiting samples.
+        It is called when no more received reports are waiting.
+        """
+        with self.analog_filter_lock:
+            for pin in list(self.filters_pending):
+                self._run_analog_filter(pin)
+
+    def _set_aggregation(self, kind, pin_number, aggregate):
+        """
+        This is a private method.
+        Enable or disable window aggregation for an input.
+
+        :param kind: 'analog', 'touch' or 'sonar'
+
+        :param pin_number: GPIO pin number. For sonar, the trigger pin.
+
+        :param aggregate: window length in seconds or None
+        """
+        try:
+            self.window_stats.configure(kind, pin_number, aggregate)
+        except RuntimeError:
+            if self.shutdown_on_exception:
+                self.shutdown()
+            raise
+
+        if self.reactor:
+            # the reactor's dispatch worker ends the windows
+            self.reactor.schedule(self)
+
+    def _aggregate(self, kind, report_type, pin, value, time_stamp, callback):
+        """
+        This is a private method.
+        Add a value to the pin's window and report the window
+        statistics when the window is complete.
+
+        :param kind: 'analog', 'touch' or 'sonar'
+
+        :param report_type: report type passed to the callback
+
+        :param pin: GPIO pin number. For sonar, the trigger pin.
+
+        :param value: reported value
+
+        :param time_stamp: time the value was received
+
+        :param callback: the pin's callback
+        """
+        window = self.window_stats.add(kind, pin, value, time_stamp)
+        if window and callback:
+            self._report_window(report_type, pin, window, callback)
 
-        self.analog_callbacks[pin](message)
+    def _report_window(self, report_type, pin, window, callback):
+        """
+        This is a private method.
+        Pass the statistics of a completed window to the pin's callback.
+
+        :param report_type: report type passed to the callback
+
+        :param pin: GPIO pin number. For sonar, the trigger pin.
+
+        :param window: (minimum, maximum, mean, count, start time, end time)
+
+        :param callback: the pin's callback
+        """
+        minimum, maximum, mean, count, start, end = window
+        if self.report_objects:
+            message = WindowReport(report_type, pin, minimum, maximum, mean, count,
+                                   start, end)
+        else:
+            message = [report_type, pin, minimum, maximum, mean, count, start, end]
+        callback(message)
+
+    def _expire_windows(self):
+        """
+        This is a private method.
+        Report the windows that ended without a later sample to complete them.
+
+        :return: seconds until the next check is needed, or None if no
+                 input is aggregated
+        """
+        now = self.link_clock.time_stamp(time.monotonic_ns())
+        windows = self.window_stats.expire(now)
+        if windows:
+            reports = {'analog': (PrivateConstants.AT_ANALOG, self.analog_callbacks),
+                       'touch': (PrivateConstants.TOUCH_REPORT, self.touch_callbacks),
+                       'sonar': (PrivateConstants.SONAR_DISTANCE, self.sonar_callbacks)}
+            for kind, pin, window in windows:
+                report_type, callbacks = reports[kind]
+                callback = callbacks.get(pin)
+                if callback:
+                    self._report_window(report_type, pin, window, callback)
+        return self.window_stats.wait_time(now)
 
     def _dht_report(self, data):
         """
@@ -2440,19 +3136,30 @@ class TelemetrixEsp32(threading.Thread):
         if data[0]:
             # error report
             # data[0] = report sub type, data[1] = pin, data[2] = error message
-            if self.dht_callbacks[data[1]]:
-                message = [PrivateConstants.DHT_REPORT, data[0], data[1], data[2],
-                           time.time()]
+            if self.dht_callbacks.get(data[1]):
+                if self.report_objects:
+                    message = DhtReport(PrivateConstants.DHT_REPORT, data[0], data[1],
+                                        None, None, data[2], self.report_time)
+                else:
+                    message = [PrivateConstants.DHT_REPORT, data[0], data[1], data[2],
+                               self.report_time]
                 self.dht_callbacks[data[1]](message)
         else:
             # got valid data
-            f_humidity = bytearray(data[2:6])
-            f_temperature = bytearray(data[6:])
-            message = [PrivateConstants.DHT_REPORT, data[0], data[1],
-                       (struct.unpack('<f', f_humidity))[0],
-                       (struct.unpack('<f', f_temperature))[0],
-                       time.time()]
-            self.dht_callbacks[data[1]](message)
+            subtype, pin, humidity, temperature = \
+                report_decoders.DHT_DATA.unpack_from(data)
+            time_stamp = self.report_time
+            if self.pin_states:
+                self.pin_states.update_dht(pin, humidity, temperature, time_stamp)
+            if self.report_objects:
+                message = DhtReport(PrivateConstants.DHT_REPORT, subtype, pin,
+                                    humidity, temperature, None, time_stamp)
+            else:
+                message = [PrivateConstants.DHT_REPORT, subtype, pin,
+                           humidity, temperature, time_stamp]
+            callback = self.dht_callbacks.get(pin)
+            if callback:
+                callback(message)
 
     def _digital_message(self, data):
         """
@@ -2465,9 +3172,15 @@ class TelemetrixEsp32(threading.Thread):
         pin = data[0]
         value = data[1]
 
-        time_stamp = time.time()
-        if self.digital_callbacks[pin]:
-            message = [PrivateConstants.DIGITAL_REPORT, pin, value, time_stamp]
+        time_stamp = self.report_time
+        if self.pin_states:
+            self.pin_states.update('digital', pin, value, time_stamp)
+        if self.digital_callbacks.get(pin):
+            if self.report_objects:
+                message = PinReport(PrivateConstants.DIGITAL_REPORT, pin, value,
+                                    time_stamp)
+            else:
+                message = [PrivateConstants.DIGITAL_REPORT, pin, value, time_stamp]
             self.digital_callbacks[pin](message)
 
     def _servo_unavailable(self, report):
@@ -2498,10 +3211,18 @@ class TelemetrixEsp32(threading.Thread):
         # data[3] = register
         # data[4] ... all the data bytes
 
-        data = list(data)
+        payload = self._payload(data, 3)
 
-        cb_list = [PrivateConstants.I2C_READ_REPORT, data[0], data[1]] + data[2:]
-        cb_list.append(time.time())
+        if self.report_objects:
+            cb_list = I2cReport(PrivateConstants.I2C_READ_REPORT, data[0], data[1],
+                                data[2], payload, self.report_time)
+        elif self.payload_format == 'list':
+            cb_list = [PrivateConstants.I2C_READ_REPORT, data[0], data[1],
+                       data[2]] + payload
+            cb_list.append(self.report_time)
+        else:
+            cb_list = [PrivateConstants.I2C_READ_REPORT, data[0], data[1],
+                       data[2], payload, self.report_time]
 
         self.i2c_callback(cb_list)
 
@@ -2536,12 +3257,31 @@ class TelemetrixEsp32(threading.Thread):
                                  distance_value, time_stamp]
         """
 
+        trigger_pin, distance = report_decoders.PIN_VALUE.unpack_from(report)
+
+        time_stamp = self.report_time
+
+        if self.pin_states:
+            self.pin_states.update('sonar', trigger_pin, distance, time_stamp)
+
+        if self.window_stats.active('sonar', trigger_pin):
+            self._aggregate('sonar', PrivateConstants.SONAR_DISTANCE, trigger_pin,
+                            distance, time_stamp,
+                            self.sonar_callbacks.get(trigger_pin))
+            return
+
         # get callback from pin number
-        cb = self.sonar_callbacks[report[0]]
+        cb = self.sonar_callbacks.get(trigger_pin)
+        if not cb:
+            return
 
         # build report data
-        cb_list = [PrivateConstants.SONAR_DISTANCE, report[0],
-                   ((report[1] << 8) + report[2]), time.time()]
+        if self.report_objects:
+            cb_list = PinReport(PrivateConstants.SONAR_DISTANCE, trigger_pin,
+                                distance, time_stamp)
+        else:
+            cb_list = [PrivateConstants.SONAR_DISTANCE, trigger_pin,
+                       distance, time_stamp]
 
         cb(cb_list)
 
@@ -2553,32 +3293,78 @@ class TelemetrixEsp32(threading.Thread):
         :param report: message data
 
         """
-        pin = report[0]
-        value = (report[1] << 8) + report[2]
+        pin, value = report_decoders.PIN_VALUE.unpack_from(report)
         # set the current value in the pin structure
-        time_stamp = time.time()
-        if self.touch_callbacks[pin]:
-            message = [PrivateConstants.TOUCH_REPORT, pin, value, time_stamp]
+        time_stamp = self.report_time
+        if self.pin_states:
+            self.pin_states.update('touch', pin, value, time_stamp)
+        if self.window_stats.active('touch', pin):
+            self._aggregate('touch', PrivateConstants.TOUCH_REPORT, pin, value,
+                            time_stamp, self.touch_callbacks.get(pin))
+            return
+        if self.touch_callbacks.get(pin):
+            if self.report_objects:
+                message = PinReport(PrivateConstants.TOUCH_REPORT, pin, value,
+                                    time_stamp)
+            else:
+                message = [PrivateConstants.TOUCH_REPORT, pin, value, time_stamp]
             self.touch_callbacks[pin](message)
 
     def _spi_report(self, report):
 
-        report = list(report)
-
-        cb_list = [PrivateConstants.SPI_REPORT, report[0]] + report[1:]
-
-        cb_list.append(time.time())
+        # report[0] = register
+        # report[1] = number of bytes read
+        # report[2] ... all the data bytes
+        payload = self._payload(report, 2)
+
+        if self.report_objects:
+            cb_list = SpiReport(PrivateConstants.SPI_REPORT, report[0], report[1],
+                                payload, self.report_time)
+        elif self.payload_format == 'list':
+            cb_list = [PrivateConstants.SPI_REPORT, report[0], report[1]] + payload
+            cb_list.append(self.report_time)
+        else:
+            cb_list = [PrivateConstants.SPI_REPORT, report[0], report[1], payload,
+                       self.report_time]
 
         self.spi_callback(cb_list)
 
     def _onewire_report(self, report):
-        report = list(report)
-        cb_list = [PrivateConstants.ONE_WIRE_REPORT, report[0]] + report[1:]
-        cb_list.append(time.time())
+        # report[0] = OneWire subtype
+        # report[1] ... all the data bytes
+        payload = self._payload(report, 1)
+
+        if self.report_objects:
+            cb_list = OneWireReport(PrivateConstants.ONE_WIRE_REPORT, report[0],
+                                    payload, self.report_time)
+        elif self.payload_format == 'list':
+            cb_list = [PrivateConstants.ONE_WIRE_REPORT, report[0]] + payload
+            cb_list.append(self.report_time)
+        else:
+            cb_list = [PrivateConstants.ONE_WIRE_REPORT, report[0], payload,
+                       self.report_time]
+
         self.onewire_callback(cb_list)
 
+    def _payload(self, data, offset):
+        """
+        Extract the data bytes of an i2c, SPI or OneWire report in the
+        configured payload format.
+
+        :param data: report data bytes
+
+        :param offset: index of the first data byte
+
+        :return: list of integers, bytes or memoryview
+        """
+        if self.payload_format == 'memoryview':
+            return memoryview(data)[offset:]
+        if self.payload_format == 'bytes':
+            return bytes(data[offset:])
+        return list(data[offset:])
+
     def _firmware_report(self, report):
-        self.firmware_version = report
+        self.firmware_version = list(report)
 
     def _stepper_distance_to_go_report(self, report):
         """
@@ -2591,17 +3377,23 @@ class TelemetrixEsp32(threading.Thread):
                                  steps, time_stamp]
         """
 
-        # get callback
-        cb = self.stepper_info_list[report[0]]['distance_to_go_callback']
+        motor_id, num_steps = report_decoders.STEPPER_VALUE.unpack_from(report)
 
-        # isolate the steps bytes and covert list to bytes
-        steps = bytes(report[1:])
+        time_stamp = self.report_time
 
-        # get value from steps
-        num_steps = int.from_bytes(steps, byteorder='big', signed=True)
+        if self.pin_states:
+            self.pin_states.update('stepper_distance_to_go', motor_id,
+                                   num_steps, time_stamp)
+
+        # get callback
+        cb = self.stepper_info_list[motor_id]['distance_to_go_callback']
 
-        cb_list = [PrivateConstants.STEPPER_DISTANCE_TO_GO, report[0], num_steps,
-                   time.time()]
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_DISTANCE_TO_GO, motor_id,
+                                    num_steps, time_stamp)
+        else:
+            cb_list = [PrivateConstants.STEPPER_DISTANCE_TO_GO, motor_id, num_steps,
+                       time_stamp]
 
         cb(cb_list)
 
@@ -2618,17 +3410,23 @@ class TelemetrixEsp32(threading.Thread):
                                  target_position, time_stamp]
         """
 
-        # get callback
-        cb = self.stepper_info_list[report[0]]['target_position_callback']
+        motor_id, target_position = report_decoders.STEPPER_VALUE.unpack_from(report)
 
-        # isolate the steps bytes and covert list to bytes
-        target = bytes(report[1:])
+        time_stamp = self.report_time
 
-        # get value from steps
-        target_position = int.from_bytes(target, byteorder='big', signed=True)
+        if self.pin_states:
+            self.pin_states.update('stepper_target_position', motor_id,
+                                   target_position, time_stamp)
+
+        # get callback
+        cb = self.stepper_info_list[motor_id]['target_position_callback']
 
-        cb_list = [PrivateConstants.STEPPER_TARGET_POSITION, report[0], target_position,
-                   time.time()]
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_TARGET_POSITION, motor_id,
+                                    target_position, time_stamp)
+        else:
+            cb_list = [PrivateConstants.STEPPER_TARGET_POSITION, motor_id, target_position,
+                       time_stamp]
 
         cb(cb_list)
 
@@ -2645,17 +3443,23 @@ class TelemetrixEsp32(threading.Thread):
                                  current_position, time_stamp]
         """
 
-        # get callback
-        cb = self.stepper_info_list[report[0]]['current_position_callback']
+        motor_id, current_position = report_decoders.STEPPER_VALUE.unpack_from(report)
 
-        # isolate the steps bytes and covert list to bytes
-        position = bytes(report[1:])
+        time_stamp = self.report_time
 
-        # get value from steps
-        current_position = int.from_bytes(position, byteorder='big', signed=True)
+        if self.pin_states:
+            self.pin_states.update('stepper_current_position', motor_id,
+                                   current_position, time_stamp)
+
+        # get callback
+        cb = self.stepper_info_list[motor_id]['current_position_callback']
 
-        cb_list = [PrivateConstants.STEPPER_CURRENT_POSITION, report[0], current_position,
-                   time.time()]
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_CURRENT_POSITION, motor_id,
+                                    current_position, time_stamp)
+        else:
+            cb_list = [PrivateConstants.STEPPER_CURRENT_POSITION, motor_id, current_position,
+                       time_stamp]
 
         cb(cb_list)
 
@@ -2663,7 +3467,8 @@ class TelemetrixEsp32(threading.Thread):
         """
         Report if the motor is currently running
 
-        :param report: data[0] = motor_id, True if motor is running or False if it is not.
+        :param report: data[0] = motor_id, data[1] = True if motor is running or
+                       False if it is not.
 
         callback report format: [18, motor_id,
                                  running_state, time_stamp]
@@ -2672,7 +3477,12 @@ class TelemetrixEsp32(threading.Thread):
         # get callback
         cb = self.stepper_info_list[report[0]]['is_running_callback']
 
-        cb_list = [PrivateConstants.STEPPER_RUNNING_REPORT, report[0], time.time()]
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_RUNNING_REPORT, report[0],
+                                    report[1], self.report_time)
+        else:
+            cb_list = [PrivateConstants.STEPPER_RUNNING_REPORT, report[0], report[1],
+                       self.report_time]
 
         cb(cb_list)
 
@@ -2689,33 +3499,358 @@ class TelemetrixEsp32(threading.Thread):
         # get callback
         cb = self.stepper_info_list[report[0]]['motion_complete_callback']
 
-        cb_list = [PrivateConstants.STEPPER_RUN_COMPLETE_REPORT, report[0],
-                   time.time()]
+        if self.report_objects:
+            cb_list = StepperReport(PrivateConstants.STEPPER_RUN_COMPLETE_REPORT,
+                                    report[0], None, self.report_time)
+        else:
+            cb_list = [PrivateConstants.STEPPER_RUN_COMPLETE_REPORT, report[0],
+                       self.report_time]
 
         cb(cb_list)
 
-    def _send_command(self, command):
+    def send(self, command, block=None, urgent=False):
         """
-        This is a private utility method.
+        Send a raw command to the ESP32.
 
+        :param command: command data in the form of a list.
+                        The first element is the command id.
+
+        :param block: True to wait until the command has been written to the
+                      link, False to return as soon as it is queued.
+                      None uses the blocking_send value given to __init__.
+
+        :param urgent: If True, the command is written ahead of all
+                       queued normal priority commands.
+        """
+        self._send_command(list(command), block, urgent)
+
+    def get_digital(self, pin_number):
+        """
+        Retrieve the latest value of a digital input.
+        Requires pin_state_cache=True.
+
+        :param pin_number: GPIO pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        return self._pin_state_table('get_digital').get('digital', pin_number)
+
+    def get_analog(self, pin_number):
+        """
+        Retrieve the latest value of an analog input.
+        Requires pin_state_cache=True.
+
+        :param pin_number: GPIO pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        return self._pin_state_table('get_analog').get('analog', pin_number)
+
+    def get_touch(self, pin_number):
+        """
+        Retrieve the latest value of a touch pin.
+        Requires pin_state_cache=True.
+
+        :param pin_number: GPIO pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        return self._pin_state_table('get_touch').get('touch', pin_number)
+
+    def get_sonar(self, trigger_pin):
+        """
+        Retrieve the latest sonar distance.
+        Requires pin_state_cache=True.
+
+        :param trigger_pin: sonar trigger pin
+
+        :return: (distance, time stamp, sequence number) or None if the
+                 sonar has not reported
+        """
+        return self._pin_state_table('get_sonar').get('sonar', trigger_pin)
+
+    def get_dht(self, pin_number):
+        """
+        Retrieve the latest DHT reading.
+        Requires pin_state_cache=True.
+
+        :param pin_number: DHT pin number
+
+        :return: (humidity, temperature, time stamp, sequence number)
+                 or None if the DHT has not reported
+        """
+        return self._pin_state_table('get_dht').get_dht(pin_number)
+
+    def get_pin_snapshot(self):
+        """
+        Copy the latest values of all inputs at once.
+        Requires pin_state_cache=True.
+
+        :return: dictionary keyed by 'digital', 'analog', 'touch', 'sonar',
+                 'dht', 'stepper_distance_to_go', 'stepper_target_position'
+                 and 'stepper_current_position'. Each entry maps a pin
+                 number or motor id to (value, time stamp, sequence number).
+                 DHT entries are
+                 (humidity, temperature, time stamp, sequence number).
+        """
+        return self._pin_state_table('get_pin_snapshot').snapshot()
+
+    def _pin_state_table(self, caller):
+        """
+        :param caller: name of the calling method, for the error message
+
+        :return: the pin state table
+        """
+        if not self.pin_states:
+            if self.shutdown_on_exception:
+                self.shutdown()
+            raise RuntimeError(f'{caller}: pin_state_cache is not enabled')
+        return self.pin_states
+
+    def get_skipped_report_count(self):
+        """
+        :return: the number of reports dropped without decoding, because
+                 no callback was registered for their pin
+        """
+        return self.report_subscriptions.skipped
+
+    def get_send_queue_depth(self):
+        """
+        :return: the number of commands waiting for the writer thread
+        """
+        return len(self.send_queue) + len(self.urgent_send_queue)
+
+    def _send_command(self, command, block=None, urgent=False):
+        """
+        This is a private utility method.
+        The command is framed and placed on the send queue for the
+        writer thread.
 
         :param command:  command data in the form of a list
 
-        :returns: number of bytes sent
+        :param block: True to wait until the frame has been written,
+                      None to use self.blocking_send.
+
+        :param urgent: place the frame in the priority lane
         """
         # the length of the list is added at the head
         command.insert(0, len(command))
         # print(command)
         send_message = bytes(command)
 
-        if self.transport_is_wifi:
-            self.sock.sendall(send_message)
+        if self.auto_reconnect:
+            self.config_journal.record(send_message)
+
+        if block is None:
+            block = self.blocking_send
+
+        entry = [send_message, threading.Event() if block else None, None]
+        with self.writer_lock:
+            queued = self.writer_running and self._is_running()
+            if queued:
+                if urgent:
+                    self.urgent_send_queue.append(entry)
+                else:
+                    self.send_queue.append(entry)
+
+        # the writer thread is not running - write on the caller's thread
+        if not queued:
+            with self.send_lock:
+                self._write_to_link(send_message)
+            return
+
+        self.send_event.set()
+
+        if block:
+            while not entry[1].wait(PrivateConstants.SEND_WAIT_INTERVAL):
+                if not self.the_data_send_thread.is_alive():
+                    # the writer died without releasing its queue
+                    self._fail_send_queue(RuntimeError('The writer thread has stopped'))
+            if entry[2]:
+                raise entry[2]
+
+    def _write_to_link(self, data):
+        """
+        This is a private utility method.
+        Write bytes to the transport.
+
+        :param data: bytes to write
+        """
+        if self.transport_is_serial:
+            self.serial_port.write(data)
+        elif self.transport_is_wifi:
+            self.sock.sendall(data)
         else:
             try:
-                self.ble_client.write(send_message)
+                self.ble_client.write(data)
             except:
                 pass
 
+    def _link_writer(self):
+        """
+        Thread to write queued frames to the link.
+        All frames queued since the last write are coalesced
+        into a single write.
+        """
+        self.run_event.wait()
+
+        exception = RuntimeError('The writer thread has stopped')
+        try:
+            while self._is_running() and not self.shutdown_flag:
+                self.send_event.wait()
+                self.send_event.clear()
+                if self.auto_reconnect:
+                    # hold queued frames while a lost connection is reopened
+                    self.link_up.wait()
+                self._drain_send_queue()
+        except Exception as e:
+            exception = e
+            raise
+        finally:
+            with self.writer_lock:
+                self.writer_running = False
+            # nothing can be queued from now on. Write what is left on the
+            # way out, and fail what can not be written.
+            try:
+                self._drain_send_queue()
+            except Exception:
+                pass
+            self._fail_send_queue(exception)
+
+    def _fail_send_queue(self, exception):
+        """
+        This is a private utility method.
+        Remove every queued frame and release its waiting caller
+        with an exception.
+
+        :param exception: exception raised to the waiting callers
+        """
+        for send_queue in (self.urgent_send_queue, self.send_queue):
+            while True:
+                try:
+                    entry = send_queue.popleft()
+                except IndexError:
+                    break
+                if entry[1]:
+                    entry[2] = exception
+                    entry[1].set()
+
+    def _drain_send_queue(self):
+        """
+        This is a private utility method.
+        Write everything on the send queues and release any waiting callers.
+
+        Urgent frames are written first. Normal frames are coalesced into
+        writes of at most MAX_COALESCED_WRITE_SIZE bytes, and the urgent
+        queue is checked again before each of those writes.
+        """
+        with self.send_lock:
+            while self.urgent_send_queue or self.send_queue:
+                entries = []
+                try:
+                    if self.urgent_send_queue:
+                        while True:
+                            entries.append(self.urgent_send_queue.popleft())
+                    else:
+                        size = 0
+                        while size < PrivateConstants.MAX_COALESCED_WRITE_SIZE:
+                            entry = self.send_queue.popleft()
+                            entries.append(entry)
+                            size += len(entry[0])
+                except IndexError:
+                    pass
+
+                exception = None
+                try:
+                    self._write_to_link(b''.join([entry[0] for entry in entries]))
+                except OSError as e:
+                    self.send_errors += 1
+                    exception = e
+
+                for entry in entries:
+                    if entry[1]:
+                        entry[2] = exception
+                        entry[1].set()
+
+    def _send_shaped_command(self, pin_number, command):
+        """
+        This is a private utility method.
+        Send a command through the output shaper.
+
+        :param pin_number: pin the command controls
+
+        :param command:  command data in the form of a list
+        """
+        command = self.output_shaper.submit((command[0], pin_number), command,
+                                            time.monotonic())
+        if command:
+            self._send_command(command)
+        elif self.reactor:
+            # the write is held back - make sure the reactor flushes it
+            self.reactor.schedule(self)
+        else:
+            # the write is held back - make sure the flusher knows about it
+            self.output_shaper_event.set()
+
+    def _output_shaper_flusher(self):
+        """
+        Thread to send the writes held back by the output shaper
+        when their send slot arrives.
+        """
+        self.run_event.wait()
+
+        while self._is_running() and not self.shutdown_flag:
+            self.output_shaper_event.clear()
+            for command in self.output_shaper.due(time.monotonic()):
+                self._send_command(command)
+
+            deadline = self.output_shaper.next_deadline()
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = max(0.0, deadline - time.monotonic())
+            self.output_shaper_event.wait(timeout)
+
+    def _run_timers(self):
+        """
+        This is a private method.
+        Called by the reactor's dispatch worker in place of the heartbeat
+        and output shaper threads, and of the report dispatcher's window
+        checks.
+
+        :return: seconds until the next call is needed, or None if
+                 nothing is waiting
+        """
+        if self.shutdown_flag or not self._is_running():
+            return None
+
+        waits = []
+        if self.window_stats.enabled:
+            waits.append(self._expire_windows())
+
+        now = time.monotonic()
+        for command in self.output_shaper.due(now):
+            try:
+                self._send_command(command, block=False)
+            except OSError:
+                # a lost link is reopened by the reconnect thread
+                pass
+        deadline = self.output_shaper.next_deadline()
+        if deadline is not None:
+            waits.append(deadline - now)
+
+        if self.heartbeat_due is not None:
+            if now >= self.heartbeat_due:
+                self._send_heartbeat()
+                self.heartbeat_due = now + self.heartbeat_interval
+            waits.append(self.heartbeat_due - now)
+
+        waits = [wait for wait in waits if wait is not None]
+        return max(0.0, min(waits)) if waits else None
+
     def _run_threads(self):
         self.run_event.set()
 
@@ -2728,28 +3863,408 @@ class TelemetrixEsp32(threading.Thread):
     def _link_receiver(self):
         """
         Thread to continuously check for incoming data.
-        When a byte comes in, place it onto the deque.
+        Data is read in bulk, framed into packets, and the
+        complete packets are placed onto the deque.
         """
         self.run_event.wait()
 
         # Start this thread only if transport_address is set
 
         while self._is_running() and not self.shutdown_flag:
-            if self.transport_is_wifi:
+            if not self.link_up.is_set():
+                # the connection is down - wait for it to be reopened
+                self.link_up.wait(.5)
+                continue
+
+            if self.transport_is_serial:
+                serial_port = self.serial_port
                 try:
-                    payload = self.sock.recv(1)
-                    self.the_deque.append(ord(payload))
-                except Exception:
-                    pass
+                    # block for the first byte, then take everything waiting
+                    payload = serial_port.read(serial_port.in_waiting or 1)
+                except (serial.SerialException, OSError):
+                    # the port was closed or the device was unplugged.
+                    # Ignore errors from a port that was already replaced.
+                    if serial_port is self.serial_port:
+                        self._link_lost()
+                    continue
+                if payload:
+                    self._queue_packets(self.framer.feed(payload))
+            elif self.transport_is_wifi:
+                sock = self.sock
+                try:
+                    if not select.select([sock], [], [],
+                                         self.transport_options.read_timeout)[0]:
+                        continue
+                    payload = sock.recv(PrivateConstants.MAX_RECEIVE_SIZE)
+                except socket.timeout:
+                    continue
+                except (OSError, ValueError):
+                    # ValueError - the socket was closed while selecting
+                    payload = b''
+                if payload:
+                    self._queue_packets(self.framer.feed(payload))
+                elif sock is self.sock:
+                    # an empty read means the server closed the connection
+                    self._link_lost()
             else:
-                # payload = bytearray(30)
-                bytes_waiting = self.ble_client.in_waiting
-                if bytes_waiting:
-                    data = self.ble_client.read(bytes_waiting)
-                    # assure that the packet is of correct length
-                    payload = list(data)
-
-                    for i in range(0, bytes_waiting):
-                        self.the_deque.append(payload[i])
-                else:
-                    time.sleep(.01)
+                # block until the first byte arrives or the UART service
+                # read timeout expires, then take everything waiting
+                try:
+                    data = self.ble_client.read(1)
+                    if data:
+                        bytes_waiting = self.ble_client.in_waiting
+                        if bytes_waiting:
+                            data += self.ble_client.read(bytes_waiting)
+                        self._ble_report_dispatcher(data=data)
+                    elif not self.uart_connection.connected:
+                        self._link_lost()
+                except Exception:
+                    self._link_lost()
+
+    def _link_lost(self):
+        """
+        This is a private method.
+        It is called when the connection to the ESP32 is closed.
+
+        The receive and send threads pause until the connection is
+        reopened. If auto_reconnect is set, a thread is started to
+        reopen it.
+        """
+        if self.shutdown_flag or not self.link_up.is_set():
+            return
+        self.link_up.clear()
+        self.connection_drops += 1
+
+        if self.transport_is_serial:
+            print(f'Connection to {self.com_port} was lost.')
+        elif self.transport_is_wifi:
+            print(f'Connection to {self.transport_address}:{self.ip_port} was lost.')
+        else:
+            print('BLE connection was lost.')
+
+        if self.connection_callback:
+            self.connection_callback(False)
+
+        if self.auto_reconnect:
+            self.the_reconnect_thread = threading.Thread(target=self._reconnect)
+            self.the_reconnect_thread.daemon = True
+            self.the_reconnect_thread.start()
+
+    def _reconnect(self):
+        """
+        Thread to reopen a lost connection.
+
+        Attempts are retried with an exponential backoff until they succeed
+        or the board is shut down. When the connection is open, the recorded
+        configuration is replayed as one batched write, and the receive and
+        send threads are released.
+
+        If the configuration creates devices, such as sonars, DHTs or
+        steppers, the ESP32 is restarted before the replay unless opening
+        the link restarted it, as opening a serial port does.
+        """
+        lost_time = time.monotonic()
+        delay = self.reconnect_min_delay
+        board_restarted = self.transport_is_serial
+
+        while not self.shutdown_flag:
+            self._close_link()
+            try:
+                self._open_link()
+                self.framer.reset()
+                if not board_restarted and self.config_journal.creates_devices():
+                    with self.send_lock:
+                        self._write_to_link(bytes([1, PrivateConstants.RESET]))
+                    board_restarted = True
+                    time.sleep(PrivateConstants.RESTART_WAIT)
+                    continue
+                self._replay_configuration()
+            except Exception:
+                time.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            if self.reactor:
+                self.reactor.register(self)
+
+            self.reconnects += 1
+            self.last_recovery_time = time.monotonic() - lost_time
+            self.link_up.set()
+            # release any frames queued during the outage
+            self.send_event.set()
+
+            if self.connection_callback:
+                self.connection_callback(True)
+            return
+
+    def _replay_configuration(self):
+        """
+        This is a private method.
+        Write the recorded configuration to the newly opened link
+        in a single write.
+
+        Configuration commands still waiting on the send queue are
+        part of the replay, so they are removed from the queue.
+        """
+        frames = [bytes([1, PrivateConstants.ENABLE_ALL_REPORTS])]
+        frames += self.config_journal.frames()
+
+        with self.send_lock:
+            self._write_to_link(b''.join(frames))
+
+            for entry in list(self.send_queue):
+                if self.config_journal.contains(entry[0]):
+                    try:
+                        self.send_queue.remove(entry)
+                    except ValueError:
+                        continue
+                    if entry[1]:
+                        entry[1].set()
+
+    def _heartbeat(self):
+        """
+        Thread to send a loop back request every heartbeat_interval seconds
+        and declare the link stalled when heartbeat_misses requests in a row
+        go unanswered.
+        """
+        self.run_event.wait()
+
+        while self._is_running() and not self.shutdown_flag:
+            self.heartbeat_event.wait(self.heartbeat_interval)
+            if self.shutdown_flag:
+                break
+            self._send_heartbeat()
+
+    def _send_heartbeat(self):
+        """
+        This is a private method.
+        Send a heartbeat, after declaring the link stalled if
+        heartbeat_misses heartbeats in a row went unanswered.
+        """
+        if not self.link_up.is_set():
+            # a reconnect is in progress
+            self.heartbeats_outstanding = 0
+            return
+
+        if self.heartbeats_outstanding >= self.heartbeat_misses and \
+                not self.link_stalled.is_set():
+            self._link_stalled()
+            if not self.link_up.is_set():
+                # the stalled link is being reopened
+                return
+
+        # heartbeats continue while stalled, so that recovery is seen
+        self.heartbeats_outstanding += 1
+        self.heartbeat_sent_time = time.monotonic_ns()
+        try:
+            self._send_loop_back(PrivateConstants.HEARTBEAT_MARKER,
+                                 self._heartbeat_reply, block=False)
+        except OSError:
+            pass
+
+    def _send_loop_back(self, value, handler, block=None):
+        """
+        This is a private method.
+        Send a loop back request and record the handler of its reply.
+
+        :param value: data byte to loop back
+
+        :param handler: called with the reply data
+
+        :param block: passed to _send_command
+        """
+        # the request is recorded and queued under one lock, so that the
+        # pending requests are in the order they are written
+        with self.loop_back_lock:
+            self.loop_back_pending.append((value, handler))
+            try:
+                self._send_command([PrivateConstants.LOOP_COMMAND, value],
+                                   block=block)
+            except Exception:
+                self.loop_back_pending.pop()
+                raise
+
+    def _loop_back_handler(self, data):
+        """
+        This is a private method.
+        Find the handler of the request a loop back reply answers.
+        Requests sent before it are no longer answered, and are dropped.
+
+        :param data: loop back data
+
+        :return: the handler, or loop_back_callback for a reply that
+                 answers no pending request
+        """
+        if data:
+            with self.loop_back_lock:
+                for index, (value, handler) in enumerate(self.loop_back_pending):
+                    if value == data[0]:
+                        for _ in range(index + 1):
+                            self.loop_back_pending.popleft()
+                        return handler
+        return self.loop_back_callback
+
+    def _heartbeat_reply(self, data):
+        """
+        This is a private method.
+        A heartbeat was answered.
+
+        :param data: loop back data
+        """
+        if self.heartbeat_sent_time:
+            if self.heartbeats_outstanding == 1:
+                # the reply can only be matched to its request if no other
+                # heartbeat is outstanding
+                self.link_clock.add_exchange(self.heartbeat_sent_time,
+                                             self.receive_time_ns)
+            self.heartbeat_round_trip = \
+                (self.receive_time_ns - self.heartbeat_sent_time) / 1e9
+        self.heartbeats_outstanding = 0
+        if self.link_stalled.is_set():
+            self.link_stalled.clear()
+            if self.stall_callback:
+                self.stall_callback(False)
+
+    def _link_stalled(self):
+        """
+        This is a private method.
+        No heartbeat replies were received for heartbeat_misses intervals.
+        """
+        self.stalls += 1
+        self.link_stalled.set()
+        print('The link is stalled - no heartbeat replies.')
+        if self.stall_callback:
+            self.stall_callback(True)
+
+        if self.auto_reconnect:
+            # reopen the connection - the link may be half open
+            self.link_stalled.clear()
+            self.heartbeats_outstanding = 0
+            self._link_lost()
+
+    def synchronize_clock(self, exchanges=8, timeout=1.0):
+        """
+        Measure the link delay with a burst of loop back exchanges and update
+        the clock estimate used for report time stamps.
+
+        Report time stamps are the wall clock time at which a report is
+        estimated to have been sent: the time its data was received, less
+        the estimated one way link delay. Heartbeats also update the
+        estimate, if heartbeat_interval is set.
+
+        The requests use the normal send lane, so that they are answered
+        in order with user loop back requests. An exchange delayed behind
+        queued commands has a longer round trip. The link delay is taken
+        from the shortest round trip, so it is not skewed by such an
+        exchange, although the jitter is raised.
+
+        :param exchanges: number of loop back exchanges
+
+        :param timeout: seconds to wait for each reply. The burst ends at
+                        the first reply that does not arrive in time.
+
+        :return: the clock estimate, as returned by get_clock_estimate
+        """
+        for _ in range(exchanges):
+            self.clock_sync_event.clear()
+            self.clock_sync_sent_time = time.monotonic_ns()
+            self._send_loop_back(PrivateConstants.CLOCK_MARKER,
+                                 self._clock_sync_reply)
+            if not self.clock_sync_event.wait(timeout):
+                # a late reply is ignored
+                self.clock_sync_sent_time = None
+                break
+        return self.get_clock_estimate()
+
+    def get_clock_estimate(self):
+        """
+        Retrieve the estimate used to time stamp reports.
+
+        :return: dictionary with the following keys:
+
+                 offset - wall clock minus monotonic time in seconds
+
+                 drift - wall clock drift against the monotonic clock,
+                         in parts per million
+
+                 link_delay - estimated one way link delay in seconds.
+                              It is subtracted from report receive times.
+
+                 jitter - mean round trip time above the shortest,
+                          in seconds
+
+                 uncertainty - estimated +/- error in seconds that
+                               applies to every report time stamp taken
+                               under this estimate, or None before the
+                               first exchange
+
+                 exchanges - number of exchanges in the estimate
+        """
+        return self.link_clock.estimate()
+
+    def _clock_sync_reply(self, data):
+        """
+        This is a private method.
+        A clock synchronization request was answered.
+
+        :param data: loop back data
+        """
+        if not self.clock_sync_sent_time:
+            # the reply came after synchronize_clock stopped waiting
+            return
+        self.link_clock.add_exchange(self.clock_sync_sent_time, self.receive_time_ns)
+        self.clock_sync_sent_time = None
+        self.clock_sync_event.set()
+
+    def _set_receive_time(self, receive_time):
+        """
+        This is a private method.
+        Set the receive time of the data about to be dispatched.
+
+        :param receive_time: time.monotonic_ns() when the data was received
+        """
+        self.receive_time_ns = receive_time
+        self.report_time = self.link_clock.time_stamp(receive_time)
+
+    def get_connection_statistics(self):
+        """
+        Retrieve the connection counters.
+
+        :return: dictionary with the following keys:
+
+                 connected - True if the link is currently open
+
+                 connection_drops - number of times the connection was lost
+
+                 reconnects - number of times the connection was reopened
+
+                 last_recovery_time - seconds from detecting the last drop
+                                      to having the configuration replayed,
+                                      or None
+
+                 stalled - True if the heartbeat has stopped being answered
+
+                 stalls - number of times the link stalled
+
+                 heartbeat_round_trip - seconds taken by the last answered
+                                        heartbeat, or None
+        """
+        return {'connected': self.link_up.is_set(),
+                'connection_drops': self.connection_drops,
+                'reconnects': self.reconnects,
+                'last_recovery_time': self.last_recovery_time,
+                'stalled': self.link_stalled.is_set(),
+                'stalls': self.stalls,
+                'heartbeat_round_trip': self.heartbeat_round_trip}
+
+    def _queue_packets(self, packets):
+        """
+        This is a private utility method.
+        Hand a chunk of complete packets to the reporter thread,
+        together with the time it was received.
+
+        :param packets: list of packets from the packet framer
+        """
+        if packets:
+            self.the_deque.append((time.monotonic_ns(), packets))
+            self.packet_event.set()
@@ -0,0 +1,292 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import math
+import threading
+import time
+
+# numpy is an optional dependency, only needed for aligned sampling
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.reports import PinReport, WindowReport
+
+
+class AlignedSampler:
+    """
+    This class puts the reports of inputs on any number of boards onto a
+    common time grid, so that samples from different boards can be
+    compared tick by tick.
+
+    Each input is a channel. Report time stamps are wall clock times at
+    which the boards sent the reports (see synchronize_clock), so the
+    channels of all boards share one time base. Every PERIOD seconds of
+    that time base is a tick, and each channel's value at a tick is
+    linearly interpolated between the samples around it. All pending ticks
+    of a channel are interpolated with a single numpy.interp call.
+
+    A tick is ready once every channel has a sample at or after it, or
+    once it is more than latency seconds old. A channel that has not
+    reported since a ready tick holds its last value. A channel that had
+    not reported before a tick is NaN.
+
+    The alignment error of a channel at a tick is the time from the tick
+    to the nearest sample used, plus the channel's time stamp uncertainty
+    if a LinkClock was given for it.
+
+    Works with both TelemetrixEsp32 and TelemetrixAioEsp32. Samples are
+    added by the callbacks returned by callback() or aio_callback(), or by
+    calling add().
+    """
+
+    # number of fields of a window report list:
+    # [report type, pin, minimum, maximum, mean, count, start, end]
+    WINDOW_REPORT_LENGTH = 8
+
+    def __init__(self, period, latency=.1):
+        """
+
+        :param period: tick interval in seconds
+
+        :param latency: seconds to wait for a late channel before a tick
+                        is emitted without it
+        """
+        if np is None:
+            raise RuntimeError('Aligned sampling requires numpy: pip install numpy')
+        if period <= 0:
+            raise RuntimeError('The sampling period must be positive')
+        if latency < 0:
+            raise RuntimeError('The sampling latency must not be negative')
+
+        self.period = period
+        self.latency = latency
+
+        # channel names in column order, and name -> column
+        self.names = []
+        self.columns = {}
+
+        # per column: pending sample times and values, and the LinkClock
+        # of the channel's board
+        self.times = []
+        self.values = []
+        self.clocks = []
+
+        # time of the next tick to emit. None until the first sample.
+        self.next_tick = None
+
+        # samples are added by reporter threads and consumed by the caller
+        self.lock = threading.Lock()
+
+        # number of ticks emitted, and samples dropped because they
+        # were older than their channel's newest sample
+        self.ticks_emitted = 0
+        self.late_samples = 0
+
+    def add_channel(self, name, clock=None):
+        """
+        Add a channel. Its column in the frames is its position in the
+        order the channels were added.
+
+        :param name: hashable channel name, for example (board id, pin)
+
+        :param clock: optional LinkClock of the channel's board, for
+                      example board.link_clock. Its uncertainty is added
+                      to the channel's alignment error.
+
+        :return: column index of the channel
+        """
+        with self.lock:
+            if name in self.columns:
+                raise RuntimeError(f'add_channel: channel {name} already exists')
+            column = len(self.names)
+            self.names.append(name)
+            self.columns[name] = column
+            self.times.append([])
+            self.values.append([])
+            self.clocks.append(clock)
+        return column
+
+    def add(self, name, value, time_stamp):
+        """
+        Add a sample to a channel.
+
+        :param name: channel name
+
+        :param value: sample value
+
+        :param time_stamp: report time stamp
+        """
+        column = self.columns[name]
+        with self.lock:
+            times = self.times[column]
+            if self.next_tick is None:
+                self.next_tick = math.ceil(time_stamp / self.period) * self.period
+            elif times and time_stamp < times[-1]:
+                # keep the samples in time order
+                self.late_samples += 1
+                return
+            times.append(time_stamp)
+            self.values[column].append(value)
+
+    def callback(self, name):
+        """
+        :param name: channel name
+
+        :return: a callback that adds the value of digital, analog, touch
+                 and sonar reports to the channel. It accepts report lists
+                 and report objects. For aggregation window reports, the
+                 window mean is added at the middle of the window.
+                 Other reports raise RuntimeError.
+        """
+        def add_report(report):
+            if isinstance(report, list):
+                if len(report) == self.WINDOW_REPORT_LENGTH:
+                    self.add(name, report[4], (report[6] + report[7]) / 2)
+                else:
+                    self.add(name, report[2], report[-1])
+            elif isinstance(report, WindowReport):
+                self.add(name, report.mean, (report.start + report.end) / 2)
+            elif isinstance(report, PinReport):
+                self.add(name, report.value, report.timestamp)
+            else:
+                raise RuntimeError(f'AlignedSampler: {type(report).__name__} '
+                                   f'can not be sampled')
+
+        return add_report
+
+    def aio_callback(self, name):
+        """
+        :param name: channel name
+
+        :return: an async version of callback(name) for TelemetrixAioEsp32
+        """
+        add_report = self.callback(name)
+
+        async def add_report_aio(report):
+            add_report(report)
+
+        return add_report_aio
+
+    def collect(self, now=None):
+        """
+        Interpolate all ready ticks.
+
+        :param now: current time.time() value. Defaults to the current time.
+
+        :return: (ticks, values, errors). ticks is an array of the tick
+                 times, values and errors are arrays with a row per tick
+                 and a column per channel. errors are the alignment errors
+                 in seconds.
+        """
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            column_count = len(self.names)
+            if self.next_tick is None or not column_count:
+                return (np.empty(0), np.empty((0, column_count)),
+                        np.empty((0, column_count)))
+
+            # ticks up to the newest sample of the slowest channel are
+            # ready, and any tick older than latency
+            newest = [times[-1] if times else -math.inf for times in self.times]
+            horizon = max(min(newest), now - self.latency)
+            count = math.floor((horizon - self.next_tick) / self.period) + 1
+            if count <= 0:
+                return (np.empty(0), np.empty((0, column_count)),
+                        np.empty((0, column_count)))
+
+            ticks = self.next_tick + self.period * np.arange(count)
+            values = np.full((count, column_count), np.nan)
+            errors = np.full((count, column_count), np.nan)
+
+            for column in range(column_count):
+                if not self.times[column]:
+                    continue
+                times = np.array(self.times[column])
+                samples = np.array(self.values[column], dtype=np.float64)
+                values[:, column] = np.interp(ticks, times, samples, left=np.nan)
+
+                # time to the nearest sample before and after each tick
+                after = np.searchsorted(times, ticks)
+                before = np.maximum(after - 1, 0)
+                distance = np.abs(ticks - times[before])
+                has_after = after < len(times)
+                distance[has_after] = np.minimum(
+                    distance[has_after],
+                    times[after[has_after]] - ticks[has_after])
+                distance[ticks < times[0]] = np.nan
+
+                clock = self.clocks[column]
+                uncertainty = clock.uncertainty() if clock else None
+                errors[:, column] = distance + (uncertainty or 0.0)
+
+                # keep the last sample before the next tick, it is needed
+                # to interpolate it
+                self._trim(column, ticks[-1] + self.period)
+
+            self.next_tick = ticks[-1] + self.period
+            self.ticks_emitted += count
+        return ticks, values, errors
+
+    def _trim(self, column, next_tick):
+        """
+        This is a private method.
+        Drop the samples of a channel that are no longer needed.
+
+        :param column: channel column
+
+        :param next_tick: time of the next tick
+        """
+        times = self.times[column]
+        keep = max(0, int(np.searchsorted(times, next_tick)) - 1)
+        if keep:
+            del times[:keep]
+            del self.values[column][:keep]
+
+    def frames(self, now=None):
+        """
+        Interpolate all ready ticks and yield them one at a time.
+
+        :param now: current time.time() value. Defaults to the current time.
+
+        :return: generator of (tick time, values, errors) with a value and
+                 an alignment error per channel
+        """
+        ticks, values, errors = self.collect(now)
+        for index in range(len(ticks)):
+            yield ticks[index], values[index], errors[index]
+
+    def get_statistics(self):
+        """
+        :return: dictionary with the following keys:
+
+                 ticks - number of ticks emitted
+
+                 late_samples - samples dropped because they were older
+                                than the channel's newest sample
+
+                 pending - channel name -> number of samples held
+        """
+        with self.lock:
+            return {'ticks': self.ticks_emitted,
+                    'late_samples': self.late_samples,
+                    'pending': {name: len(self.times[column])
+                                for name, column in self.columns.items()}}
@@ -0,0 +1,91 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import json
+import os
+
+
+class BleAddressCache:
+    """
+    This class stores the last known BLE address of each named server
+    in a small JSON file, so that a later connection can go straight to
+    the address instead of scanning.
+
+    Problems reading or writing the file are ignored. The cache is only
+    a shortcut, and discovery is used whenever it cannot help.
+    """
+
+    def __init__(self, file_path=None):
+        """
+
+        :param file_path: path of the cache file. If None,
+                          ~/.telemetrix_esp32/ble_addresses.json is used.
+        """
+        if file_path is None:
+            file_path = os.path.join(os.path.expanduser('~'), '.telemetrix_esp32',
+                                     'ble_addresses.json')
+        self.file_path = file_path
+
+    def get(self, device_name):
+        """
+        :param device_name: advertised name of the server
+
+        :return: the cached address string, or None
+        """
+        return self._load().get(device_name)
+
+    def put(self, device_name, address):
+        """
+        Remember the address of a server.
+
+        :param device_name: advertised name of the server
+
+        :param address: address string
+        """
+        addresses = self._load()
+        if addresses.get(device_name) == address:
+            return
+        addresses[device_name] = address
+        self._save(addresses)
+
+    def remove(self, device_name):
+        """
+        Forget the address of a server.
+
+        :param device_name: advertised name of the server
+        """
+        addresses = self._load()
+        if addresses.pop(device_name, None) is not None:
+            self._save(addresses)
+
+    def _load(self):
+        try:
+            with open(self.file_path) as cache_file:
+                addresses = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(addresses, dict):
+            return {}
+        return addresses
+
+    def _save(self, addresses):
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(self.file_path, 'w') as cache_file:
+                json.dump(addresses, cache_file)
+        except OSError:
+            pass
@@ -0,0 +1,152 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+
+class ConfigJournal:
+    """
+    This class records the configuration commands sent to the ESP32,
+    so that the configuration can be restored after a reconnect.
+
+    Only the latest command for each configured item is kept. For example,
+    setting the mode of a pin twice keeps only the second command, and
+    detaching a servo removes its attach command. Commands are replayed in
+    the order in which their items were last configured.
+
+    Some commands create a device on the ESP32. Replaying them to firmware
+    that kept its devices would create each device a second time, so they
+    must only be replayed after the ESP32 has restarted.
+    """
+
+    # commands keyed by their second byte - a pin or motor id
+    ITEM_COMMANDS = [PrivateConstants.SET_PIN_MODE,
+                     PrivateConstants.SERVO_ATTACH,
+                     PrivateConstants.SONAR_NEW,
+                     PrivateConstants.DHT_NEW,
+                     PrivateConstants.ANALOG_OUT_ATTACH,
+                     PrivateConstants.SET_PIN_MODE_STEPPER,
+                     PrivateConstants.STEPPER_SET_MAX_SPEED,
+                     PrivateConstants.STEPPER_SET_ACCELERATION,
+                     PrivateConstants.STEPPER_SET_SPEED,
+                     PrivateConstants.STEPPER_SET_MINIMUM_PULSE_WIDTH,
+                     PrivateConstants.STEPPER_SET_ENABLE_PIN,
+                     PrivateConstants.STEPPER_SET_3_PINS_INVERTED,
+                     PrivateConstants.STEPPER_SET_4_PINS_INVERTED]
+
+    # item commands that create a device in the firmware
+    DEVICE_COMMANDS = [PrivateConstants.SONAR_NEW,
+                       PrivateConstants.DHT_NEW,
+                       PrivateConstants.SET_PIN_MODE_STEPPER]
+
+    # commands that configure a single, board wide item
+    BOARD_COMMANDS = [PrivateConstants.I2C_BEGIN,
+                      PrivateConstants.SPI_INIT,
+                      PrivateConstants.SPI_SET_FORMAT,
+                      PrivateConstants.ONE_WIRE_INIT,
+                      PrivateConstants.SET_ANALOG_SCANNING_INTERVAL]
+
+    # commands that undo an item command
+    REMOVE_COMMANDS = {PrivateConstants.SERVO_DETACH: PrivateConstants.SERVO_ATTACH,
+                       PrivateConstants.ANALOG_OUT_DETACH:
+                           PrivateConstants.ANALOG_OUT_ATTACH}
+
+    def __init__(self):
+        # item key -> framed command. Dictionaries keep insertion order.
+        self.entries = {}
+
+        # frames may be recorded by several threads
+        self.lock = threading.Lock()
+
+    def record(self, frame):
+        """
+        Record a command if it is part of the board configuration.
+
+        :param frame: framed command bytes - length, command id, data
+        """
+        command_id = frame[1]
+
+        if command_id in self.ITEM_COMMANDS:
+            key = (command_id, frame[2])
+        elif command_id in self.BOARD_COMMANDS:
+            key = (command_id,)
+        elif command_id == PrivateConstants.MODIFY_REPORTING:
+            key = self._reporting_key(frame)
+        elif command_id in self.REMOVE_COMMANDS:
+            with self.lock:
+                self.entries.pop((self.REMOVE_COMMANDS[command_id], frame[2]), None)
+            return
+        else:
+            return
+
+        with self.lock:
+            if key == (PrivateConstants.MODIFY_REPORTING,):
+                # disabling all reporting replaces the per pin settings
+                for old_key in [old_key for old_key in self.entries
+                                if old_key[0] == PrivateConstants.MODIFY_REPORTING]:
+                    del self.entries[old_key]
+            # move the item to the end, so replay keeps the latest order
+            self.entries.pop(key, None)
+            self.entries[key] = frame
+
+    @staticmethod
+    def _reporting_key(frame):
+        """
+        :param frame: framed MODIFY_REPORTING command
+
+        :return: journal key for the command
+        """
+        if frame[2] == PrivateConstants.REPORTING_DISABLE_ALL:
+            return PrivateConstants.MODIFY_REPORTING,
+        if frame[2] in [PrivateConstants.REPORTING_ANALOG_ENABLE,
+                        PrivateConstants.REPORTING_ANALOG_DISABLE]:
+            return PrivateConstants.MODIFY_REPORTING, 'analog', frame[3]
+        return PrivateConstants.MODIFY_REPORTING, 'digital', frame[3]
+
+    def frames(self):
+        """
+        :return: list of the recorded frames in replay order
+        """
+        with self.lock:
+            return list(self.entries.values())
+
+    def creates_devices(self):
+        """
+        :return: True if replaying the configuration creates devices,
+                 so the ESP32 must be restarted first
+        """
+        with self.lock:
+            return any(key[0] in self.DEVICE_COMMANDS for key in self.entries)
+
+    def contains(self, frame):
+        """
+        :param frame: framed command bytes
+
+        :return: True if the frame is part of the recorded configuration
+        """
+        with self.lock:
+            return frame in self.entries.values()
+
+    def clear(self):
+        """
+        Forget the recorded configuration.
+        """
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,201 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class LinkClock:
+    """
+    This class converts the time.monotonic_ns() receive stamp of a report
+    into a wall clock time stamp for the moment the ESP32 sent it.
+
+    The ESP32 reports carry no device time, so the send time is estimated
+    from loop back exchanges, in the manner of NTP:
+
+        The one way link delay is half of the smallest round trip time seen
+        in the last MAX_SAMPLES exchanges. Queueing delays only lengthen a
+        round trip, so the smallest one is the closest to the true delay.
+
+        The uncertainty of a time stamp is half of that round trip time,
+        the largest error an asymmetric path can cause, plus the mean
+        round trip jitter.
+
+    The uncertainty is a property of the current link estimate, so it
+    applies equally to every time stamp taken under that estimate.
+
+    Monotonic time is converted to wall clock time with an offset and a
+    drift rate. They are fitted to pairs of monotonic and wall clock
+    readings taken at every exchange, and at least every REFRESH_INTERVAL
+    seconds while time stamps are requested. Between readings, time stamps
+    advance with the monotonic clock. A reading that is more than
+    STEP_THRESHOLD seconds off the fit restarts the fit, so when the wall
+    clock is stepped, for example by NTP after start up, the time stamps
+    jump with it at the next reading. The drift is only fitted once the
+    readings span MIN_DRIFT_SPAN seconds, because a rate measured over a
+    short span is mostly reading noise.
+    """
+
+    MAX_SAMPLES = 32
+
+    STEP_THRESHOLD = .5
+
+    MIN_DRIFT_SPAN = 10.0
+
+    REFRESH_INTERVAL = 1.0
+
+    def __init__(self):
+        # recent round trip times in nanoseconds
+        self.round_trips = deque(maxlen=self.MAX_SAMPLES)
+
+        # recent (monotonic, wall clock) readings in nanoseconds
+        self.clock_readings = deque(maxlen=self.MAX_SAMPLES)
+
+        # fitted wall clock - monotonic offset at reference_time,
+        # and wall clock seconds gained per monotonic second
+        self.reference_time = 0
+        self.offset = 0.0
+        self.drift = 0.0
+
+        # estimated one way link delay and round trip jitter in nanoseconds
+        self.link_delay = 0
+        self.jitter = 0.0
+
+        # monotonic time of the last clock reading in nanoseconds
+        self.last_reading = 0
+
+        # exchanges may be added while reports are being stamped
+        self.lock = threading.Lock()
+
+        self.read_clocks()
+
+    def read_clocks(self):
+        """
+        Take a monotonic and wall clock reading and refit the conversion.
+        """
+        before = time.monotonic_ns()
+        wall = time.time_ns()
+        after = time.monotonic_ns()
+        monotonic = (before + after) // 2
+
+        with self.lock:
+            if self.clock_readings:
+                predicted = self._to_wall_ns(monotonic)
+                if abs(wall - predicted) > self.STEP_THRESHOLD * 1e9:
+                    # the wall clock was stepped
+                    self.clock_readings.clear()
+            self.clock_readings.append((monotonic, wall))
+            self.last_reading = monotonic
+            self._fit()
+
+    def _fit(self):
+        """
+        Least squares fit of the offset and drift to the clock readings.
+        """
+        readings = self.clock_readings
+        count = len(readings)
+        reference = sum(monotonic for monotonic, _ in readings) // count
+        offsets = [(monotonic - reference, wall - monotonic)
+                   for monotonic, wall in readings]
+        mean_offset = sum(offset for _, offset in offsets) / count
+
+        spread = sum(elapsed * elapsed for elapsed, _ in offsets)
+        span = readings[-1][0] - readings[0][0]
+        if span >= self.MIN_DRIFT_SPAN * 1e9:
+            self.drift = sum(elapsed * (offset - mean_offset)
+                             for elapsed, offset in offsets) / spread
+        else:
+            self.drift = 0.0
+        self.reference_time = reference
+        self.offset = mean_offset
+
+    def add_exchange(self, sent_time, received_time):
+        """
+        Add a completed loop back exchange.
+
+        :param sent_time: time.monotonic_ns() when the request was written
+
+        :param received_time: time.monotonic_ns() when the reply was received
+        """
+        round_trip = received_time - sent_time
+        if round_trip < 0:
+            return
+
+        with self.lock:
+            self.round_trips.append(round_trip)
+            shortest = min(self.round_trips)
+            self.link_delay = shortest // 2
+            self.jitter = sum(self.round_trips) / len(self.round_trips) - shortest
+
+        self.read_clocks()
+
+    def _to_wall_ns(self, monotonic):
+        return monotonic + self.offset + self.drift * (monotonic - self.reference_time)
+
+    def time_stamp(self, received_time):
+        """
+        :param received_time: time.monotonic_ns() when a report was received
+
+        :return: estimated wall clock time, in seconds, at which the ESP32
+                 sent the report
+        """
+        if received_time - self.last_reading > self.REFRESH_INTERVAL * 1e9:
+            self.read_clocks()
+        with self.lock:
+            return self._to_wall_ns(received_time - self.link_delay) / 1e9
+
+    def uncertainty(self):
+        """
+        :return: estimated +/- error of every time stamp taken under the
+                 current estimate in seconds, or None before the first
+                 exchange
+        """
+        with self.lock:
+            if not self.round_trips:
+                return None
+            return (min(self.round_trips) / 2 + self.jitter) / 1e9
+
+    def estimate(self):
+        """
+        :return: dictionary with the following keys:
+
+                 offset - wall clock minus monotonic time in seconds
+
+                 drift - wall clock drift against the monotonic clock,
+                         in parts per million. 0 until the clock readings
+                         span MIN_DRIFT_SPAN seconds.
+
+                 link_delay - estimated one way link delay in seconds
+
+                 jitter - mean round trip time above the shortest,
+                          in seconds
+
+                 uncertainty - +/- error of the time stamps in seconds,
+                               or None before the first exchange
+
+                 exchanges - number of exchanges in the estimate
+        """
+        uncertainty = self.uncertainty()
+        now = time.monotonic_ns()
+        with self.lock:
+            return {'offset': (self._to_wall_ns(now) - now) / 1e9,
+                    'drift': self.drift * 1e6,
+                    'link_delay': self.link_delay / 1e9,
+                    'jitter': self.jitter / 1e9,
+                    'uncertainty': uncertainty,
+                    'exchanges': len(self.round_trips)}
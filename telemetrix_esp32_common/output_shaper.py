@@ -0,0 +1,157 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+
+
+class OutputShaper:
+    """
+    This class rate limits output commands, such as servo_write and
+    analog_write, on a per pin basis.
+
+    Only the most recent value for a pin is retained while the pin is
+    waiting for its next send slot ("latest value wins"). Values that are
+    overwritten before being sent are counted as collapsed writes.
+
+    The shaper does not send anything itself. The client submits commands
+    and periodically collects the commands that have become due.
+    """
+
+    def __init__(self):
+        # default minimum interval between sends for every pin.
+        # None disables shaping.
+        self.board_interval = None
+
+        # per pin overrides of the minimum interval, keyed by
+        # (command id, pin), so servo pins and pwm channels are separate
+        self.pin_intervals = {}
+
+        # commands waiting for their send slot, keyed by (command id, pin)
+        self.pending = {}
+
+        # time of the last send, keyed by (command id, pin)
+        self.last_sent = {}
+
+        # number of writes that were replaced by a newer value before being sent
+        self.collapsed_writes = 0
+
+        # number of commands released for sending
+        self.sent_writes = 0
+
+        self.lock = threading.Lock()
+
+    def set_rate(self, max_rate, pin_number=None, command_ids=()):
+        """
+        Set the maximum number of writes per second.
+
+        :param max_rate: maximum writes per second. None or 0 removes the limit.
+
+        :param pin_number: pin to limit. If None, the rate becomes the default
+                           for all pins without a pin specific rate.
+
+        :param command_ids: ids of the commands the pin rate applies to
+        """
+        if max_rate is not None and max_rate < 0:
+            raise RuntimeError('set_output_rate: max_rate must be positive')
+
+        interval = 1.0 / max_rate if max_rate else None
+
+        with self.lock:
+            if pin_number is None:
+                self.board_interval = interval
+                return
+            for command_id in command_ids:
+                if interval is None:
+                    self.pin_intervals.pop((command_id, pin_number), None)
+                else:
+                    self.pin_intervals[(command_id, pin_number)] = interval
+
+    def submit(self, key, command, now):
+        """
+        Offer a command for sending.
+
+        :param key: (command id, pin number)
+
+        :param command: command list
+
+        :param now: current time.monotonic() value
+
+        :return: the command if it may be sent immediately, otherwise None.
+                 A command that is not returned is held until it becomes due.
+        """
+        with self.lock:
+            interval = self.pin_intervals.get(key, self.board_interval)
+            if interval is None:
+                # shaping is off - an older held value must not follow this one
+                if self.pending.pop(key, None) is not None:
+                    self.collapsed_writes += 1
+                return command
+
+            if key in self.pending:
+                self.collapsed_writes += 1
+                self.pending[key] = command
+                return None
+
+            last = self.last_sent.get(key)
+            if last is None or now - last >= interval:
+                self.last_sent[key] = now
+                self.sent_writes += 1
+                return command
+
+            self.pending[key] = command
+            return None
+
+    def due(self, now):
+        """
+        Collect the pending commands whose send slot has arrived.
+
+        :param now: current time.monotonic() value
+
+        :return: list of commands to send
+        """
+        ready = []
+        with self.lock:
+            for key in list(self.pending):
+                interval = self.pin_intervals.get(key, self.board_interval) or 0
+                if now - self.last_sent.get(key, 0) >= interval:
+                    ready.append(self.pending.pop(key))
+                    self.last_sent[key] = now
+                    self.sent_writes += 1
+        return ready
+
+    def next_deadline(self):
+        """
+        :return: the time.monotonic() value at which the next pending command
+                 becomes due, or None if nothing is pending.
+        """
+        deadline = None
+        with self.lock:
+            for key in self.pending:
+                interval = self.pin_intervals.get(key, self.board_interval) or 0
+                when = self.last_sent.get(key, 0) + interval
+                if deadline is None or when < deadline:
+                    deadline = when
+        return deadline
+
+    def statistics(self):
+        """
+        :return: a dictionary with the collapsed, sent and pending write counts
+        """
+        with self.lock:
+            return {'collapsed_writes': self.collapsed_writes,
+                    'sent_writes': self.sent_writes,
+                    'pending_writes': len(self.pending)}
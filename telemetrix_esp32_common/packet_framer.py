@@ -0,0 +1,97 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+
+class PacketFramer:
+    """
+    This class reassembles Telemetrix packets from a byte stream.
+
+    A packet on the wire is a length byte followed by that many bytes:
+    the report type and the report data. Data may be fed in chunks of any
+    size. A chunk may contain a partial packet, or several packets.
+
+    If a ReportSubscriptions object is given, packets for pins nobody
+    subscribed to are skipped in the buffer, without being copied out,
+    and counted in its skipped count.
+    """
+
+    def __init__(self, subscriptions=None):
+        """
+
+        :param subscriptions: ReportSubscriptions instance or None
+                              to return every packet
+        """
+        self.subscriptions = subscriptions
+
+        # bytes received but not yet returned as part of a complete packet
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add received bytes and extract all complete packets.
+
+        :param data: bytes-like chunk received from the transport
+
+        :return: list of packets. Each packet is a bytes object that starts
+                 with the report type. A zero length packet is returned
+                 as an empty bytes object.
+        """
+        buffer = self.buffer
+        buffer += data
+
+        # report type -> (pin offset, bitmap). Read on each call, as
+        # the subscriptions may be disabled.
+        filters = self.subscriptions.filters if self.subscriptions else None
+        skipped = 0
+
+        packets = []
+        position = 0
+        available = len(buffer)
+        while position < available:
+            start = position + 1
+            end = start + buffer[position]
+            if end > available:
+                break
+            if filters and start < end:
+                # buffer[start] is the report type
+                entry = filters.get(buffer[start])
+                if entry is not None:
+                    pin_index = start + entry[0]
+                    if pin_index >= end or not entry[1][buffer[pin_index]]:
+                        skipped += 1
+                        position = end
+                        continue
+            packets.append(bytes(buffer[start:end]))
+            position = end
+
+        if position:
+            del buffer[:position]
+        if skipped:
+            self.subscriptions.skipped += skipped
+        return packets
+
+    def pending(self):
+        """
+        :return: number of buffered bytes belonging to an incomplete packet
+        """
+        return len(self.buffer)
+
+    def reset(self):
+        """
+        Discard any partially received packet.
+        """
+        self.buffer.clear()
@@ -0,0 +1,181 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+from array import array
+
+
+class PinStateTable:
+    """
+    This class holds the latest reported value of every input pin and
+    stepper motor, so that applications can poll the values instead of
+    tracking them in callbacks.
+
+    Each kind of input has a row of PIN_COUNT entries in flat arrays of
+    values, time stamps and sequence numbers, so an update or a lookup is a
+    few index operations. Values are stored as floats and returned as
+    integers, except for DHT temperatures and humidities.
+
+    Sequence numbers are taken from a single counter that is incremented by
+    every update. A sequence number of 0 means that the pin has not reported
+    yet. DHT entries also hold the humidity. Stepper entries are indexed by
+    motor id.
+    """
+
+    KINDS = ('digital', 'analog', 'touch', 'sonar', 'dht',
+             'stepper_distance_to_go', 'stepper_target_position',
+             'stepper_current_position')
+
+    PIN_COUNT = 256
+
+    def __init__(self):
+        # kind -> index of the first entry of its row
+        self.rows = {kind: index * self.PIN_COUNT
+                     for index, kind in enumerate(self.KINDS)}
+
+        size = len(self.KINDS) * self.PIN_COUNT
+        self.values = array('d', bytes(8 * size))
+        self.time_stamps = array('d', bytes(8 * size))
+        self.sequences = array('Q', bytes(8 * size))
+        self.humidity = array('d', bytes(8 * self.PIN_COUNT))
+
+        # last sequence number assigned
+        self.sequence = 0
+
+        # updates come from the reporter thread, reads from any thread
+        self.lock = threading.Lock()
+
+    def update(self, kind, pin, value, time_stamp):
+        """
+        Store the latest value of a pin.
+
+        :param kind: one of KINDS
+
+        :param pin: pin number. For sonar, the trigger pin.
+                    For steppers, the motor id.
+
+        :param value: reported value. For DHT, the temperature.
+
+        :param time_stamp: time the value was received
+        """
+        index = self.rows[kind] + pin
+        with self.lock:
+            self.sequence += 1
+            self.values[index] = value
+            self.time_stamps[index] = time_stamp
+            self.sequences[index] = self.sequence
+
+    def update_dht(self, pin, humidity, temperature, time_stamp):
+        """
+        Store the latest DHT reading.
+
+        :param pin: DHT pin number
+
+        :param humidity: relative humidity
+
+        :param temperature: temperature
+
+        :param time_stamp: time the reading was received
+        """
+        index = self.rows['dht'] + pin
+        with self.lock:
+            self.sequence += 1
+            self.humidity[pin] = humidity
+            self.values[index] = temperature
+            self.time_stamps[index] = time_stamp
+            self.sequences[index] = self.sequence
+
+    def get(self, kind, pin):
+        """
+        :param kind: one of KINDS
+
+        :param pin: pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        index = self.rows[kind] + pin
+        with self.lock:
+            sequence = self.sequences[index]
+            if not sequence:
+                return None
+            return int(self.values[index]), self.time_stamps[index], sequence
+
+    def get_dht(self, pin):
+        """
+        :param pin: DHT pin number
+
+        :return: (humidity, temperature, time stamp, sequence number)
+                 or None if the DHT has not reported
+        """
+        index = self.rows['dht'] + pin
+        with self.lock:
+            sequence = self.sequences[index]
+            if not sequence:
+                return None
+            return (self.humidity[pin], self.values[index],
+                    self.time_stamps[index], sequence)
+
+    def snapshot(self):
+        """
+        Copy the whole table at once and return the pins that have reported.
+
+        :return: dictionary keyed by kind. Each entry maps a pin number to
+                 (value, time stamp, sequence number). DHT entries are
+                 (humidity, temperature, time stamp, sequence number).
+        """
+        with self.lock:
+            values = self.values[:]
+            time_stamps = self.time_stamps[:]
+            sequences = self.sequences[:]
+            humidity = self.humidity[:]
+
+        return self._build_snapshot(values, time_stamps, sequences, humidity)
+
+    def close(self):
+        """
+        Release the table. The in process table holds no external resources.
+        """
+
+    def _build_snapshot(self, values, time_stamps, sequences, humidity):
+        """
+        :param values: copy of the value array
+
+        :param time_stamps: copy of the time stamp array
+
+        :param sequences: copy of the sequence number array
+
+        :param humidity: copy of the DHT humidity array
+
+        :return: snapshot dictionary, as returned by snapshot()
+        """
+        snapshot = {}
+        for kind, row in self.rows.items():
+            pins = {}
+            for pin in range(self.PIN_COUNT):
+                index = row + pin
+                sequence = sequences[index]
+                if not sequence:
+                    continue
+                if kind == 'dht':
+                    pins[pin] = (humidity[pin], values[index],
+                                 time_stamps[index], sequence)
+                else:
+                    pins[pin] = (int(values[index]), time_stamps[index],
+                                 sequence)
+            snapshot[kind] = pins
+        return snapshot
@@ -141,3 +141,39 @@ class PrivateConstants:
     # DHT Report subtypes
     DHT_DATA = 0
     DHT_ERROR = 1
+
+    # maximum number of bytes of normal priority frames coalesced into a
+    # single link write. Urgent frames are checked between writes.
+    MAX_COALESCED_WRITE_SIZE = 512
+
+    # seconds a blocking send waits before checking that the writer
+    # thread is still alive
+    SEND_WAIT_INTERVAL = .5
+
+    # maximum number of bytes requested by a single transport read
+    MAX_RECEIVE_SIZE = 4096
+
+    # seconds to wait for the ESP32 to boot after its serial port is opened
+    SERIAL_BOOT_WAIT = 2
+
+    # seconds to wait after a RESET command before reconnecting,
+    # so that the new connection is not made to the old firmware session
+    RESTART_WAIT = .5
+
+    # name advertised by the Telemetrix4Esp32BLE server
+    BLE_DEVICE_NAME = 'Telemetrix4ESP32BLE'
+
+    # Nordic UART service UUID advertised by the BLE server
+    BLE_UART_SERVICE_UUID = '6e400001-b5a3-f393-e0a9-e50e24dcca9e'
+
+    # maximum number of seconds to scan for the BLE server
+    BLE_SCAN_TIMEOUT = 15
+
+    # loop back data bytes sent by heartbeats and clock synchronization.
+    # Replies are matched to their requests by order, so users may loop
+    # back the same values.
+    HEARTBEAT_MARKER = 0xff
+    CLOCK_MARKER = 0xfe
+
+    # maximum number of loop back requests waiting for a reply
+    MAX_LOOP_BACK_PENDING = 256
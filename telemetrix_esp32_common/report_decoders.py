@@ -0,0 +1,35 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import struct
+
+# Precompiled decoders for the fixed layout reports, shared by both clients.
+# Each is applied with unpack_from to the report data that follows the
+# report type byte.
+
+# analog, touch and sonar reports: pin, 16 bit big endian value
+PIN_VALUE = struct.Struct('>BH')
+
+# debug print report: id, 16 bit big endian value
+DEBUG_VALUE = struct.Struct('>BH')
+
+# DHT data report: subtype, pin, little endian float humidity and temperature
+DHT_DATA = struct.Struct('<BBff')
+
+# stepper distance to go, target and current position reports:
+# motor id, 32 bit big endian signed value
+STEPPER_VALUE = struct.Struct('>Bi')
@@ -0,0 +1,186 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import struct
+from multiprocessing import shared_memory
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common import shared_segment
+
+
+class ReportRing:
+    """
+    This class is a single producer, single consumer ring buffer of decoded
+    reports held in a multiprocessing.shared_memory segment.
+
+    The producer and consumer may be in different processes. Reports are
+    written as fixed size binary records, so nothing is pickled.
+
+    Segment layout (little endian):
+
+        header: write count (uint64), read count (uint64),
+                dropped count (uint64), capacity (uint64),
+                fields per record (uint64), oversized count (uint64)
+
+        records: capacity slots, each holding callback id (uint16),
+                 field count (uint16), integer field mask (uint64) and
+                 max_fields float64 fields
+
+    Integer fields are stored as float64 and restored as int when read.
+    Reports with more than max_fields fields are not stored. They are
+    counted, as are the reports dropped because the ring is full.
+    """
+
+    # default number of fields per record. It holds every pin, DHT,
+    # sonar and stepper report. I2C, SPI and OneWire reports carry their
+    # data bytes as separate fields and may need more.
+    MAX_FIELDS = 12
+
+    # the integer field mask limits the record size
+    FIELD_LIMIT = 64
+
+    HEADER = struct.Struct('<QQQQQQ')
+    RECORD_HEADER = struct.Struct('<HHQ')
+
+    # offsets of the header counters
+    WRITE_COUNT = 0
+    READ_COUNT = 8
+    DROPPED_COUNT = 16
+    OVERSIZED_COUNT = 40
+
+    COUNTER = struct.Struct('<Q')
+
+    def __init__(self, name=None, capacity=4096, create=True, max_fields=MAX_FIELDS):
+        """
+
+        :param name: shared memory segment name. Required when attaching
+                     to an existing ring.
+
+        :param capacity: number of record slots when creating a ring
+
+        :param create: True to create the segment, False to attach to it
+
+        :param max_fields: largest report, in fields, the ring can hold,
+                           up to FIELD_LIMIT. Only used when creating a
+                           ring. Attached rings use the creator's value.
+        """
+        if create:
+            if not 0 < max_fields <= self.FIELD_LIMIT:
+                raise RuntimeError(f'ReportRing: max_fields must be between 1 '
+                                   f'and {self.FIELD_LIMIT}')
+            size = self.HEADER.size + capacity * (self.RECORD_HEADER.size +
+                                                  8 * max_fields)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.HEADER.pack_into(self.shm.buf, 0, 0, 0, 0, capacity, max_fields, 0)
+        else:
+            # the creating process owns the segment
+            self.shm = shared_segment.attach(name)
+
+        self.name = self.shm.name
+        self.buffer = self.shm.buf
+        self.capacity, self.max_fields = self.HEADER.unpack_from(self.buffer, 0)[3:5]
+        self.fields = struct.Struct('<' + 'd' * self.max_fields)
+        self.record_size = self.RECORD_HEADER.size + self.fields.size
+        self.padding = (0.0,) * self.max_fields
+
+    def put(self, callback_id, report):
+        """
+        Producer side. Append a report.
+
+        :param callback_id: id of the consumer side callback for the report
+
+        :param report: list of int and float values. Report objects and
+                       bytes fields can not be stored.
+
+        :return: True if stored, False if the ring was full or the report
+                 has more than max_fields fields
+        """
+        buffer = self.buffer
+        if len(report) > self.max_fields:
+            oversized = self.COUNTER.unpack_from(buffer, self.OVERSIZED_COUNT)[0]
+            self.COUNTER.pack_into(buffer, self.OVERSIZED_COUNT, oversized + 1)
+            return False
+
+        write_count = self.COUNTER.unpack_from(buffer, self.WRITE_COUNT)[0]
+        read_count = self.COUNTER.unpack_from(buffer, self.READ_COUNT)[0]
+        if write_count - read_count >= self.capacity:
+            dropped = self.COUNTER.unpack_from(buffer, self.DROPPED_COUNT)[0]
+            self.COUNTER.pack_into(buffer, self.DROPPED_COUNT, dropped + 1)
+            return False
+
+        int_mask = 0
+        for index, value in enumerate(report):
+            if isinstance(value, int):
+                int_mask |= 1 << index
+
+        offset = self.HEADER.size + (write_count % self.capacity) * self.record_size
+        self.RECORD_HEADER.pack_into(buffer, offset, callback_id, len(report), int_mask)
+        self.fields.pack_into(buffer, offset + self.RECORD_HEADER.size,
+                              *(tuple(report) + self.padding[len(report):]))
+
+        # publish the record only after it has been completely written
+        self.COUNTER.pack_into(buffer, self.WRITE_COUNT, write_count + 1)
+        return True
+
+    def get_all(self):
+        """
+        Consumer side. Remove and return all available reports.
+
+        :return: list of (callback id, report list) tuples
+        """
+        buffer = self.buffer
+        write_count = self.COUNTER.unpack_from(buffer, self.WRITE_COUNT)[0]
+        read_count = self.COUNTER.unpack_from(buffer, self.READ_COUNT)[0]
+
+        reports = []
+        while read_count < write_count:
+            offset = self.HEADER.size + (read_count % self.capacity) * self.record_size
+            callback_id, count, int_mask = self.RECORD_HEADER.unpack_from(buffer, offset)
+            values = self.fields.unpack_from(buffer, offset + self.RECORD_HEADER.size)
+            report = [int(values[index]) if int_mask & (1 << index) else values[index]
+                      for index in range(count)]
+            reports.append((callback_id, report))
+            read_count += 1
+
+        self.COUNTER.pack_into(buffer, self.READ_COUNT, read_count)
+        return reports
+
+    def dropped(self):
+        """
+        :return: number of reports dropped because the ring was full
+        """
+        return self.COUNTER.unpack_from(self.buffer, self.DROPPED_COUNT)[0]
+
+    def oversized(self):
+        """
+        :return: number of reports not stored because they have more
+                 than max_fields fields
+        """
+        return self.COUNTER.unpack_from(self.buffer, self.OVERSIZED_COUNT)[0]
+
+    def close(self):
+        """
+        Detach from the segment.
+        """
+        self.buffer = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Remove the segment. Called by the creating process when done.
+        """
+        self.shm.unlink()
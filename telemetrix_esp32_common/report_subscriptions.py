@@ -0,0 +1,77 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+
+class ReportSubscriptions:
+    """
+    This class keeps a subscription bitmap for each pin based report type.
+    A pin is subscribed while a callback is registered for it.
+
+    A PacketFramer given this object checks the bitmap on the received
+    bytes, before a packet is copied out of the receive buffer or decoded,
+    so reports for pins without a callback are dropped at the cost of a
+    table lookup. Dropped packets are counted.
+
+    Report types without a bitmap, such as i2c or firmware reports, are
+    always wanted.
+    """
+
+    # report type -> index of the pin number in the packet.
+    # packet[0] is the report type.
+    PIN_OFFSETS = {PrivateConstants.DIGITAL_REPORT: 1,
+                   PrivateConstants.ANALOG_REPORT: 1,
+                   PrivateConstants.TOUCH_REPORT: 1,
+                   PrivateConstants.SONAR_DISTANCE: 1,
+                   PrivateConstants.DHT_REPORT: 2}
+
+    def __init__(self):
+        # report type -> (pin offset, bitmap with one byte per pin)
+        self.filters = {report_type: (offset, bytearray(256))
+                        for report_type, offset in self.PIN_OFFSETS.items()}
+
+        # number of packets dropped because nobody subscribed to them
+        self.skipped = 0
+
+    def subscribe(self, report_type, pin):
+        """
+        :param report_type: report type, for example DIGITAL_REPORT
+
+        :param pin: pin number
+        """
+        entry = self.filters.get(report_type)
+        if entry:
+            entry[1][pin] = 1
+
+    def unsubscribe(self, report_type, pin):
+        """
+        :param report_type: report type, for example DIGITAL_REPORT
+
+        :param pin: pin number
+        """
+        entry = self.filters.get(report_type)
+        if entry:
+            entry[1][pin] = 0
+
+    def disable(self):
+        """
+        Pass every packet, for example when the packets are forwarded
+        to other clients instead of being decoded.
+        """
+        self.filters = {}
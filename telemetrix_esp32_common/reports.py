@@ -0,0 +1,155 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+
+class Report:
+    """
+    Base class of the report objects passed to callbacks when a client is
+    created with report_objects=True. They replace the default report lists.
+
+    Each class uses __slots__, so instances have no per instance dictionary,
+    and fields are read by name instead of by list position. Reports of the
+    same class are equal if all of their fields are equal.
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class PinReport(Report):
+    """
+    A digital, analog, touch or sonar report.
+
+    For sonar reports, pin is the trigger pin and value is the distance.
+    """
+    __slots__ = ('report_type', 'pin', 'value', 'timestamp')
+
+    def __init__(self, report_type, pin, value, timestamp):
+        self.report_type = report_type
+        self.pin = pin
+        self.value = value
+        self.timestamp = timestamp
+
+
+class DhtReport(Report):
+    """
+    A DHT report. If subtype is DHT_ERROR, humidity and temperature
+    are None and error holds the error value.
+    """
+    __slots__ = ('report_type', 'subtype', 'pin', 'humidity', 'temperature',
+                 'error', 'timestamp')
+
+    def __init__(self, report_type, subtype, pin, humidity, temperature,
+                 error, timestamp):
+        self.report_type = report_type
+        self.subtype = subtype
+        self.pin = pin
+        self.humidity = humidity
+        self.temperature = temperature
+        self.error = error
+        self.timestamp = timestamp
+
+
+class I2cReport(Report):
+    """
+    An i2c read report.
+    """
+    __slots__ = ('report_type', 'byte_count', 'address', 'register', 'data',
+                 'timestamp')
+
+    def __init__(self, report_type, byte_count, address, register, data,
+                 timestamp):
+        self.report_type = report_type
+        self.byte_count = byte_count
+        self.address = address
+        self.register = register
+        self.data = data
+        self.timestamp = timestamp
+
+
+class SpiReport(Report):
+    """
+    An SPI read report.
+    """
+    __slots__ = ('report_type', 'register', 'byte_count', 'data', 'timestamp')
+
+    def __init__(self, report_type, register, byte_count, data, timestamp):
+        self.report_type = report_type
+        self.register = register
+        self.byte_count = byte_count
+        self.data = data
+        self.timestamp = timestamp
+
+
+class OneWireReport(Report):
+    """
+    A OneWire report. subtype is the OneWire command that was answered.
+    """
+    __slots__ = ('report_type', 'subtype', 'data', 'timestamp')
+
+    def __init__(self, report_type, subtype, data, timestamp):
+        self.report_type = report_type
+        self.subtype = subtype
+        self.data = data
+        self.timestamp = timestamp
+
+
+class StepperReport(Report):
+    """
+    A stepper motor report.
+
+    value is the distance to go, the target position, the current position
+    or the running state, depending on report_type. It is None for a run
+    complete report.
+    """
+    __slots__ = ('report_type', 'motor_id', 'value', 'timestamp')
+
+    def __init__(self, report_type, motor_id, value, timestamp):
+        self.report_type = report_type
+        self.motor_id = motor_id
+        self.value = value
+        self.timestamp = timestamp
+
+
+class WindowReport(Report):
+    """
+    The statistics of an analog, touch or sonar input for one aggregation
+    window. start and end are the time stamps of the window's first and
+    last samples.
+    """
+    __slots__ = ('report_type', 'pin', 'minimum', 'maximum', 'mean', 'count',
+                 'start', 'end')
+
+    def __init__(self, report_type, pin, minimum, maximum, mean, count, start,
+                 end):
+        self.report_type = report_type
+        self.pin = pin
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+        self.count = count
+        self.start = start
+        self.end = end
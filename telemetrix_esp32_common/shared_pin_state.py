@@ -0,0 +1,277 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import struct
+import threading
+import time
+from array import array
+from multiprocessing import shared_memory
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common import shared_segment
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.pin_state import PinStateTable
+
+
+class SharedPinStateTable(PinStateTable):
+    """
+    A PinStateTable held in a multiprocessing.shared_memory segment, so that
+    other processes can read the latest pin values without sockets or
+    pickling.
+
+    The client that owns the board creates the segment and writes to it.
+    Other processes attach to it by name with create=False and use get,
+    get_dht and snapshot.
+
+    Segment layout (little endian), with N = len(KINDS) * PIN_COUNT:
+
+        header: magic b'TMXP', layout version (uint16),
+                kind count (uint16), seqlock counter (uint64)
+
+        values: N float64
+
+        time stamps: N float64
+
+        sequence numbers: N uint64
+
+        DHT humidity: PIN_COUNT float64
+
+    Entry n of each array belongs to kind n // PIN_COUNT and
+    pin n % PIN_COUNT.
+
+    Writers make the seqlock counter odd before changing the table and even
+    when done. A reader copies what it needs and accepts the copy only if
+    the counter was even and unchanged, otherwise it reads again.
+    """
+
+    MAGIC = b'TMXP'
+
+    VERSION = 1
+
+    HEADER = struct.Struct('<4sHHQ')
+
+    # offset of the seqlock counter
+    SEQLOCK = 8
+
+    COUNTER = struct.Struct('<Q')
+
+    def __init__(self, name=None, create=True):
+        """
+
+        :param name: shared memory segment name. Required when attaching
+                     to an existing table.
+
+        :param create: True to create the segment, False to attach to it
+        """
+        self.rows = {kind: index * self.PIN_COUNT
+                     for index, kind in enumerate(self.KINDS)}
+
+        size = len(self.KINDS) * self.PIN_COUNT
+        self.table_size = 8 * (3 * size + self.PIN_COUNT)
+
+        if create:
+            self.shm = shared_memory.SharedMemory(
+                name=name, create=True, size=self.HEADER.size + self.table_size)
+            self.HEADER.pack_into(self.shm.buf, 0, self.MAGIC, self.VERSION,
+                                  len(self.KINDS), 0)
+        else:
+            # the creating process owns the segment
+            self.shm = shared_segment.attach(name)
+            magic, version, kind_count, _ = self.HEADER.unpack_from(self.shm.buf, 0)
+            if magic != self.MAGIC or version != self.VERSION or \
+                    kind_count != len(self.KINDS):
+                self.shm.close()
+                raise RuntimeError(f'{name} is not a compatible pin state table')
+
+        self.name = self.shm.name
+        self.created = create
+        self.buffer = self.shm.buf
+
+        # typed views of the table arrays
+        offset = self.HEADER.size
+        self.values = self.buffer[offset:offset + 8 * size].cast('d')
+        offset += 8 * size
+        self.time_stamps = self.buffer[offset:offset + 8 * size].cast('d')
+        offset += 8 * size
+        self.sequences = self.buffer[offset:offset + 8 * size].cast('Q')
+        offset += 8 * size
+        self.humidity = self.buffer[offset:offset + 8 * self.PIN_COUNT].cast('d')
+
+        # last sequence number assigned and the seqlock counter value.
+        # Only the creating process writes.
+        self.sequence = 0
+        self.seqlock = 0
+
+        # serializes writers in the creating process
+        self.lock = threading.Lock()
+
+    def update(self, kind, pin, value, time_stamp):
+        """
+        Store the latest value of a pin.
+
+        :param kind: one of KINDS
+
+        :param pin: pin number. For sonar, the trigger pin.
+                    For steppers, the motor id.
+
+        :param value: reported value. For DHT, the temperature.
+
+        :param time_stamp: time the value was received
+        """
+        index = self.rows[kind] + pin
+        with self.lock:
+            if self.buffer is None:
+                return
+            self.sequence += 1
+            self._write_begin()
+            self.values[index] = value
+            self.time_stamps[index] = time_stamp
+            self.sequences[index] = self.sequence
+            self._write_end()
+
+    def update_dht(self, pin, humidity, temperature, time_stamp):
+        """
+        Store the latest DHT reading.
+
+        :param pin: DHT pin number
+
+        :param humidity: relative humidity
+
+        :param temperature: temperature
+
+        :param time_stamp: time the reading was received
+        """
+        index = self.rows['dht'] + pin
+        with self.lock:
+            if self.buffer is None:
+                return
+            self.sequence += 1
+            self._write_begin()
+            self.humidity[pin] = humidity
+            self.values[index] = temperature
+            self.time_stamps[index] = time_stamp
+            self.sequences[index] = self.sequence
+            self._write_end()
+
+    def _write_begin(self):
+        self.seqlock += 1
+        self.COUNTER.pack_into(self.buffer, self.SEQLOCK, self.seqlock)
+
+    def _write_end(self):
+        self.seqlock += 1
+        self.COUNTER.pack_into(self.buffer, self.SEQLOCK, self.seqlock)
+
+    def _read_begin(self):
+        """
+        :return: seqlock counter value once no write is in progress
+        """
+        while True:
+            start = self.COUNTER.unpack_from(self.buffer, self.SEQLOCK)[0]
+            if not start & 1:
+                return start
+            # a write is in progress - let the writer finish
+            time.sleep(0)
+
+    def _read_retry(self, start):
+        """
+        :param start: counter value returned by _read_begin
+
+        :return: True if a write happened during the read
+        """
+        return self.COUNTER.unpack_from(self.buffer, self.SEQLOCK)[0] != start
+
+    def get(self, kind, pin):
+        """
+        :param kind: one of KINDS
+
+        :param pin: pin number
+
+        :return: (value, time stamp, sequence number) or None if the pin
+                 has not reported
+        """
+        index = self.rows[kind] + pin
+        while True:
+            start = self._read_begin()
+            sequence = self.sequences[index]
+            value = self.values[index]
+            time_stamp = self.time_stamps[index]
+            if not self._read_retry(start):
+                break
+        if not sequence:
+            return None
+        return int(value), time_stamp, sequence
+
+    def get_dht(self, pin):
+        """
+        :param pin: DHT pin number
+
+        :return: (humidity, temperature, time stamp, sequence number)
+                 or None if the DHT has not reported
+        """
+        index = self.rows['dht'] + pin
+        while True:
+            start = self._read_begin()
+            sequence = self.sequences[index]
+            humidity = self.humidity[pin]
+            temperature = self.values[index]
+            time_stamp = self.time_stamps[index]
+            if not self._read_retry(start):
+                break
+        if not sequence:
+            return None
+        return humidity, temperature, time_stamp, sequence
+
+    def snapshot(self):
+        """
+        Copy the whole table at once and return the pins that have reported.
+
+        :return: dictionary keyed by kind. Each entry maps a pin number to
+                 (value, time stamp, sequence number). DHT entries are
+                 (humidity, temperature, time stamp, sequence number).
+        """
+        start_offset = self.HEADER.size
+        while True:
+            start = self._read_begin()
+            table = self.buffer[start_offset:start_offset + self.table_size].tobytes()
+            if not self._read_retry(start):
+                break
+
+        size = len(self.KINDS) * self.PIN_COUNT * 8
+        values = array('d', table[:size])
+        time_stamps = array('d', table[size:2 * size])
+        sequences = array('Q', table[2 * size:3 * size])
+        humidity = array('d', table[3 * size:])
+        return self._build_snapshot(values, time_stamps, sequences, humidity)
+
+    def close(self):
+        """
+        Detach from the segment. The creating process also removes it.
+        """
+        with self.lock:
+            if self.buffer is None:
+                return
+            for view in (self.values, self.time_stamps, self.sequences,
+                         self.humidity):
+                view.release()
+            self.buffer = None
+            self.shm.close()
+            if self.created:
+                try:
+                    self.shm.unlink()
+                except FileNotFoundError:
+                    # the segment was already removed
+                    pass
@@ -0,0 +1,43 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+
+def attach(name):
+    """
+    Attach to an existing shared memory segment without taking ownership
+    of it.
+
+    Before Python 3.13, attaching registers the segment with the
+    process's resource tracker, which removes the segment when the
+    process exits, even though the creating process still uses it.
+
+    :param name: shared memory segment name
+
+    :return: SharedMemory instance
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix':
+        # noinspection PyProtectedMember
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
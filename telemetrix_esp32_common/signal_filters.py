@@ -0,0 +1,227 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import math
+
+# numpy is an optional dependency, only needed for analog filters
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FilterPipeline:
+    """
+    This class filters the samples of one analog input on the host.
+
+    Samples are collected with add() and filtered in batches by run(),
+    so each stage works on arrays instead of single values. Filter state
+    is carried from one batch to the next, so the output is the same as
+    filtering the samples one at a time.
+
+    Stages are given as (name, parameter) tuples and applied in order:
+
+        ('moving_average', window) - mean of the last window samples
+
+        ('median', window) - median of the last window samples
+
+        ('ema', alpha) - exponential moving average,
+                         y = alpha * x + (1 - alpha) * y, 0 < alpha <= 1
+
+        ('low_pass', cutoff) - first order low pass filter with a cutoff
+                               frequency in Hz. The sample time stamps are
+                               used, so irregular sample intervals are
+                               handled.
+
+    Before a window is full, it is padded with the first sample.
+    """
+
+    # maximum number of samples held before a batch must be run
+    MAX_BATCH = 256
+
+    def __init__(self, filters):
+        """
+
+        :param filters: list of (name, parameter) tuples
+        """
+        if np is None:
+            raise RuntimeError('Analog filters require numpy: pip install numpy')
+
+        stage_types = {'moving_average': _MovingAverage,
+                       'median': _Median,
+                       'ema': _Ema,
+                       'low_pass': _LowPass}
+
+        self.stages = []
+        for stage in filters:
+            try:
+                name, parameter = stage
+                self.stages.append(stage_types[name](parameter))
+            except (KeyError, TypeError, ValueError):
+                raise RuntimeError(f'Invalid analog filter: {stage}')
+
+        self.values = []
+        self.time_stamps = []
+
+    def add(self, value, time_stamp):
+        """
+        Queue a sample for the next batch.
+
+        :param value: raw sample value
+
+        :param time_stamp: time the sample was received
+
+        :return: True if the batch is full and should be run
+        """
+        self.values.append(value)
+        self.time_stamps.append(time_stamp)
+        return len(self.values) >= self.MAX_BATCH
+
+    def run(self):
+        """
+        Filter the queued samples.
+
+        :return: (filtered values, time stamps) lists
+        """
+        time_stamps = self.time_stamps
+        values = np.array(self.values, dtype=np.float64)
+        self.values = []
+        self.time_stamps = []
+
+        if values.size:
+            stamps = np.array(time_stamps, dtype=np.float64)
+            for stage in self.stages:
+                values = stage.process(values, stamps)
+        return values.tolist(), time_stamps
+
+
+class _Window:
+    """
+    Base class of the sliding window stages.
+    """
+
+    def __init__(self, window):
+        window = int(window)
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = window
+        # the last window - 1 samples of the previous batch
+        self.history = None
+
+    def windows(self, values):
+        """
+        :param values: new samples
+
+        :return: samples with the history prepended
+        """
+        if self.history is None:
+            self.history = np.full(self.window - 1, values[0])
+        extended = np.concatenate((self.history, values))
+        self.history = extended[len(extended) - (self.window - 1):]
+        return extended
+
+
+class _MovingAverage(_Window):
+    def process(self, values, time_stamps):
+        sums = np.cumsum(np.concatenate(([0.0], self.windows(values))))
+        return (sums[self.window:] - sums[:-self.window]) / self.window
+
+
+class _Median(_Window):
+    def process(self, values, time_stamps):
+        windows = np.lib.stride_tricks.sliding_window_view(self.windows(values),
+                                                           self.window)
+        return np.median(windows, axis=1)
+
+
+class _Recursive:
+    """
+    Base class of the first order recursive stages:
+    y[n] = decay[n] * y[n - 1] + (1 - decay[n]) * x[n]
+
+    A batch is solved in blocks of BLOCK samples. Within a block, every
+    output is a weighted sum of the block's inputs and the output before
+    the block, so the recursion becomes one matrix product per block.
+    """
+
+    BLOCK = 64
+
+    # lower triangle mask for a full block
+    MASK = None
+
+    def __init__(self):
+        self.output = None
+        if _Recursive.MASK is None:
+            _Recursive.MASK = np.tril(np.ones((self.BLOCK, self.BLOCK)))
+
+    def filter(self, values, decay):
+        """
+        :param values: new samples
+
+        :param decay: decay factor of each sample, 0 <= decay < 1
+
+        :return: filtered samples
+        """
+        if self.output is None:
+            self.output = values[0]
+
+        result = np.empty_like(values)
+        # log(0) is avoided, a decay of 0 only passes the input through
+        log_decay = np.log(np.maximum(decay, 1e-300))
+
+        for start in range(0, len(values), self.BLOCK):
+            x = values[start:start + self.BLOCK]
+            size = len(x)
+            cumulative = np.cumsum(log_decay[start:start + size])
+            mask = self.MASK[:size, :size]
+            # weight of input k in output n is
+            # (1 - decay[k]) * product of decay[k + 1 .. n]
+            weights = np.exp((cumulative[:, None] - cumulative[None, :]) * mask) * mask
+            y = weights @ ((1.0 - decay[start:start + size]) * x) + \
+                np.exp(cumulative) * self.output
+            result[start:start + size] = y
+            self.output = y[-1]
+        return result
+
+
+class _Ema(_Recursive):
+    def __init__(self, alpha):
+        super().__init__()
+        alpha = float(alpha)
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError('alpha must be in (0, 1]')
+        self.decay = 1.0 - alpha
+
+    def process(self, values, time_stamps):
+        return self.filter(values, np.full(len(values), self.decay))
+
+
+class _LowPass(_Recursive):
+    def __init__(self, cutoff):
+        super().__init__()
+        cutoff = float(cutoff)
+        if cutoff <= 0.0:
+            raise ValueError('cutoff must be positive')
+        self.omega = 2.0 * math.pi * cutoff
+        self.last_time_stamp = None
+
+    def process(self, values, time_stamps):
+        if self.last_time_stamp is None:
+            self.last_time_stamp = time_stamps[0]
+        intervals = np.diff(np.concatenate(([self.last_time_stamp], time_stamps)))
+        self.last_time_stamp = time_stamps[-1]
+        return self.filter(values, np.exp(-self.omega * np.maximum(intervals, 0.0)))
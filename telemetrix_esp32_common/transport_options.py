@@ -0,0 +1,151 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import socket
+import sys
+
+
+class TransportOptions:
+    """
+    This class holds the tuning parameters for the link to the ESP32:
+    the WI-FI (TCP/IP) socket options, the USB serial baud rate, BLE
+    address caching, the reconnect backoff and the link heartbeat.
+
+    The defaults favor low latency: Nagle's algorithm is disabled so that
+    small command frames are sent immediately, and TCP keepalive is enabled
+    so that a dead connection is eventually detected by the operating system.
+    """
+
+    def __init__(self, tcp_nodelay=True, receive_buffer_size=None,
+                 send_buffer_size=None, keepalive=True, keepalive_idle=10,
+                 keepalive_interval=5, keepalive_count=3,
+                 connect_timeout=5.0, read_timeout=None, write_timeout=None,
+                 baud_rate=115200, cache_ble_address=True,
+                 reconnect_min_delay=.1, reconnect_max_delay=5.0,
+                 heartbeat_interval=None, heartbeat_misses=3):
+        """
+
+        :param tcp_nodelay: If True, disable Nagle's algorithm (TCP_NODELAY)
+
+        :param receive_buffer_size: SO_RCVBUF size in bytes.
+                                    None keeps the operating system default.
+
+        :param send_buffer_size: SO_SNDBUF size in bytes.
+                                 None keeps the operating system default.
+
+        :param keepalive: If True, enable TCP keepalive probes
+
+        :param keepalive_idle: seconds of idle time before the first probe
+
+        :param keepalive_interval: seconds between probes
+
+        :param keepalive_count: number of unanswered probes before the
+                                connection is dropped
+
+        :param connect_timeout: seconds to wait for the connection to be
+                                established. None waits forever.
+
+        :param read_timeout: seconds a single read may wait for data.
+                             A read that times out is retried, so the
+                             timeout only bounds how long the receiver
+                             waits between checks. None waits forever.
+
+        :param write_timeout: seconds a single write may block on a full
+                              send buffer before it fails. A write that
+                              times out may leave a partial frame on the
+                              link. None waits forever.
+
+        :param baud_rate: USB serial transport baud rate
+
+        :param cache_ble_address: If True, the BLE address found by discovery
+                                  is saved, and later connections try it
+                                  before scanning.
+
+        :param reconnect_min_delay: seconds to wait after the first failed
+                                    reconnect attempt, if the client's
+                                    auto_reconnect is set. The delay doubles
+                                    after each failed attempt.
+
+        :param reconnect_max_delay: maximum seconds between reconnect attempts
+
+        :param heartbeat_interval: seconds between link heartbeats. A loop back
+                                   request is sent at this interval. If None,
+                                   the heartbeat is disabled.
+
+        :param heartbeat_misses: number of consecutive unanswered heartbeats
+                                 after which the link is declared stalled.
+                                 A stall is detected within
+                                 (heartbeat_misses + 1) * heartbeat_interval
+                                 seconds of the last reply.
+        """
+        self.tcp_nodelay = tcp_nodelay
+        self.receive_buffer_size = receive_buffer_size
+        self.send_buffer_size = send_buffer_size
+        self.keepalive = keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.baud_rate = baud_rate
+        self.cache_ble_address = cache_ble_address
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_misses = heartbeat_misses
+
+    def apply(self, sock):
+        """
+        Apply the socket level options to a socket.
+
+        Buffer sizes are best applied before the socket is connected.
+
+        :param sock: a TCP socket
+        """
+        if self.tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if self.receive_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                            self.receive_buffer_size)
+
+        if self.send_buffer_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                            self.send_buffer_size)
+
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+            if sys.platform == 'win32':
+                sock.ioctl(socket.SIO_KEEPALIVE_VALS,
+                           (1, int(self.keepalive_idle * 1000),
+                            int(self.keepalive_interval * 1000)))
+            else:
+                if hasattr(socket, 'TCP_KEEPIDLE'):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,
+                                    self.keepalive_idle)
+                elif hasattr(socket, 'TCP_KEEPALIVE'):
+                    # macOS name for the idle time
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE,
+                                    self.keepalive_idle)
+                if hasattr(socket, 'TCP_KEEPINTVL'):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL,
+                                    self.keepalive_interval)
+                if hasattr(socket, 'TCP_KEEPCNT'):
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT,
+                                    self.keepalive_count)
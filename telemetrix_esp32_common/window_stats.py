@@ -0,0 +1,191 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import math
+from array import array
+
+
+class WindowStats:
+    """
+    This class reduces the reports of analog, touch and sonar inputs to
+    one set of statistics - minimum, maximum, mean and sample count - per
+    time window.
+
+    Each kind of input has a row of PIN_COUNT entries in flat arrays, and
+    the statistics are updated incrementally with every sample, so no
+    samples are stored.
+
+    A window starts with its first sample. It is complete when a sample
+    arrives at or after the window's end. That sample starts the next
+    window. If no sample arrives, expire() completes the window once its
+    end has passed.
+    """
+
+    KINDS = ('analog', 'touch', 'sonar')
+
+    PIN_COUNT = 256
+
+    def __init__(self):
+        # kind -> index of the first entry of its row
+        self.rows = {kind: index * self.PIN_COUNT
+                     for index, kind in enumerate(self.KINDS)}
+
+        size = len(self.KINDS) * self.PIN_COUNT
+
+        # window length in seconds. 0 disables aggregation for the pin.
+        self.windows = array('d', bytes(8 * size))
+
+        # statistics of the current window
+        self.counts = array('Q', bytes(8 * size))
+        self.totals = array('d', bytes(8 * size))
+        self.minimums = array('d', bytes(8 * size))
+        self.maximums = array('d', bytes(8 * size))
+
+        # time stamps of the first and last sample of the current window
+        self.starts = array('d', bytes(8 * size))
+        self.ends = array('d', bytes(8 * size))
+
+        # indexes of the pins with aggregation enabled
+        self.enabled = set()
+
+        # no open window ends before this time
+        self.next_end = math.inf
+
+    def configure(self, kind, pin, window):
+        """
+        Enable or disable aggregation for a pin.
+        The pin's current window is discarded.
+
+        :param kind: one of KINDS
+
+        :param pin: pin number. For sonar, the trigger pin.
+
+        :param window: window length in seconds. None or 0 disables
+                       aggregation.
+        """
+        if window is not None and window < 0:
+            raise RuntimeError('The aggregation window must be positive')
+        index = self.rows[kind] + pin
+        self.windows[index] = window or 0.0
+        self.counts[index] = 0
+        if window:
+            self.enabled.add(index)
+        else:
+            self.enabled.discard(index)
+
+    def active(self, kind, pin):
+        """
+        :param kind: one of KINDS
+
+        :param pin: pin number
+
+        :return: True if the pin's samples are aggregated
+        """
+        return self.windows[self.rows[kind] + pin] > 0.0
+
+    def add(self, kind, pin, value, time_stamp):
+        """
+        Add a sample to the pin's current window.
+
+        :param kind: one of KINDS
+
+        :param pin: pin number
+
+        :param value: sample value
+
+        :param time_stamp: time the sample was received
+
+        :return: (minimum, maximum, mean, count, start time, end time) of the
+                 window the sample completed, or None
+        """
+        index = self.rows[kind] + pin
+        count = self.counts[index]
+        completed = None
+
+        if count and time_stamp >= self.starts[index] + self.windows[index]:
+            completed = (self.minimums[index], self.maximums[index],
+                         self.totals[index] / count, count,
+                         self.starts[index], self.ends[index])
+            count = 0
+
+        if count:
+            self.totals[index] += value
+            if value < self.minimums[index]:
+                self.minimums[index] = value
+            elif value > self.maximums[index]:
+                self.maximums[index] = value
+        else:
+            self.totals[index] = value
+            self.minimums[index] = value
+            self.maximums[index] = value
+            self.starts[index] = time_stamp
+            end = time_stamp + self.windows[index]
+            if end < self.next_end:
+                self.next_end = end
+
+        self.counts[index] = count + 1
+        self.ends[index] = time_stamp
+        return completed
+
+    def expire(self, now):
+        """
+        Complete the windows that ended without a sample arriving after them.
+
+        :param now: current time, in the same time base as the sample
+                    time stamps
+
+        :return: list of (kind, pin, (minimum, maximum, mean, count,
+                 start time, end time)) for the completed windows
+        """
+        if now < self.next_end:
+            return []
+
+        completed = []
+        next_end = math.inf
+        # configure() may change the set from another thread
+        for index in tuple(self.enabled):
+            count = self.counts[index]
+            if not count:
+                continue
+            end = self.starts[index] + self.windows[index]
+            if now >= end:
+                completed.append((self.KINDS[index // self.PIN_COUNT],
+                                  index % self.PIN_COUNT,
+                                  (self.minimums[index], self.maximums[index],
+                                   self.totals[index] / count, count,
+                                   self.starts[index], self.ends[index])))
+                self.counts[index] = 0
+            elif end < next_end:
+                next_end = end
+        self.next_end = next_end
+        return completed
+
+    def wait_time(self, now):
+        """
+        :param now: current time, in the same time base as the sample
+                    time stamps
+
+        :return: seconds until expire() should be called again, or None
+                 if no pin is aggregated
+        """
+        enabled = tuple(self.enabled)
+        if not enabled:
+            return None
+        # a window that starts later ends no sooner than the shortest
+        # window length from now
+        shortest = min(self.windows[index] for index in enabled)
+        return max(min(self.next_end - now, shortest), 0.0)
@@ -0,0 +1,210 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import os
+import pty
+import socket
+import threading
+import time
+
+from telemetrix_esp32_common.packet_framer import PacketFramer
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+
+class FakeBoard:
+    """
+    A TCP server that stands in for a Telemetrix4Esp32 WI-FI board.
+    open_pty() also serves a pseudo terminal in place of a serial board.
+
+    It answers firmware version and loop back requests and records every
+    command it receives with its arrival time. It can be made to stop
+    answering, like a hung board, and to read slowly, like a congested link.
+    A RESET command closes the connection, as the restarting ESP32 does.
+    """
+
+    FIRMWARE = (2, 0, 0)
+
+    def __init__(self):
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+
+        # (time.monotonic(), command bytes) for every command received
+        self.commands = []
+
+        # set to stop answering loop back requests
+        self.hung = threading.Event()
+
+        # number of RESET commands received
+        self.restarts = 0
+
+        # seconds to sleep after each read, and bytes per read
+        self.read_delay = 0.0
+        self.read_size = 4096
+
+        self.connections = []
+        self.running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while self.running:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+            threading.Thread(target=self._serve, args=(connection,),
+                             daemon=True).start()
+
+    def open_pty(self):
+        """
+        Serve the master side of a new pseudo terminal.
+
+        :return: device path of the slave side, to be opened as a serial port
+        """
+        master, slave = pty.openpty()
+        path = os.ttyname(slave)
+        connection = _PtyConnection(master, slave)
+        self.connections.append(connection)
+        threading.Thread(target=self._serve, args=(connection,),
+                         daemon=True).start()
+        return path
+
+    def _serve(self, connection):
+        framer = PacketFramer()
+        while self.running:
+            try:
+                data = connection.recv(self.read_size)
+            except OSError:
+                return
+            if not data:
+                return
+            now = time.monotonic()
+            for command in framer.feed(data):
+                if not command:
+                    continue
+                self.commands.append((now, command))
+                self._answer(connection, command)
+            if self.read_delay:
+                time.sleep(self.read_delay)
+
+    def _answer(self, connection, command):
+        if command[0] == PrivateConstants.GET_FIRMWARE_VERSION:
+            self.send_report(PrivateConstants.FIRMWARE_REPORT, self.FIRMWARE,
+                             connection)
+        elif command[0] == PrivateConstants.LOOP_COMMAND and \
+                not self.hung.is_set():
+            self.send_report(PrivateConstants.LOOP_COMMAND, command[1:],
+                             connection)
+        elif command[0] == PrivateConstants.RESET:
+            self.restarts += 1
+            self._drop(connection)
+
+    def send_report(self, report_type, data, connection=None):
+        """
+        Send a report to the client.
+
+        :param report_type: report id
+
+        :param data: report data
+
+        :param connection: connection to send on. Defaults to all of them.
+        """
+        frame = bytes([len(data) + 1, report_type]) + bytes(data)
+        for target in [connection] if connection else list(self.connections):
+            try:
+                target.sendall(frame)
+            except OSError:
+                pass
+
+    def send_raw(self, data):
+        """
+        Send bytes to every client as they are, for example part of a frame.
+
+        :param data: bytes to send
+        """
+        for target in list(self.connections):
+            try:
+                target.sendall(data)
+            except OSError:
+                pass
+
+    def received(self, command_id):
+        """
+        :param command_id: command id
+
+        :return: list of (arrival time, command) for that command id
+        """
+        return [entry for entry in self.commands if entry[1][0] == command_id]
+
+    def drop_connections(self):
+        """
+        Close the open connections, as a board reset would.
+        New connections are still accepted.
+        """
+        for connection in list(self.connections):
+            self._drop(connection)
+
+    def _drop(self, connection):
+        try:
+            self.connections.remove(connection)
+        except ValueError:
+            pass
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+            connection.close()
+        except OSError:
+            pass
+
+    def close(self):
+        self.running = False
+        try:
+            # wakes the accept thread
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+        for connection in self.connections:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+
+class _PtyConnection:
+    """
+    Gives the master side of a pseudo terminal the socket methods
+    used by FakeBoard.
+    """
+
+    def __init__(self, master, slave):
+        self.master = master
+        # held open so that reads do not fail before the client opens it
+        self.slave = slave
+
+    def recv(self, size):
+        return os.read(self.master, size)
+
+    def sendall(self, data):
+        while data:
+            data = data[os.write(self.master, data):]
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
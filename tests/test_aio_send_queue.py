@@ -0,0 +1,100 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+# seconds each transport write takes on the simulated slow link
+WRITE_TIME = .005
+
+# normal priority frames queued ahead of the stop command
+BACKLOG = 20000
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+async def start_client(board):
+    client = TelemetrixAioEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                                autostart=False, restart_on_shutdown=False,
+                                shutdown_on_exception=False)
+    await client.start_aio()
+
+    # every write now waits for the simulated link
+    write = client.transport.write
+
+    async def slow_write(data):
+        await asyncio.sleep(WRITE_TIME)
+        await write(data)
+
+    client.transport.write = slow_write
+    return client
+
+
+def fill_send_queue(client):
+    return [asyncio.ensure_future(
+        client._send_command([PrivateConstants.DIGITAL_WRITE, 2, value & 1]))
+        for value in range(BACKLOG)]
+
+
+def test_stop_command_latency_on_saturated_link(board):
+    async def run():
+        client = await start_client(board)
+        senders = fill_send_queue(client)
+        await asyncio.sleep(.05)
+        assert await client.get_send_queue_depth() > BACKLOG // 2
+
+        start = time.monotonic()
+        await client._send_command([PrivateConstants.STOP_ALL_REPORTS], urgent=True)
+        latency = time.monotonic() - start
+        depth = await client.get_send_queue_depth()
+
+        await client.shutdown()
+        await asyncio.gather(*senders, return_exceptions=True)
+        return latency, depth
+
+    latency, depth = asyncio.run(run())
+    # the stop command waits for at most the write in progress,
+    # not for the frames queued ahead of it
+    assert latency < 10 * WRITE_TIME
+    assert depth > BACKLOG // 2
+
+
+def test_shutdown_releases_queued_senders(board):
+    async def run():
+        client = await start_client(board)
+        senders = fill_send_queue(client)
+        await asyncio.sleep(.05)
+        await client.shutdown()
+        return await asyncio.wait_for(
+            asyncio.gather(*senders, return_exceptions=True), 2)
+
+    results = asyncio.run(run())
+    failed = [result for result in results if isinstance(result, RuntimeError)]
+    assert failed
+    assert all(result is None or isinstance(result, RuntimeError)
+               for result in results)
@@ -0,0 +1,180 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import math
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+# noinspection PyUnresolvedReferences
+from telemetrix_esp32_common.aligned_sampler import AlignedSampler
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.reports import (DhtReport, PinReport,
+                                             WindowReport)
+
+PERIOD = .1
+
+START = 1000.0
+
+
+class FixedClock:
+    """
+    Stand in for a LinkClock with a known time stamp uncertainty.
+    """
+    def __init__(self, uncertainty):
+        self.value = uncertainty
+
+    def uncertainty(self):
+        return self.value
+
+
+@pytest.fixture
+def sampler():
+    sampler = AlignedSampler(PERIOD, latency=.5)
+    sampler.add_channel('a')
+    sampler.add_channel('b')
+    return sampler
+
+
+def nearest(times, tick):
+    return min(abs(tick - time_stamp) for time_stamp in times)
+
+
+def test_channels_are_interpolated_onto_common_ticks(sampler):
+    # the boards sample at different rates and phases, and both signals
+    # are linear, so interpolation must reproduce them exactly
+    a_times = [START + .07 * i for i in range(30)]
+    b_times = [START + .03 + .11 * i for i in range(20)]
+    for time_stamp in a_times:
+        sampler.add('a', 2 * time_stamp, time_stamp)
+    for time_stamp in b_times:
+        sampler.add('b', -time_stamp, time_stamp)
+
+    ticks, values, errors = sampler.collect(now=0)
+
+    # ticks run from the first sample up to the newest sample of the
+    # slowest channel
+    assert ticks[0] == pytest.approx(START)
+    assert np.allclose(np.diff(ticks), PERIOD)
+    assert ticks[-1] <= min(a_times[-1], b_times[-1])
+    assert ticks[-1] + PERIOD > min(a_times[-1], b_times[-1])
+    assert values.shape == errors.shape == (len(ticks), 2)
+
+    assert np.allclose(values[:, 0], 2 * ticks)
+    # b has no sample before the first tick
+    assert math.isnan(values[0, 1])
+    assert math.isnan(errors[0, 1])
+    assert np.allclose(values[1:, 1], -ticks[1:])
+
+    for row, tick in enumerate(ticks):
+        assert errors[row, 0] == pytest.approx(nearest(a_times, tick))
+        if row:
+            assert errors[row, 1] == pytest.approx(nearest(b_times, tick))
+
+
+def test_ticks_are_emitted_once_and_continue_across_collects(sampler):
+    for i in range(11):
+        sampler.add('a', i, START + .05 * i)
+        sampler.add('b', i, START + .05 * i)
+    first, _, _ = sampler.collect(now=0)
+
+    for i in range(11, 22):
+        sampler.add('a', i, START + .05 * i)
+        sampler.add('b', i, START + .05 * i)
+    second, values, _ = sampler.collect(now=0)
+
+    assert len(first) == 6
+    assert len(second) == 5
+    assert second[0] == pytest.approx(first[-1] + PERIOD)
+    # value i is sampled at START + .05 * i, so tick t has value 20 * (t - START)
+    assert np.allclose(values[:, 0], 20 * (second - START))
+    assert sampler.ticks_emitted == 11
+    assert len(sampler.collect(now=0)[0]) == 0
+
+
+def test_a_late_channel_is_waited_for_until_latency(sampler):
+    for i in range(10):
+        sampler.add('a', i, START + .1 * i)
+    sampler.add('b', 5, START)
+
+    # b has not reported since the first tick, so only that tick is ready
+    ticks, _, _ = sampler.collect(now=START + .45)
+    assert len(ticks) == 1
+
+    # after latency seconds the ticks are emitted, and b holds its value
+    ticks, values, _ = sampler.collect(now=START + 1.45)
+    assert len(ticks) == 9
+    assert np.all(values[:, 1] == 5)
+
+
+def test_out_of_order_samples_are_counted_and_dropped(sampler):
+    sampler.add('a', 1, START + .2)
+    sampler.add('a', 2, START + .1)
+    assert sampler.late_samples == 1
+    assert sampler.times[0] == [START + .2]
+
+
+def test_clock_uncertainty_is_added_to_the_error():
+    sampler = AlignedSampler(PERIOD)
+    sampler.add_channel('a', clock=FixedClock(.002))
+    for i in range(5):
+        sampler.add('a', i, START + .1 * i)
+
+    _, _, errors = sampler.collect(now=0)
+    assert np.allclose(errors[:, 0], .002)
+
+
+def test_samples_are_trimmed_after_collect(sampler):
+    for i in range(100):
+        sampler.add('a', i, START + .01 * i)
+        sampler.add('b', i, START + .01 * i)
+    sampler.collect(now=0)
+    assert len(sampler.times[0]) < 15
+
+
+@pytest.mark.parametrize('report', [
+    [PrivateConstants.ANALOG_REPORT, 36, 7, START],
+    PinReport(PrivateConstants.ANALOG_REPORT, 36, 7, START),
+    [PrivateConstants.ANALOG_REPORT, 36, 1, 9, 7, 10, START - .05, START + .05],
+    WindowReport(PrivateConstants.ANALOG_REPORT, 36, 1, 9, 7, 10,
+                 START - .05, START + .05),
+])
+def test_callback_accepts_pin_and_window_reports(report):
+    sampler = AlignedSampler(PERIOD)
+    sampler.add_channel('a')
+    sampler.callback('a')(report)
+    assert sampler.values[0] == [7]
+    assert sampler.times[0] == [pytest.approx(START)]
+
+
+def test_aio_callback_adds_samples():
+    sampler = AlignedSampler(PERIOD)
+    sampler.add_channel('a')
+    asyncio.run(sampler.aio_callback('a')(
+        PinReport(PrivateConstants.ANALOG_REPORT, 36, 7, START)))
+    assert sampler.values[0] == [7]
+
+
+def test_callback_rejects_other_reports():
+    sampler = AlignedSampler(PERIOD)
+    sampler.add_channel('a')
+    report = DhtReport(PrivateConstants.DHT_REPORT, 0, 4, 50.0, 20.0, None,
+                       START)
+    with pytest.raises(RuntimeError):
+        sampler.callback('a')(report)
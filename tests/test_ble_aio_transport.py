@@ -0,0 +1,88 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bleak.exc import BleakDBusError
+
+from telemetrix_aio_esp32 import ble_aio_transport
+from telemetrix_aio_esp32.ble_aio_transport import BleAioTransport
+from telemetrix_esp32_common.ble_address_cache import BleAddressCache
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+STALE_ADDRESS = 'AA:AA:AA:AA:AA:AA'
+
+SCANNED_ADDRESS = 'BB:BB:BB:BB:BB:BB'
+
+
+class FakeBleakClient:
+    """
+    Stands in for BleakClient. Connecting to STALE_ADDRESS fails the way
+    BlueZ reports an unknown device.
+    """
+
+    def __init__(self, device, disconnected_callback=None):
+        self.address = getattr(device, 'address', device)
+        self.services = SimpleNamespace(get_characteristic=lambda uuid: None)
+
+    async def connect(self):
+        if self.address == STALE_ADDRESS:
+            raise BleakDBusError('org.bluez.Error.Failed', ['Device not found'])
+
+    async def start_notify(self, uuid, handler):
+        pass
+
+
+@pytest.fixture
+def fake_ble(monkeypatch):
+    async def find_device(device_filter, timeout):
+        return SimpleNamespace(address=SCANNED_ADDRESS)
+
+    monkeypatch.setattr(ble_aio_transport, 'BleakClient', FakeBleakClient)
+    monkeypatch.setattr(ble_aio_transport.BleakScanner, 'find_device_by_filter',
+                        find_device)
+
+
+async def receive(sender, data):
+    pass
+
+
+def test_stale_cached_address_falls_back_to_scan(fake_ble, tmp_path):
+    cache = BleAddressCache(str(tmp_path / 'addresses.json'))
+    cache.put(PrivateConstants.BLE_DEVICE_NAME, STALE_ADDRESS)
+
+    async def run():
+        transport = BleAioTransport(receive_callback=receive, address_cache=cache)
+        await transport.connect()
+        return transport
+
+    transport = asyncio.run(run())
+    assert transport.connected
+    assert transport.client.address == SCANNED_ADDRESS
+    assert cache.get(PrivateConstants.BLE_DEVICE_NAME) == SCANNED_ADDRESS
+
+
+def test_connect_failure_is_a_runtime_error(fake_ble):
+    async def run():
+        transport = BleAioTransport(ble_mac_address=STALE_ADDRESS,
+                                    receive_callback=receive)
+        await transport.connect()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
@@ -0,0 +1,157 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+PIN = 4
+
+# read timeout of the fake UART service
+READ_TIMEOUT = .05
+
+
+class FakeUart:
+    """
+    Stands in for the adafruit_ble UARTService: read blocks until data
+    arrives or the read timeout expires.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+        self.in_waiting_checks = 0
+        self.written = []
+
+    def notify(self, data):
+        with self.condition:
+            self.buffer += data
+            self.condition.notify_all()
+
+    @property
+    def in_waiting(self):
+        self.in_waiting_checks += 1
+        return len(self.buffer)
+
+    def read(self, size):
+        with self.condition:
+            self.condition.wait_for(lambda: self.buffer, READ_TIMEOUT)
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return data
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+
+class FakeConnection:
+    connected = True
+
+
+@pytest.fixture
+def ble_client():
+    """
+    A sync client whose BLE link is a FakeUart.
+    """
+    client = TelemetrixEsp32(transport_address='127.0.0.1', autostart=False,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    client.transport_is_wifi = False
+    client.ble_client = FakeUart()
+    client.uart_connection = FakeConnection()
+    client.link_up.set()
+    client.the_reporter_thread.start()
+    client.the_data_receive_thread.start()
+    client._run_threads()
+    yield client
+    client.shutdown_flag = True
+    client._stop_threads()
+    client.packet_event.set()
+    client.the_reporter_thread.join(1)
+    client.the_data_receive_thread.join(1)
+
+
+def frame(*data):
+    return bytes([len(data)]) + bytes(data)
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.001)
+
+
+def test_ble_receive_does_not_poll_while_idle(ble_client):
+    time.sleep(10 * READ_TIMEOUT)
+    # the receiver blocks in read, and checks in_waiting only after a byte
+    assert ble_client.ble_client.in_waiting_checks == 0
+
+
+def test_ble_notifications_are_dispatched_as_chunks(ble_client):
+    reports = []
+    ble_client.set_pin_mode_digital_input(PIN, callback=reports.append)
+    chunks = []
+    queue_packets = ble_client._queue_packets
+
+    def record_chunk(packets):
+        chunks.append(list(packets))
+        queue_packets(packets)
+
+    ble_client._queue_packets = record_chunk
+
+    # two packets and the start of a third in one notification
+    data = frame(PrivateConstants.DIGITAL_REPORT, PIN, 1) + \
+        frame(PrivateConstants.DIGITAL_REPORT, PIN, 0)
+    sent = time.monotonic()
+    ble_client.ble_client.notify(data + data[:2])
+    wait_for(lambda: len(reports) == 2)
+    latency = time.monotonic() - sent
+    ble_client.ble_client.notify(data[2:])
+    wait_for(lambda: len(reports) == 4)
+
+    assert [report[2] for report in reports] == [1, 0, 1, 0]
+    assert chunks[0] == [bytes([PrivateConstants.DIGITAL_REPORT, PIN, 1]),
+                         bytes([PrivateConstants.DIGITAL_REPORT, PIN, 0])]
+    # dispatched as soon as the notification arrives, well within the
+    # read timeout
+    assert latency < READ_TIMEOUT
+
+
+@pytest.mark.skipif(not hasattr(time, 'pthread_getcpuclockid'),
+                    reason='needs per thread CPU clocks')
+def test_idle_reporter_thread_sleeps():
+    board = FakeBoard()
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        clock = time.pthread_getcpuclockid(client.the_reporter_thread.ident)
+        start = time.clock_gettime(clock)
+        time.sleep(.5)
+        cpu_time = time.clock_gettime(clock) - start
+    finally:
+        client.shutdown()
+        board.close()
+
+    # a reporter that spins on the empty deque uses the whole .5 seconds
+    assert cpu_time < .05
@@ -0,0 +1,165 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from telemetrix_aio_esp32 import ble_aio_transport
+from telemetrix_aio_esp32.ble_aio_transport import BleAioTransport
+
+ADDRESS = 'CC:CC:CC:CC:CC:CC'
+
+
+class FakeBleakClient:
+    """
+    Stands in for BleakClient. It records each GATT write with its
+    response flag, and fails writes while fail is set.
+    """
+
+    mtu_size = 23
+
+    properties = ['write', 'write-without-response']
+
+    def __init__(self, device, disconnected_callback=None):
+        self.address = device
+        characteristic = SimpleNamespace(properties=self.properties)
+        self.services = SimpleNamespace(get_characteristic=lambda uuid: characteristic)
+        self.writes = []
+        self.fail = False
+
+    async def connect(self):
+        pass
+
+    async def start_notify(self, uuid, handler):
+        pass
+
+    async def write_gatt_char(self, uuid, payload, response=False):
+        if self.fail:
+            raise OSError('GATT write failed')
+        self.writes.append((bytes(payload), response))
+
+
+async def receive(sender, data):
+    pass
+
+
+def connect(monkeypatch, mtu_size=23, properties=None):
+    client_class = type('Client', (FakeBleakClient,),
+                        {'mtu_size': mtu_size,
+                         'properties': properties or FakeBleakClient.properties})
+    monkeypatch.setattr(ble_aio_transport, 'BleakClient', client_class)
+
+    async def run():
+        transport = BleAioTransport(ble_mac_address=ADDRESS, receive_callback=receive)
+        await transport.connect()
+        return transport
+
+    return asyncio.run(run())
+
+
+def frames(*sizes):
+    """
+    :return: length prefixed frames with the given data sizes
+    """
+    return [bytes([size]) + bytes(range(1, size + 1)) for size in sizes]
+
+
+def packer(limit):
+    async def make():
+        return BleAioTransport(receive_callback=receive)
+
+    transport = asyncio.run(make())
+    transport.max_write_size = limit
+    return transport
+
+
+def test_frames_that_fit_are_one_payload():
+    data = b''.join(frames(3, 3, 3))
+    assert packer(20)._pack(data) == [data]
+
+
+def test_payloads_end_on_frame_boundaries():
+    # four 6 byte frames: three fit into 20 bytes, the fourth starts a payload
+    parts = frames(5, 5, 5, 5)
+    assert packer(20)._pack(b''.join(parts)) == [b''.join(parts[:3]), parts[3]]
+
+
+def test_a_frame_larger_than_a_payload_is_split():
+    parts = frames(3, 40, 3)
+    payloads = packer(20)._pack(b''.join(parts))
+    assert payloads == [parts[0], parts[1][:20], parts[1][20:40],
+                        parts[1][40:] + parts[2]]
+
+
+@pytest.mark.parametrize('limit', [20, 64, 244])
+def test_packing_keeps_every_byte_within_the_limit(limit):
+    sizes = [(size * 7) % 60 + 1 for size in range(100)]
+    data = b''.join(frames(*sizes))
+    payloads = packer(limit)._pack(data)
+    assert b''.join(payloads) == data
+    assert all(0 < len(payload) <= limit for payload in payloads)
+
+    # a frame that fits into a payload is never split
+    position = 0
+    boundaries = {0}
+    for payload in payloads:
+        position += len(payload)
+        boundaries.add(position)
+    position = 0
+    for size in sizes:
+        end = position + 1 + size
+        if size + 1 <= limit:
+            assert not any(position < boundary < end for boundary in boundaries)
+        position = end
+
+
+def test_payload_size_follows_the_negotiated_mtu(monkeypatch):
+    transport = connect(monkeypatch, mtu_size=247)
+    assert transport.max_write_size == 244
+    assert transport.write_without_response
+
+    data = b''.join(frames(*[3] * 100))
+    asyncio.run(transport.write(data))
+    writes = transport.client.writes
+    assert b''.join(payload for payload, _ in writes) == data
+    assert [len(payload) for payload, _ in writes] == [244, 156]
+    assert not any(response for _, response in writes)
+    assert transport.statistics() == {'gatt_writes': 2, 'bytes_written': 400,
+                                      'write_errors': 0}
+
+
+def test_small_mtu_keeps_the_default_payload(monkeypatch):
+    transport = connect(monkeypatch, mtu_size=10)
+    assert transport.max_write_size == 20
+
+
+def test_writes_use_a_response_when_required(monkeypatch):
+    transport = connect(monkeypatch, properties=['write'])
+    assert not transport.write_without_response
+    asyncio.run(transport.write(b''.join(frames(3))))
+    assert transport.client.writes == [(b''.join(frames(3)), True)]
+
+
+def test_write_failures_are_counted_and_raised(monkeypatch):
+    transport = connect(monkeypatch)
+    transport.client.fail = True
+    with pytest.raises(OSError):
+        asyncio.run(transport.write(b''.join(frames(3))))
+    assert transport.write_errors == 1
+    assert transport.gatt_writes == 0
@@ -0,0 +1,144 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import socket
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.board_fleet import BoardFleet
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.transport_options import TransportOptions
+
+BOARD_COUNT = 200
+
+PIN = 36
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def board_options(port):
+    return {'transport_address': '127.0.0.1', 'ip_port': port,
+            'restart_on_shutdown': False, 'shutdown_on_exception': False}
+
+
+def test_fleet_of_simulated_boards(board):
+    async def run():
+        fleet = BoardFleet(loop=asyncio.get_running_loop())
+        for board_id in range(BOARD_COUNT):
+            fleet.add_board(board_id, **board_options(board.port))
+        connected = await fleet.start()
+
+        bus = []
+
+        async def subscriber(board_id, report):
+            bus.append((board_id, report[1]))
+
+        fleet.subscribe(subscriber)
+        for board_id in connected:
+            await fleet.get_board(board_id).set_pin_mode_analog_input(
+                PIN, callback=fleet.bus_callback(board_id))
+        board.send_report(PrivateConstants.ANALOG_REPORT, [PIN, 0, 1])
+        for _ in range(500):
+            if len(bus) == BOARD_COUNT:
+                break
+            await asyncio.sleep(.01)
+
+        metrics = await fleet.metrics()
+        await fleet.shutdown()
+        return connected, bus, metrics
+
+    connected, bus, metrics = asyncio.run(run())
+    assert len(connected) == BOARD_COUNT
+    assert sorted(bus) == [(board_id, PIN) for board_id in range(BOARD_COUNT)]
+    assert metrics['connected'] == BOARD_COUNT
+    assert metrics['reports'] == BOARD_COUNT
+    assert metrics['send_queue_depth'] == 0
+    # the boards start concurrently: each start takes at least .4 seconds
+    assert metrics['fleet_connect_time'] < 10 * metrics['slowest_connect_time']
+
+
+def test_failed_start_stops_the_board_tasks(board):
+    # accepts connections but never answers
+    silent = socket.create_server(('127.0.0.1', 0))
+
+    async def run():
+        fleet = BoardFleet(loop=asyncio.get_running_loop())
+        fleet.add_board('good', **board_options(board.port))
+        failed = fleet.add_board('silent', **board_options(silent.getsockname()[1]))
+        connected = await fleet.start()
+        await asyncio.sleep(.01)
+        good = fleet.get_board('good')
+        good_tasks = {good.the_task, good.writer_task}
+        pending = {task for task in asyncio.all_tasks()
+                   if task is not asyncio.current_task() and not task.done()}
+        await fleet.shutdown()
+        return connected, fleet, failed, pending, good_tasks
+
+    try:
+        connected, fleet, failed, pending, good_tasks = asyncio.run(run())
+    finally:
+        silent.close()
+
+    assert connected == ['good']
+    assert isinstance(fleet.failed_boards['silent'], RuntimeError)
+    assert failed.the_task.cancelled()
+    assert failed.writer_task is None
+    # only the tasks of the board that started are left
+    assert pending == good_tasks
+
+
+def test_abort_stops_every_task_and_closes_the_link(board):
+    async def run():
+        options = TransportOptions(heartbeat_interval=.05)
+        client = TelemetrixAioEsp32(autostart=False, transport_options=options,
+                                    auto_reconnect=True,
+                                    **board_options(board.port))
+        await client.start_aio()
+
+        async def ignore(data):
+            pass
+
+        await client.set_pin_mode_analog_input(PIN, callback=ignore,
+                                               aggregate=.1)
+        await client.set_output_rate(50)
+        tasks = [client.the_task, client.writer_task, client.heartbeat_task,
+                 client.output_shaper_task, client.window_task]
+        closed = []
+        client.pin_states = type('PinStates', (), {
+            'close': lambda self: closed.append(True)})()
+
+        await client.abort()
+        await asyncio.sleep(.01)
+        return client, tasks, closed
+
+    client, tasks, closed = asyncio.run(run())
+    assert all(task is not None and task.done() for task in tasks)
+    assert client.writer_task is None
+    assert client.output_shaper_task is None
+    assert client.window_task is None
+    assert closed == [True]
+    # nothing is sent on abort
+    assert not board.received(PrivateConstants.STOP_ALL_REPORTS)
+    assert client.transport.writer.is_closing()
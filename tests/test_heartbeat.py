@@ -0,0 +1,236 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_aio_esp32.telemetrix_proxy import TelemetrixProxy
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.transport_options import TransportOptions
+
+INTERVAL = .05
+
+MISSES = 3
+
+HEARTBEAT = TransportOptions(heartbeat_interval=INTERVAL,
+                             heartbeat_misses=MISSES)
+
+# documented worst case detection time
+BOUND = (MISSES + 1) * INTERVAL
+
+# scheduling allowance on a loaded test machine
+SLACK = .1
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def test_aio_stall_detection_time_is_bounded(board):
+    async def run():
+        events = []
+
+        async def stalled(is_stalled):
+            events.append((time.monotonic(), is_stalled))
+
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False,
+                                    transport_options=HEARTBEAT,
+                                    stall_callback=stalled)
+        await client.start_aio()
+        await asyncio.sleep(5 * INTERVAL)
+        assert not events
+        assert client.heartbeat_round_trip is not None
+
+        hung_at = time.monotonic()
+        board.hung.set()
+        while not events:
+            await asyncio.sleep(.005)
+            assert time.monotonic() - hung_at < 10 * BOUND
+        assert events[0][1] is True
+        detection_time = events[0][0] - hung_at
+
+        board.hung.clear()
+        while len(events) < 2:
+            await asyncio.sleep(.005)
+            assert time.monotonic() - hung_at < 20 * BOUND
+        assert events[1][1] is False
+
+        await client.shutdown()
+        return detection_time
+
+    detection_time = asyncio.run(run())
+    assert (MISSES - 1) * INTERVAL <= detection_time <= BOUND + SLACK
+
+
+def test_sync_stall_detection_time_is_bounded(board):
+    events = []
+    stall_event = threading.Event()
+
+    def stalled(is_stalled):
+        events.append((time.monotonic(), is_stalled))
+        stall_event.set()
+
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False,
+                             transport_options=HEARTBEAT,
+                             stall_callback=stalled)
+    try:
+        time.sleep(5 * INTERVAL)
+        assert not events
+
+        hung_at = time.monotonic()
+        board.hung.set()
+        assert stall_event.wait(10 * BOUND)
+        assert events[0][1] is True
+        detection_time = events[0][0] - hung_at
+        assert (MISSES - 1) * INTERVAL <= detection_time <= BOUND + SLACK
+    finally:
+        client.shutdown()
+
+
+def test_proxy_keeps_heartbeat_replies_for_the_board(board):
+    async def run():
+        stalls = []
+
+        async def stalled(is_stalled):
+            stalls.append(is_stalled)
+
+        proxy = TelemetrixProxy(listen_port=0, transport_address='127.0.0.1',
+                                ip_port=board.port, restart_on_shutdown=False,
+                                shutdown_on_exception=False,
+                                transport_options=HEARTBEAT,
+                                stall_callback=stalled)
+        await proxy.start()
+        port = proxy.server.sockets[0].getsockname()[1]
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        # a client loop back that uses the heartbeat marker, and a normal one
+        writer.write(bytes([2, PrivateConstants.LOOP_COMMAND,
+                            PrivateConstants.HEARTBEAT_MARKER]))
+        writer.write(bytes([2, PrivateConstants.LOOP_COMMAND, ord('A')]))
+        await writer.drain()
+
+        replies = await asyncio.wait_for(reader.readexactly(6), 2)
+        await asyncio.sleep(10 * INTERVAL)
+
+        writer.close()
+        await proxy.shutdown()
+        return stalls, replies, proxy.board.heartbeat_round_trip
+
+    stalls, replies, round_trip = asyncio.run(run())
+    assert not stalls
+    assert round_trip is not None
+    assert replies == bytes([2, PrivateConstants.LOOP_COMMAND,
+                             PrivateConstants.HEARTBEAT_MARKER,
+                             2, PrivateConstants.LOOP_COMMAND, ord('A')])
+
+
+def test_sync_loop_back_may_use_the_marker_values(board):
+    replies = []
+    stalls = []
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False,
+                             transport_options=HEARTBEAT,
+                             stall_callback=stalls.append)
+    try:
+        for value in (PrivateConstants.HEARTBEAT_MARKER,
+                      PrivateConstants.CLOCK_MARKER):
+            client.loop_back(chr(value), callback=replies.append)
+        estimate = client.synchronize_clock(exchanges=2)
+        time.sleep(5 * INTERVAL)
+    finally:
+        client.shutdown()
+
+    assert replies == [[PrivateConstants.HEARTBEAT_MARKER],
+                       [PrivateConstants.CLOCK_MARKER]]
+    assert estimate['exchanges'] >= 2
+    assert client.heartbeat_round_trip is not None
+    assert not stalls
+
+
+def test_aio_loop_back_may_use_the_marker_values(board):
+    async def run():
+        replies = []
+        stalls = []
+
+        async def loop_back_reply(data):
+            replies.append(data)
+
+        async def stalled(is_stalled):
+            stalls.append(is_stalled)
+
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False,
+                                    transport_options=HEARTBEAT,
+                                    stall_callback=stalled)
+        await client.start_aio()
+        for value in (PrivateConstants.HEARTBEAT_MARKER,
+                      PrivateConstants.CLOCK_MARKER):
+            await client.loop_back(chr(value), callback=loop_back_reply)
+        estimate = await client.synchronize_clock(exchanges=2)
+        await asyncio.sleep(5 * INTERVAL)
+        await client.shutdown()
+        return replies, stalls, estimate, client.heartbeat_round_trip
+
+    replies, stalls, estimate, round_trip = asyncio.run(run())
+    assert replies == [[PrivateConstants.HEARTBEAT_MARKER],
+                       [PrivateConstants.CLOCK_MARKER]]
+    assert estimate['exchanges'] >= 2
+    assert round_trip is not None
+    assert not stalls
+
+
+def test_unanswered_clock_exchange_is_skipped(board):
+    replies = []
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        board.hung.set()
+        assert client.synchronize_clock(exchanges=1, timeout=.05)['exchanges'] == 0
+        board.hung.clear()
+
+        # a reply that comes after synchronize_clock stopped waiting is ignored
+        client._clock_sync_reply([PrivateConstants.CLOCK_MARKER])
+
+        client.loop_back('A', callback=replies.append)
+        deadline = time.monotonic() + 2
+        while not replies:
+            assert time.monotonic() < deadline
+            time.sleep(.005)
+    finally:
+        client.shutdown()
+
+    assert replies == [[ord('A')]]
+    assert not client.loop_back_pending
+    assert client.get_clock_estimate()['exchanges'] == 0
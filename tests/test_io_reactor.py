@@ -0,0 +1,177 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_esp32.io_reactor import IoReactor
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.transport_options import TransportOptions
+
+PIN = 36
+
+
+@pytest.fixture
+def reactor():
+    reactor = IoReactor(dispatch_workers=2)
+    yield reactor
+    reactor.stop()
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.005)
+
+
+def make_client(board, reactor, **kwargs):
+    return TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                           restart_on_shutdown=False, shutdown_on_exception=False,
+                           reactor=reactor, **kwargs)
+
+
+def analog_report(value):
+    return [PIN, value >> 8, value & 0xff]
+
+
+def test_reports_are_delivered_in_order(reactor):
+    boards = [FakeBoard() for _ in range(3)]
+    reports = [[] for _ in boards]
+    clients = [make_client(board, reactor) for board in boards]
+    try:
+        for client, received in zip(clients, reports):
+            client.set_pin_mode_analog_input(PIN, callback=received.append)
+        for value in range(100):
+            for board in boards:
+                board.send_report(PrivateConstants.ANALOG_REPORT, analog_report(value))
+        wait_for(lambda: all(len(received) == 100 for received in reports))
+    finally:
+        for client in clients:
+            client.shutdown()
+        for board in boards:
+            board.close()
+
+    for received in reports:
+        assert [report[2] for report in received] == list(range(100))
+    assert reactor.thread_count() == 3
+
+
+def test_unregister_releases_the_board(reactor):
+    boards = [FakeBoard() for _ in range(4)]
+    clients = [make_client(board, reactor) for board in boards]
+    assert len(reactor.board_workers) == 4
+
+    for client in clients:
+        client.shutdown()
+    for board in boards:
+        board.close()
+    wait_for(lambda: not reactor.boards and not reactor.board_workers)
+
+
+def test_worker_is_kept_across_a_reconnect(reactor):
+    board = FakeBoard()
+    other_boards = []
+    reports = []
+    client = make_client(board, reactor, auto_reconnect=True)
+    try:
+        client.set_pin_mode_analog_input(PIN, callback=reports.append)
+        worker = reactor.board_workers[client]
+
+        # registering other boards moves the next worker on
+        for _ in range(2):
+            other_boards.append(FakeBoard())
+            make_client(other_boards[-1], reactor).shutdown()
+        assert reactor.next_worker != worker
+
+        board.drop_connections()
+        wait_for(lambda: client.reconnects == 1 and board.connections)
+        assert reactor.board_workers[client] == worker
+
+        for value in range(10):
+            board.send_report(PrivateConstants.ANALOG_REPORT, analog_report(value))
+        wait_for(lambda: len(reports) == 10)
+    finally:
+        client.shutdown()
+        board.close()
+        for other_board in other_boards:
+            other_board.close()
+
+    assert [report[2] for report in reports] == list(range(10))
+
+
+def test_reactor_ends_aggregation_windows(reactor):
+    board = FakeBoard()
+    windows = []
+    client = make_client(board, reactor)
+    try:
+        client.set_pin_mode_analog_input(PIN, callback=windows.append,
+                                         aggregate=.1)
+        for value in (100, 200, 300):
+            board.send_report(PrivateConstants.ANALOG_REPORT, analog_report(value))
+        # no later report completes the window
+        wait_for(lambda: windows, timeout=2)
+    finally:
+        client.shutdown()
+        board.close()
+
+    assert windows[0][:6] == [PrivateConstants.AT_ANALOG, PIN, 100, 300, 200, 3]
+
+
+def test_reactor_runs_heartbeats_and_output_shaper(reactor):
+    board = FakeBoard()
+    client = make_client(board, reactor,
+                         transport_options=TransportOptions(heartbeat_interval=.05))
+    try:
+        client.set_output_rate(20)
+        client.servo_write(4, 10)
+        client.servo_write(4, 20)
+        wait_for(lambda: [command for _, command in
+                          board.received(PrivateConstants.SERVO_WRITE)]
+                 == [bytes([PrivateConstants.SERVO_WRITE, 4, 10]),
+                     bytes([PrivateConstants.SERVO_WRITE, 4, 20])])
+        wait_for(lambda: client.heartbeat_round_trip is not None)
+        assert client.the_heartbeat_thread.ident is None
+        assert client.the_output_shaper_thread.ident is None
+    finally:
+        client.shutdown()
+        board.close()
+
+
+def test_stop_joins_the_threads_and_closes_the_selector():
+    reactor = IoReactor(dispatch_workers=2)
+    board = FakeBoard()
+    client = make_client(board, reactor)
+    client.shutdown()
+    board.close()
+
+    reactor.stop()
+    for thread in [reactor.the_selector_thread] + reactor.the_worker_threads:
+        assert not thread.is_alive()
+    assert reactor.selector.get_map() is None
+    assert reactor.wakeup_sender.fileno() == -1
+    with pytest.raises(RuntimeError):
+        reactor.start()
+
+
+def test_stop_without_start_closes_the_selector():
+    reactor = IoReactor()
+    reactor.stop()
+    assert reactor.selector.get_map() is None
@@ -0,0 +1,101 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import pytest
+
+from telemetrix_esp32_common import link_clock
+from telemetrix_esp32_common.link_clock import LinkClock
+
+SECOND = 1_000_000_000
+
+MILLISECOND = 1_000_000
+
+
+class FakeClocks:
+    """
+    Monotonic and wall clocks that only move when told to.
+    """
+
+    def __init__(self):
+        self.monotonic = 1000 * SECOND
+        self.wall = 1_700_000_000 * SECOND
+
+    def monotonic_ns(self):
+        return self.monotonic
+
+    def time_ns(self):
+        return self.wall
+
+    def advance(self, nanoseconds):
+        self.monotonic += nanoseconds
+        self.wall += nanoseconds
+
+
+@pytest.fixture
+def clocks(monkeypatch):
+    clocks = FakeClocks()
+    monkeypatch.setattr(link_clock, 'time', clocks)
+    return clocks
+
+
+def test_time_stamp_is_wall_clock_less_link_delay(clocks):
+    clock = LinkClock()
+    assert clock.uncertainty() is None
+
+    sent = clocks.monotonic
+    clock.add_exchange(sent, sent + 4 * MILLISECOND)
+    clock.add_exchange(sent, sent + 6 * MILLISECOND)
+
+    estimate = clock.estimate()
+    assert estimate['link_delay'] == pytest.approx(.002)
+    assert estimate['jitter'] == pytest.approx(.001)
+    assert estimate['uncertainty'] == pytest.approx(.003)
+    assert estimate['exchanges'] == 2
+
+    assert clock.time_stamp(clocks.monotonic) == \
+        pytest.approx((clocks.wall - 2 * MILLISECOND) / SECOND)
+
+
+def test_negative_round_trips_are_ignored(clocks):
+    clock = LinkClock()
+    clock.add_exchange(clocks.monotonic, clocks.monotonic - 1)
+    assert clock.uncertainty() is None
+
+
+def test_stepped_wall_clock_is_followed_without_exchanges(clocks):
+    clock = LinkClock()
+
+    # the wall clock is set, for example by NTP, after the client started
+    clocks.wall += 3600 * SECOND
+    clocks.advance(SECOND // 2)
+    # within the refresh interval the previous fit is still used
+    assert clock.time_stamp(clocks.monotonic) == \
+        pytest.approx((clocks.wall - 3600 * SECOND) / SECOND)
+
+    clocks.advance(LinkClock.REFRESH_INTERVAL * SECOND)
+    assert clock.time_stamp(clocks.monotonic) == \
+        pytest.approx(clocks.wall / SECOND)
+
+
+def test_drift_is_fitted_over_a_long_span(clocks):
+    clock = LinkClock()
+    # the wall clock runs 100 ppm fast
+    for _ in range(20):
+        clocks.monotonic += SECOND
+        clocks.wall += SECOND + 100_000
+        clock.read_clocks()
+    assert clock.estimate()['drift'] == pytest.approx(100, rel=1e-3)
@@ -0,0 +1,171 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.output_shaper import OutputShaper
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+SERVO = PrivateConstants.SERVO_WRITE
+
+ANALOG = PrivateConstants.ANALOG_WRITE
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.005)
+
+
+def test_latest_value_wins():
+    shaper = OutputShaper()
+    shaper.set_rate(10)
+    assert shaper.submit((SERVO, 3), [SERVO, 3, 10], 100.0)
+    assert shaper.submit((SERVO, 3), [SERVO, 3, 20], 100.01) is None
+    assert shaper.submit((SERVO, 3), [SERVO, 3, 30], 100.02) is None
+    assert shaper.next_deadline() == pytest.approx(100.1)
+    assert shaper.due(100.05) == []
+    assert shaper.due(100.11) == [[SERVO, 3, 30]]
+    assert shaper.statistics() == {'collapsed_writes': 1, 'sent_writes': 2,
+                                   'pending_writes': 0}
+
+
+def test_pin_rates_are_kept_per_command():
+    shaper = OutputShaper()
+    shaper.set_rate(10, 3, (SERVO,))
+    assert shaper.submit((SERVO, 3), [SERVO, 3, 10], 100.0)
+    assert shaper.submit((SERVO, 3), [SERVO, 3, 20], 100.01) is None
+    # pwm channel 3 is not servo pin 3
+    assert shaper.submit((ANALOG, 3), [ANALOG, 3, 0, 1], 100.0)
+    assert shaper.submit((ANALOG, 3), [ANALOG, 3, 0, 2], 100.01)
+
+    shaper.set_rate(None, 3, (SERVO,))
+    assert shaper.submit((SERVO, 3), [SERVO, 3, 30], 100.02)
+
+
+def test_sync_flusher_is_restarted_after_it_exits(board):
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        client.set_output_rate(20)
+        first_thread = client.the_output_shaper_thread
+
+        # stop the flusher thread
+        client.shutdown_flag = True
+        client.output_shaper_event.set()
+        first_thread.join(2)
+        assert not first_thread.is_alive()
+        client.shutdown_flag = False
+
+        client.set_output_rate(20)
+        assert client.the_output_shaper_thread is not first_thread
+        assert client.the_output_shaper_thread.is_alive()
+
+        # the held write is sent by the new thread
+        client.servo_write(4, 10)
+        client.servo_write(4, 20)
+        wait_for(lambda: [command for _, command in board.received(SERVO)]
+                 == [bytes([SERVO, 4, 10]), bytes([SERVO, 4, 20])])
+    finally:
+        client.shutdown()
+
+
+def test_sync_invalid_output_type(board):
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        with pytest.raises(RuntimeError):
+            client.set_output_rate(10, 4, output_type='dac')
+    finally:
+        client.shutdown()
+
+
+def test_aio_servo_pin_and_pwm_channel_rates_are_separate(board):
+    async def run():
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False)
+        await client.start_aio()
+        with pytest.raises(RuntimeError):
+            await client.set_output_rate(1, 3)
+
+        await client.set_output_rate(1, 3, output_type='servo')
+        for value in range(3):
+            await client.servo_write(3, value)
+            await client.analog_write(3, value)
+        await asyncio.sleep(.1)
+        statistics = await client.get_output_shaper_statistics()
+        await client.shutdown()
+        return statistics
+
+    statistics = asyncio.run(run())
+    # only the servo writes were held back and collapsed
+    assert statistics['collapsed_writes'] == 1
+    assert statistics['pending_writes'] == 1
+    assert [command for _, command in board.received(ANALOG)] == \
+        [bytes([ANALOG, 3, 0, value]) for value in range(3)]
+    assert [command for _, command in board.received(SERVO)] == [bytes([SERVO, 3, 0])]
+
+
+def test_aio_flusher_is_restarted_after_shutdown(board):
+    async def run():
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False)
+        await client.start_aio()
+        await client.set_output_rate(20)
+        first_task = client.output_shaper_task
+
+        # the flusher task exits
+        client.shutdown_flag = True
+        client.output_shaper_event.set()
+        await asyncio.wait_for(first_task, 2)
+        client.shutdown_flag = False
+
+        await client.set_output_rate(20)
+        assert client.output_shaper_task is not first_task
+        assert not client.output_shaper_task.done()
+
+        # the held write is sent by the new task
+        await client.servo_write(4, 10)
+        await client.servo_write(4, 20)
+        await asyncio.sleep(.2)
+
+        await client.shutdown()
+        assert client.output_shaper_task is None
+
+    asyncio.run(run())
+    assert [command for _, command in board.received(SERVO)] == \
+        [bytes([SERVO, 4, 10]), bytes([SERVO, 4, 20])]
@@ -0,0 +1,127 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.packet_framer import PacketFramer
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+PIN = 36
+
+VALUES = [0, 1, 0x0102, 4095, 77]
+
+# frames of analog reports
+REPORTS = b''.join(bytes([4, PrivateConstants.ANALOG_REPORT, PIN,
+                          value >> 8, value & 0xff]) for value in VALUES)
+
+# the reports with a zero length packet after the third one
+STREAM = REPORTS[:15] + b'\x00' + REPORTS[15:]
+
+PACKETS = [bytes([PrivateConstants.ANALOG_REPORT, PIN, value >> 8, value & 0xff])
+           for value in VALUES[:3]] + [b''] + \
+    [bytes([PrivateConstants.ANALOG_REPORT, PIN, value >> 8, value & 0xff])
+     for value in VALUES[3:]]
+
+
+def chunks(size, data=STREAM):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_whole_stream():
+    framer = PacketFramer()
+    assert framer.feed(STREAM) == PACKETS
+    assert framer.pending() == 0
+
+
+@pytest.mark.parametrize('split', range(1, len(STREAM)))
+def test_every_split_point(split):
+    framer = PacketFramer()
+    packets = framer.feed(STREAM[:split]) + framer.feed(STREAM[split:])
+    assert packets == PACKETS
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 20])
+def test_fixed_size_notifications(size):
+    framer = PacketFramer()
+    packets = []
+    for chunk in chunks(size):
+        packets += framer.feed(chunk)
+    assert packets == PACKETS
+    assert framer.pending() == 0
+
+
+def test_reset_discards_a_partial_packet():
+    framer = PacketFramer()
+    assert framer.feed(STREAM[:3]) == []
+    assert framer.pending() == 3
+    framer.reset()
+    assert framer.feed(STREAM) == PACKETS
+
+
+@pytest.mark.parametrize('size', [1, 3, 20])
+def test_aio_ble_notifications(size):
+    async def run():
+        values = []
+
+        async def analog_callback(data):
+            values.append(data[2])
+
+        client = TelemetrixAioEsp32(transport_is_wifi=False, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False)
+        client.analog_callbacks[PIN] = analog_callback
+        client.report_subscriptions.subscribe(PrivateConstants.ANALOG_REPORT, PIN)
+        for chunk in chunks(size):
+            await client._ble_report_dispatcher('sender', bytearray(chunk))
+        return values
+
+    assert asyncio.run(run()) == VALUES
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+@pytest.mark.parametrize('size', [1, 3, 20])
+def test_sync_split_and_merged_frames(board, size):
+    values = []
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        client.set_pin_mode_analog_input(PIN, callback=lambda data: values.append(data[2]))
+        for chunk in chunks(size, REPORTS):
+            # BLE notifications use the same framer as the socket
+            client._ble_report_dispatcher(data=chunk)
+        # the socket may split or merge frames too
+        for chunk in chunks(size, REPORTS):
+            board.send_raw(chunk)
+        end = time.monotonic() + 2
+        while len(values) < 2 * len(VALUES) and time.monotonic() < end:
+            time.sleep(.005)
+    finally:
+        client.shutdown()
+    assert values == VALUES * 2
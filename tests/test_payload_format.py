@@ -0,0 +1,188 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import struct
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+ADDRESS = 0x68
+
+REGISTER = 0x3b
+
+DATA = bytes([0x12, 0x34, 0xff, 0xfe])
+
+# report data following the report id
+I2C_DATA = bytes([len(DATA), ADDRESS, REGISTER]) + DATA
+
+SPI_DATA = bytes([REGISTER, len(DATA)]) + DATA
+
+ONE_WIRE_DATA = bytes([PrivateConstants.ONE_WIRE_READ]) + DATA
+
+EXPECTED_TYPES = {'bytes': bytes, 'memoryview': memoryview}
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def sync_client(**kwargs):
+    return TelemetrixEsp32(transport_address='127.0.0.1', autostart=False,
+                           restart_on_shutdown=False,
+                           shutdown_on_exception=False, **kwargs)
+
+
+def aio_client(**kwargs):
+    return TelemetrixAioEsp32(transport_address='127.0.0.1', autostart=False,
+                              restart_on_shutdown=False,
+                              shutdown_on_exception=False, **kwargs)
+
+
+def payload_of(report, payload_format, header_length):
+    """
+    :return: the data bytes of a report list, and the report without them
+    """
+    if payload_format == 'list':
+        return report[header_length:-1], report[:header_length]
+    return report[header_length], report[:header_length]
+
+
+@pytest.mark.parametrize('payload_format', ['list', 'bytes', 'memoryview'])
+def test_sync_payload_formats(payload_format):
+    client = sync_client(payload_format=payload_format)
+    reports = []
+    client.i2c_callback = client.spi_callback = client.onewire_callback = \
+        reports.append
+
+    client._i2c_read_report(I2C_DATA)
+    client._spi_report(SPI_DATA)
+    client._onewire_report(ONE_WIRE_DATA)
+
+    check_reports(reports, payload_format)
+
+
+@pytest.mark.parametrize('payload_format', ['list', 'bytes', 'memoryview'])
+def test_aio_payload_formats(payload_format):
+    async def run():
+        client = aio_client(payload_format=payload_format)
+        reports = []
+
+        async def callback(report):
+            reports.append(report)
+
+        client.i2c_callback = client.spi_callback = client.onewire_callback = \
+            callback
+
+        await client._i2c_read_report(I2C_DATA)
+        await client._spi_report(SPI_DATA)
+        await client._onewire_report(ONE_WIRE_DATA)
+        return reports
+
+    check_reports(asyncio.run(run()), payload_format)
+
+
+def check_reports(reports, payload_format):
+    i2c, spi, one_wire = reports
+
+    payload, header = payload_of(i2c, payload_format, 4)
+    assert header == [PrivateConstants.I2C_READ_REPORT, len(DATA), ADDRESS,
+                      REGISTER]
+    if payload_format == 'list':
+        assert payload == list(DATA)
+    else:
+        assert isinstance(payload, EXPECTED_TYPES[payload_format])
+    assert bytes(payload) == DATA
+
+    payload, header = payload_of(spi, payload_format, 3)
+    assert header == [PrivateConstants.SPI_REPORT, REGISTER, len(DATA)]
+    assert bytes(payload) == DATA
+
+    payload, header = payload_of(one_wire, payload_format, 2)
+    assert header == [PrivateConstants.ONE_WIRE_REPORT,
+                      PrivateConstants.ONE_WIRE_READ]
+    assert bytes(payload) == DATA
+
+    for report in reports:
+        assert isinstance(report[-1], float)
+
+
+@pytest.mark.parametrize('payload_format', ['bytes', 'memoryview'])
+def test_binary_payloads_unpack_directly(payload_format):
+    client = sync_client(payload_format=payload_format)
+    reports = []
+    client.i2c_callback = reports.append
+
+    client._i2c_read_report(I2C_DATA)
+
+    assert struct.unpack_from('>hH', reports[0][4]) == (0x1234, 0xfffe)
+
+
+def test_report_objects_carry_the_payload():
+    client = sync_client(payload_format='bytes', report_objects=True)
+    reports = []
+    client.i2c_callback = client.spi_callback = client.onewire_callback = \
+        reports.append
+
+    client._i2c_read_report(I2C_DATA)
+    client._spi_report(SPI_DATA)
+    client._onewire_report(ONE_WIRE_DATA)
+
+    i2c, spi, one_wire = reports
+    assert (i2c.address, i2c.register, i2c.data) == (ADDRESS, REGISTER, DATA)
+    assert (spi.register, spi.byte_count, spi.data) == (REGISTER, len(DATA), DATA)
+    assert (one_wire.subtype, one_wire.data) == (PrivateConstants.ONE_WIRE_READ,
+                                                 DATA)
+
+
+def test_unknown_payload_format_is_rejected():
+    with pytest.raises(RuntimeError):
+        sync_client(payload_format='array')
+    with pytest.raises(RuntimeError):
+        aio_client(payload_format='array')
+
+
+def test_memoryview_payload_of_a_received_report(board):
+    reports = []
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False,
+                             payload_format='memoryview')
+    try:
+        client.set_pin_mode_i2c()
+        client.i2c_read(ADDRESS, REGISTER, len(DATA), callback=reports.append)
+        board.send_report(PrivateConstants.I2C_READ_REPORT, I2C_DATA)
+        # a later report must not change the payload already delivered
+        board.send_report(PrivateConstants.I2C_READ_REPORT,
+                          bytes([len(DATA), ADDRESS, REGISTER]) + bytes(len(DATA)))
+        deadline = time.monotonic() + 2
+        while len(reports) < 2:
+            assert time.monotonic() < deadline
+            time.sleep(.005)
+    finally:
+        client.shutdown()
+
+    assert bytes(reports[0][4]) == DATA
+    assert bytes(reports[1][4]) == bytes(len(DATA))
@@ -0,0 +1,101 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+# every input pin mode that takes a callback, with the pin used for it
+INPUT_MODES = [('set_pin_mode_digital_input', 4),
+               ('set_pin_mode_digital_input_pullup', 4),
+               ('set_pin_mode_digital_input_pulldown', 4),
+               ('set_pin_mode_analog_input', 36),
+               ('set_pin_mode_touch', 4)]
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.005)
+
+
+@pytest.mark.parametrize('method, pin', INPUT_MODES)
+def test_sync_input_without_callback(board, method, pin):
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False,
+                             pin_state_cache=True)
+    try:
+        getattr(client, method)(pin)
+    finally:
+        client.shutdown()
+
+
+@pytest.mark.parametrize('method, pin', INPUT_MODES)
+def test_aio_input_without_callback(board, method, pin):
+    async def run():
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False,
+                                    pin_state_cache=True)
+        await client.start_aio()
+        try:
+            await getattr(client, method)(pin)
+        finally:
+            await client.shutdown()
+
+    asyncio.run(run())
+
+
+def test_sync_pulldown_value_is_polled(board):
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False,
+                             pin_state_cache=True)
+    try:
+        client.set_pin_mode_digital_input_pulldown(4)
+        board.send_report(PrivateConstants.DIGITAL_REPORT, [4, 1])
+        wait_for(lambda: client.get_digital(4) is not None)
+        assert client.get_digital(4)[0] == 1
+    finally:
+        client.shutdown()
+
+
+def test_callback_still_required_without_cache(board):
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        with pytest.raises(RuntimeError):
+            client.set_pin_mode_digital_input_pulldown(4)
+    finally:
+        client.shutdown()
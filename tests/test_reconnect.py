@@ -0,0 +1,179 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.config_journal import ConfigJournal
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+# connections killed per test
+KILLS = 5
+
+# recovery from a killed connection, when the board accepts the next
+# connection at once. The first attempt is made without a delay.
+RECOVERY_BOUND = .5
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.005)
+
+
+async def wait_for_aio(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        await asyncio.sleep(.005)
+
+
+def sent_since(board, command_id, since):
+    return [command for arrival, command in board.received(command_id)
+            if arrival >= since]
+
+
+def ignore(report):
+    pass
+
+
+async def ignore_aio(report):
+    pass
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def make_client(board):
+    return TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                           auto_reconnect=True, restart_on_shutdown=False,
+                           shutdown_on_exception=False)
+
+
+def test_journal_knows_device_commands():
+    journal = ConfigJournal()
+    journal.record(bytes([3, PrivateConstants.SET_PIN_MODE, 4,
+                          PrivateConstants.AT_INPUT]))
+    assert not journal.creates_devices()
+    journal.record(bytes([3, PrivateConstants.SONAR_NEW, 5, 18]))
+    assert journal.creates_devices()
+    journal.clear()
+    assert not journal.creates_devices()
+
+
+def test_sync_recovery_time(board):
+    client = make_client(board)
+    try:
+        client.set_pin_mode_digital_input(4, callback=ignore)
+        recovery_times = []
+        for kill in range(1, KILLS + 1):
+            killed = time.monotonic()
+            board.drop_connections()
+            wait_for(lambda: client.reconnects == kill)
+            recovery_times.append(client.last_recovery_time)
+            # the pin configuration was replayed, without a restart
+            wait_for(lambda: sent_since(board, PrivateConstants.SET_PIN_MODE, killed))
+        assert max(recovery_times) < RECOVERY_BOUND
+        assert board.restarts == 0
+        assert client.connection_drops == KILLS
+    finally:
+        client.shutdown()
+
+
+def test_sync_devices_replayed_after_a_restart(board):
+    client = make_client(board)
+    try:
+        client.set_pin_mode_sonar(5, 18, callback=ignore)
+        wait_for(lambda: board.received(PrivateConstants.SONAR_NEW))
+        killed = time.monotonic()
+        board.drop_connections()
+        wait_for(lambda: client.reconnects == 1, timeout=10)
+        # the replay is written before reconnects is counted, but the
+        # board may not have read it yet
+        wait_for(lambda: len(board.received(PrivateConstants.SONAR_NEW)) == 2)
+
+        assert board.restarts == 1
+        restart_time = board.received(PrivateConstants.RESET)[0][0]
+        sonars = board.received(PrivateConstants.SONAR_NEW)
+        # created once before the drop, and once on the restarted board
+        assert len(sonars) == 2
+        assert sonars[0][0] < killed < restart_time < sonars[1][0]
+        # the restart is part of the recovery
+        assert client.last_recovery_time >= PrivateConstants.RESTART_WAIT
+    finally:
+        client.shutdown()
+
+
+def test_aio_recovery_time(board):
+    async def run():
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    auto_reconnect=True,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False)
+        await client.start_aio()
+        try:
+            await client.set_pin_mode_digital_input(4, callback=ignore_aio)
+            recovery_times = []
+            for kill in range(1, KILLS + 1):
+                killed = time.monotonic()
+                board.drop_connections()
+                await wait_for_aio(lambda: client.reconnects == kill)
+                recovery_times.append(client.last_recovery_time)
+                await wait_for_aio(
+                    lambda: sent_since(board, PrivateConstants.SET_PIN_MODE, killed))
+            assert max(recovery_times) < RECOVERY_BOUND
+            assert board.restarts == 0
+
+            # a sonar must not be created twice on a board that kept it
+            await client.set_pin_mode_sonar(5, 18, callback=ignore_aio)
+            await wait_for_aio(lambda: board.received(PrivateConstants.SONAR_NEW))
+            board.drop_connections()
+            await wait_for_aio(lambda: client.reconnects == KILLS + 1, timeout=10)
+            await wait_for_aio(
+                lambda: len(board.received(PrivateConstants.SONAR_NEW)) == 2)
+            assert board.restarts == 1
+            restart_time = board.received(PrivateConstants.RESET)[0][0]
+            sonars = board.received(PrivateConstants.SONAR_NEW)
+            assert len(sonars) == 2
+            assert sonars[1][0] > restart_time
+        finally:
+            await client.shutdown()
+
+    asyncio.run(run())
+
+
+async def _open_fails(board):
+    client = TelemetrixAioEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                                autostart=False, shutdown_on_exception=False)
+    board.close()
+    await client.start_aio()
+
+
+def test_aio_transport_raises_when_it_can_not_connect(board):
+    with pytest.raises(RuntimeError):
+        asyncio.run(_open_fails(board))
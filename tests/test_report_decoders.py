@@ -0,0 +1,85 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import random
+import struct
+
+import pytest
+
+from telemetrix_esp32_common import report_decoders
+
+
+# the list based decoding the decoders replaced, applied to report data
+# that follows the report type byte
+
+def old_pin_value(data):
+    data = list(data)
+    return data[0], (data[1] << 8) + data[2]
+
+
+def old_dht_data(data):
+    f_humidity = bytearray(data[2:6])
+    f_temperature = bytearray(data[6:])
+    return (data[0], data[1], struct.unpack('<f', f_humidity)[0],
+            struct.unpack('<f', f_temperature)[0])
+
+
+def old_stepper_value(data):
+    return data[0], int.from_bytes(bytes(data[1:]), byteorder='big', signed=True)
+
+
+generator = random.Random(42)
+
+PIN_VALUE_DATA = [bytes([36, 0, 0]), bytes([36, 0xff, 0xff]), bytes([4, 0x01, 0x02])] + \
+    [bytes(generator.randrange(256) for _ in range(3)) for _ in range(50)]
+
+DHT_DATA = [bytes([0, 4]) + struct.pack('<ff', humidity, temperature)
+            for humidity, temperature in [(0.0, 0.0), (45.5, 21.25), (100.0, -40.0)]] + \
+    [bytes([0, generator.randrange(40)]) +
+     struct.pack('<ff', generator.uniform(0, 100), generator.uniform(-40, 80))
+     for _ in range(50)]
+
+STEPPER_DATA = [bytes([1]) + value.to_bytes(4, 'big', signed=True)
+                for value in (0, 1, -1, 2 ** 31 - 1, -2 ** 31)] + \
+    [bytes([generator.randrange(4)]) +
+     generator.randrange(-2 ** 31, 2 ** 31).to_bytes(4, 'big', signed=True)
+     for _ in range(50)]
+
+# report types, decoder, old decoding and report data
+CASES = [('analog, touch, sonar', report_decoders.PIN_VALUE, old_pin_value,
+          PIN_VALUE_DATA),
+         ('debug print', report_decoders.DEBUG_VALUE, old_pin_value, PIN_VALUE_DATA),
+         ('dht data', report_decoders.DHT_DATA, old_dht_data, DHT_DATA),
+         ('stepper distance, target, current', report_decoders.STEPPER_VALUE,
+          old_stepper_value, STEPPER_DATA)]
+
+
+@pytest.mark.parametrize('report_types, decoder, old_decode, samples', CASES,
+                         ids=[case[0] for case in CASES])
+def test_decoder_matches_the_list_decode(report_types, decoder, old_decode, samples):
+    for data in samples:
+        assert decoder.unpack_from(data) == old_decode(data)
+        # the data may be a slice of the receive buffer
+        assert decoder.unpack_from(memoryview(b'\x00' + data)[1:]) == old_decode(data)
+
+
+@pytest.mark.parametrize('decoder, size', [(report_decoders.PIN_VALUE, 3),
+                                           (report_decoders.DEBUG_VALUE, 3),
+                                           (report_decoders.DHT_DATA, 10),
+                                           (report_decoders.STEPPER_VALUE, 5)])
+def test_decoders_match_the_report_sizes(decoder, size):
+    assert decoder.size == size
@@ -0,0 +1,134 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import subprocess
+import sys
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_esp32.board_shard import ShardedBoard
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.report_ring import ReportRing
+
+
+@pytest.fixture
+def ring():
+    ring = ReportRing(capacity=4)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def test_reports_keep_their_types(ring):
+    assert ring.put(3, [2, 36, 4095, 1.5])
+    assert ring.put(7, [5, 1, 4, 45.5, 21.25, 2.0])
+    assert ring.get_all() == [(3, [2, 36, 4095, 1.5]),
+                              (7, [5, 1, 4, 45.5, 21.25, 2.0])]
+    assert ring.get_all() == []
+
+
+def test_long_reports_are_counted_not_truncated(ring):
+    assert not ring.put(0, list(range(ReportRing.MAX_FIELDS + 5)))
+    assert ring.oversized() == 1
+    assert ring.dropped() == 0
+    assert ring.get_all() == []
+
+
+def test_records_sized_for_the_largest_report():
+    # an i2c read of 32 bytes: type, port, count, address, register,
+    # data bytes and timestamp
+    report = [10, 0, 32, 0x68, 0x3b] + list(range(32)) + [1700000000.25]
+    ring = ReportRing(capacity=2, max_fields=len(report))
+    try:
+        consumer = ReportRing(name=ring.name, create=False)
+        assert consumer.max_fields == len(report)
+        assert ring.put(4, report)
+        assert consumer.get_all() == [(4, report)]
+        assert ring.oversized() == 0
+        consumer.close()
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+@pytest.mark.parametrize('max_fields', [0, ReportRing.FIELD_LIMIT + 1])
+def test_record_size_is_limited(max_fields):
+    with pytest.raises(RuntimeError):
+        ReportRing(max_fields=max_fields)
+
+
+def test_full_ring_drops_reports(ring):
+    for value in range(6):
+        ring.put(0, [value])
+    assert ring.dropped() == 2
+    assert [report for _, report in ring.get_all()] == [[0], [1], [2], [3]]
+    # space is released by reading
+    assert ring.put(0, [6])
+
+
+def test_consumer_attaches_by_name(ring):
+    consumer = ReportRing(name=ring.name, create=False)
+    ring.put(1, [1, 2, 3])
+    assert consumer.get_all() == [(1, [1, 2, 3])]
+    consumer.close()
+
+
+def test_attaching_process_does_not_remove_the_ring(ring):
+    # the resource tracker of an attaching process must not unlink the
+    # segment when that process exits
+    script = ('import sys\n'
+              'from telemetrix_esp32_common.report_ring import ReportRing\n'
+              'ring = ReportRing(name=sys.argv[1], create=False)\n'
+              'ring.put(2, [7, 8])\n'
+              'ring.close()\n')
+    result = subprocess.run([sys.executable, '-c', script, ring.name],
+                            capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    assert 'leaked' not in result.stderr
+    again = ReportRing(name=ring.name, create=False)
+    assert again.get_all() == [(2, [7, 8])]
+    again.close()
+
+
+@pytest.mark.parametrize('option', [{'report_objects': True},
+                                    {'payload_format': 'bytes'},
+                                    {'payload_format': 'memoryview'}])
+def test_sharded_board_rejects_non_numeric_reports(option):
+    with pytest.raises(RuntimeError):
+        ShardedBoard(transport_address='127.0.0.1', **option)
+
+
+def test_sharded_board_delivers_reports():
+    board = FakeBoard()
+    shard = ShardedBoard(transport_address='127.0.0.1', ip_port=board.port,
+                         restart_on_shutdown=False, shutdown_on_exception=False)
+    reports = []
+    try:
+        shard.set_pin_mode_analog_input(36, callback=reports.append)
+        board.send_report(PrivateConstants.ANALOG_REPORT, [36, 0x0f, 0xff])
+        end = time.monotonic() + 5
+        while not reports and time.monotonic() < end:
+            shard.process_reports()
+            time.sleep(.005)
+    finally:
+        shard.shutdown()
+        board.close()
+
+    assert len(reports) == 1
+    assert reports[0][:3] == [PrivateConstants.ANALOG_REPORT, 36, 4095]
@@ -0,0 +1,115 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.packet_framer import PacketFramer
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.report_subscriptions import ReportSubscriptions
+
+PIN = 36
+
+OTHER_PIN = 39
+
+# an analog input that can also be an output
+OUTPUT_PIN = 32
+
+
+def analog_frame(pin, value):
+    return bytes([4, PrivateConstants.ANALOG_REPORT, pin, value >> 8, value & 0xff])
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.005)
+
+
+def test_unsubscribed_reports_are_skipped_and_counted():
+    subscriptions = ReportSubscriptions()
+    subscriptions.subscribe(PrivateConstants.ANALOG_REPORT, PIN)
+    framer = PacketFramer(subscriptions)
+
+    stream = b''.join(analog_frame(pin, value)
+                      for value in range(4) for pin in (PIN, OTHER_PIN))
+    assert framer.feed(stream) == [analog_frame(PIN, value)[1:] for value in range(4)]
+    assert subscriptions.skipped == 4
+    assert framer.pending() == 0
+
+
+@pytest.mark.parametrize('split', range(1, 10))
+def test_skipping_across_split_frames(split):
+    subscriptions = ReportSubscriptions()
+    subscriptions.subscribe(PrivateConstants.ANALOG_REPORT, PIN)
+    framer = PacketFramer(subscriptions)
+
+    stream = analog_frame(OTHER_PIN, 1) + analog_frame(PIN, 2)
+    packets = framer.feed(stream[:split]) + framer.feed(stream[split:])
+    assert packets == [analog_frame(PIN, 2)[1:]]
+    assert subscriptions.skipped == 1
+
+
+def test_reports_without_a_bitmap_and_empty_packets_pass():
+    subscriptions = ReportSubscriptions()
+    framer = PacketFramer(subscriptions)
+    firmware = bytes([4, PrivateConstants.FIRMWARE_REPORT, 2, 0, 0])
+    # a digital report too short to hold its pin is skipped
+    short = bytes([1, PrivateConstants.DIGITAL_REPORT])
+    assert framer.feed(firmware + b'\x00' + short) == [firmware[1:], b'']
+    assert subscriptions.skipped == 1
+
+
+def test_disabled_subscriptions_pass_everything():
+    subscriptions = ReportSubscriptions()
+    framer = PacketFramer(subscriptions)
+    subscriptions.disable()
+    assert framer.feed(analog_frame(PIN, 7)) == [analog_frame(PIN, 7)[1:]]
+    assert subscriptions.skipped == 0
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def test_changing_a_pin_mode_unsubscribes_its_reports(board):
+    values = []
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        client.set_pin_mode_analog_input(OUTPUT_PIN,
+                                         callback=lambda data: values.append(data[2]))
+        board.send_report(PrivateConstants.ANALOG_REPORT, [OUTPUT_PIN, 0, 1])
+        wait_for(lambda: values == [1])
+        assert client.get_skipped_report_count() == 0
+
+        client.set_pin_mode_digital_output(OUTPUT_PIN)
+        assert OUTPUT_PIN not in client.analog_callbacks
+        board.send_report(PrivateConstants.ANALOG_REPORT, [OUTPUT_PIN, 0, 2])
+        board.send_report(PrivateConstants.DIGITAL_REPORT, [OUTPUT_PIN, 1])
+        wait_for(lambda: client.get_skipped_report_count() == 2)
+        assert values == [1]
+    finally:
+        client.shutdown()
@@ -0,0 +1,96 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import struct
+
+import pytest
+
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.reports import (DhtReport, I2cReport, OneWireReport,
+                                             PinReport, SpiReport, StepperReport,
+                                             WindowReport)
+
+PIN = 36
+
+TIME_STAMP = 1700000000.5
+
+# one instance of each report class and its field values
+REPORTS = [(PinReport, (PrivateConstants.AT_ANALOG, PIN, 4095, TIME_STAMP)),
+           (DhtReport, (PrivateConstants.DHT_REPORT, 0, 4, 45.5, 21.25, None,
+                        TIME_STAMP)),
+           (I2cReport, (PrivateConstants.I2C_READ_REPORT, 2, 0x68, 0x3b, [1, 2],
+                        TIME_STAMP)),
+           (SpiReport, (PrivateConstants.SPI_REPORT, 0x0f, 2, [3, 4], TIME_STAMP)),
+           (OneWireReport, (PrivateConstants.ONE_WIRE_REPORT, 29, [1], TIME_STAMP)),
+           (StepperReport, (PrivateConstants.STEPPER_RUNNING_REPORT, 1, 1,
+                            TIME_STAMP)),
+           (WindowReport, (PrivateConstants.AT_ANALOG, PIN, 1, 9, 5.0, 3, 1.0, 1.2))]
+
+
+@pytest.mark.parametrize('report_class, values', REPORTS)
+def test_fields_are_read_by_name(report_class, values):
+    report = report_class(*values)
+    assert tuple(getattr(report, name) for name in report_class.__slots__) == values
+    assert repr(report).startswith(report_class.__name__ + '(')
+
+
+@pytest.mark.parametrize('report_class, values', REPORTS)
+def test_equality(report_class, values):
+    assert report_class(*values) == report_class(*values)
+    changed = report_class(*values)
+    setattr(changed, report_class.__slots__[1], -1)
+    assert changed != report_class(*values)
+    # a report is not equal to the list with the same values
+    assert report_class(*values) != list(values)
+
+
+def test_reports_of_different_classes_are_not_equal():
+    assert PinReport(1, 2, 3, 4.0) != StepperReport(1, 2, 3, 4.0)
+
+
+@pytest.mark.parametrize('report_class, values', REPORTS)
+def test_slots_are_enforced(report_class, values):
+    report = report_class(*values)
+    assert not hasattr(report, '__dict__')
+    with pytest.raises(AttributeError):
+        report.unknown_field = 1
+
+
+@pytest.fixture
+def client():
+    return TelemetrixEsp32(transport_address='127.0.0.1', autostart=False,
+                           restart_on_shutdown=False, shutdown_on_exception=False,
+                           report_objects=True)
+
+
+def test_handlers_build_report_objects(client):
+    reports = []
+    client.report_time = TIME_STAMP
+    client.analog_callbacks[PIN] = reports.append
+    client.dht_callbacks[4] = reports.append
+    client.stepper_info_list[1]['is_running_callback'] = reports.append
+
+    client._analog_message(bytes([PIN, 0x0f, 0xff]))
+    client._dht_report(bytes([0, 4]) + struct.pack('<ff', 45.5, 21.25))
+    client._stepper_is_running_report(bytes([1, 1]))
+
+    assert reports == [PinReport(PrivateConstants.AT_ANALOG, PIN, 4095, TIME_STAMP),
+                       DhtReport(PrivateConstants.DHT_REPORT, 0, 4, 45.5, 21.25,
+                                 None, TIME_STAMP),
+                       StepperReport(PrivateConstants.STEPPER_RUNNING_REPORT, 1, 1,
+                                     TIME_STAMP)]
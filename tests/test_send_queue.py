@@ -0,0 +1,106 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+@pytest.fixture
+def client(board, monkeypatch):
+    monkeypatch.setattr(PrivateConstants, 'SEND_WAIT_INTERVAL', .05)
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    yield client
+    client.shutdown()
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.005)
+
+
+def stop_writer(client):
+    client.shutdown_flag = True
+    client.send_event.set()
+    client.the_data_send_thread.join(2)
+    assert not client.the_data_send_thread.is_alive()
+    client.shutdown_flag = False
+
+
+def test_send_after_the_writer_stops_is_written_directly(board, client):
+    stop_writer(client)
+    assert not client.writer_running
+
+    client._send_command([PrivateConstants.LOOP_COMMAND, ord('A')], block=True)
+    wait_for(lambda: board.received(PrivateConstants.LOOP_COMMAND))
+
+
+def test_stopping_writer_releases_queued_callers(board, client):
+    # hold the writer on the send lock so frames stay queued
+    errors = []
+    released = []
+
+    def send():
+        try:
+            client._send_command([PrivateConstants.LOOP_COMMAND, ord('B')],
+                                 block=True)
+        except RuntimeError as e:
+            errors.append(e)
+        released.append(True)
+
+    with client.send_lock:
+        senders = [threading.Thread(target=send) for _ in range(4)]
+        for sender in senders:
+            sender.start()
+        wait_for(lambda: len(client.send_queue) == 4)
+        client.shutdown_flag = True
+        client.send_event.set()
+
+    for sender in senders:
+        sender.join(2)
+    assert len(released) == 4
+    # frames queued before the writer stopped are still written
+    assert not errors
+    wait_for(lambda: len(board.received(PrivateConstants.LOOP_COMMAND)) == 4)
+
+
+def test_dead_writer_fails_blocking_callers(client):
+    stop_writer(client)
+    # the writer is gone, but it never released the queue
+    client.writer_running = True
+
+    start = time.monotonic()
+    with pytest.raises(RuntimeError):
+        client._send_command([PrivateConstants.LOOP_COMMAND, ord('C')], block=True)
+    assert time.monotonic() - start < 1
+    assert not client.send_queue
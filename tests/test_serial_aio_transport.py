@@ -0,0 +1,126 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import os
+import pty
+import time
+
+import pytest
+import serial
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.serial_aio_transport import SerialAioTransport
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+
+@pytest.fixture(autouse=True)
+def no_boot_wait(monkeypatch):
+    # the pty does not reset like an ESP32 does
+    monkeypatch.setattr(PrivateConstants, 'SERIAL_BOOT_WAIT', 0)
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def test_bulk_read_over_pty():
+    master, slave = pty.openpty()
+
+    async def run():
+        transport = SerialAioTransport(os.ttyname(slave))
+        await transport.start()
+        await transport.write(b'\x01\x05')
+        written = os.read(master, 16)
+
+        os.write(master, bytes(range(1, 101)))
+        await asyncio.sleep(.05)
+        data = await transport.read(PrivateConstants.MAX_RECEIVE_SIZE)
+        await transport.close()
+        return written, data
+
+    try:
+        written, data = asyncio.run(run())
+    finally:
+        os.close(master)
+        os.close(slave)
+    assert written == b'\x01\x05'
+    # everything waiting is returned by a single read
+    assert data == bytes(range(1, 101))
+
+
+def test_blocked_write_does_not_stall_the_loop():
+    master, slave = pty.openpty()
+
+    async def run():
+        transport = SerialAioTransport(os.ttyname(slave))
+        await transport.start()
+
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(.01)
+
+        ticker_task = asyncio.ensure_future(ticker())
+        # nobody reads the master side, so the write blocks until
+        # the port's write timeout
+        with pytest.raises(serial.SerialTimeoutException):
+            await transport.write(bytes(1 << 20))
+        ticker_task.cancel()
+        await transport.close()
+        return ticks
+
+    try:
+        ticks = asyncio.run(run())
+    finally:
+        os.close(master)
+        os.close(slave)
+    assert len(ticks) > 20
+    assert max(later - earlier for earlier, later in zip(ticks, ticks[1:])) < .2
+
+
+def test_client_over_pty(board):
+    path = board.open_pty()
+
+    async def run():
+        replies = []
+
+        async def loop_back_reply(data):
+            replies.append(data)
+
+        client = TelemetrixAioEsp32(com_port=path, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False)
+        await client.start_aio()
+        await client.loop_back('A', callback=loop_back_reply)
+        for _ in range(200):
+            if replies:
+                break
+            await asyncio.sleep(.01)
+        firmware = client.firmware_version
+        await client.shutdown()
+        return firmware, replies
+
+    firmware, replies = asyncio.run(run())
+    assert list(firmware) == list(FakeBoard.FIRMWARE)
+    assert replies == [[ord('A')]]
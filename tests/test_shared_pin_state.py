@@ -0,0 +1,86 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from telemetrix_esp32_common.shared_pin_state import SharedPinStateTable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READER = """
+import sys
+from telemetrix_esp32_common.shared_pin_state import SharedPinStateTable
+table = SharedPinStateTable(sys.argv[1], create=False)
+print(table.get('analog', 36), table.get_dht(4))
+table.close()
+"""
+
+
+def run_reader(name):
+    """
+    Read the table from an independent process, as an HMI or logger would.
+    """
+    result = subprocess.run([sys.executable, '-c', READER, name], cwd=ROOT,
+                            capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+@pytest.fixture
+def table():
+    table = SharedPinStateTable()
+    yield table
+    table.close()
+
+
+def test_reader_process_sees_updates(table):
+    table.update('analog', 36, 1234, 1.0)
+    table.update_dht(4, 45.5, 21.25, 2.0)
+    assert run_reader(table.name) == '(1234, 1.0, 1) (45.5, 21.25, 2.0, 2)'
+
+
+def test_segment_survives_reader_exit(table):
+    table.update('analog', 36, 1234, 1.0)
+    run_reader(table.name)
+    # a second reader can still attach once the first has exited
+    assert run_reader(table.name).startswith('(1234, 1.0, 1)')
+
+
+def test_close_tolerates_removed_segment():
+    table = SharedPinStateTable()
+    table.shm.unlink()
+    table.close()
+    table.close()
+
+
+def test_incompatible_segment_is_rejected(table):
+    table.buffer[0:4] = b'XXXX'
+    with pytest.raises(RuntimeError):
+        SharedPinStateTable(table.name, create=False)
+
+
+def test_snapshot(table):
+    table.update('digital', 5, 1, 1.0)
+    table.update('stepper_current_position', 2, -300, 2.0)
+    snapshot = table.snapshot()
+    assert snapshot['digital'] == {5: (1, 1.0, 1)}
+    assert snapshot['stepper_current_position'] == {2: (-300, 2.0, 2)}
+    assert snapshot['analog'] == {}
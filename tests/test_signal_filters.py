@@ -0,0 +1,126 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.signal_filters import FilterPipeline
+
+PIN = 36
+
+
+def reference(stage, values, time_stamps):
+    """
+    Filter one sample at a time.
+    """
+    name, parameter = stage
+    output = []
+    if name in ('moving_average', 'median'):
+        window = [values[0]] * (parameter - 1)
+        for value in values:
+            window = (window + [value])[-parameter:]
+            output.append(np.mean(window) if name == 'moving_average'
+                          else np.median(window))
+    else:
+        y = values[0]
+        last_time_stamp = time_stamps[0]
+        for value, time_stamp in zip(values, time_stamps):
+            if name == 'ema':
+                decay = 1 - parameter
+            else:
+                decay = np.exp(-2 * np.pi * parameter * (time_stamp - last_time_stamp))
+            last_time_stamp = time_stamp
+            y = decay * y + (1 - decay) * value
+            output.append(y)
+    return output
+
+
+@pytest.mark.parametrize('stage', [('moving_average', 4), ('median', 5),
+                                   ('ema', .2), ('low_pass', 10)])
+@pytest.mark.parametrize('batch', [1, 7, 100, 1000])
+def test_batches_match_single_samples(stage, batch):
+    rng = np.random.default_rng(1)
+    values = rng.integers(0, 4096, 1000).tolist()
+    # irregular sample intervals
+    time_stamps = np.cumsum(rng.uniform(.001, .01, 1000)).tolist()
+
+    pipeline = FilterPipeline([stage])
+    output = []
+    for start in range(0, len(values), batch):
+        for value, time_stamp in zip(values[start:start + batch],
+                                     time_stamps[start:start + batch]):
+            pipeline.add(value, time_stamp)
+        output += pipeline.run()[0]
+
+    assert output == pytest.approx(reference(stage, values, time_stamps))
+
+
+def test_invalid_stage_is_rejected():
+    with pytest.raises(RuntimeError):
+        FilterPipeline([('notch', 50)])
+
+
+@pytest.fixture
+def client():
+    board = FakeBoard()
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    yield client
+    client.shutdown()
+    board.close()
+
+
+def analog_report(value):
+    return bytes([PIN, value >> 8, value & 0xff])
+
+
+def test_replaced_filters_deliver_queued_samples(client):
+    delivered = []
+    client.analog_callbacks[PIN] = delivered.append
+    client.set_analog_filter(PIN, [('moving_average', 1)])
+    for value in range(10):
+        client._analog_message(analog_report(value))
+
+    client.set_analog_filter(PIN, [('ema', .5)])
+    assert [report[2] for report in delivered] == list(range(10))
+    assert not client.filters_pending
+
+
+def test_filter_changes_while_reports_arrive(client):
+    delivered = []
+    client.analog_callbacks[PIN] = delivered.append
+    client.set_analog_filter(PIN, [('moving_average', 1)])
+    count = 20000
+
+    def feed():
+        for value in range(count):
+            client._analog_message(analog_report(value & 0xfff))
+        client._flush_analog_filters()
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    while feeder.is_alive():
+        client.set_analog_filter(PIN, [('moving_average', 1)])
+    feeder.join()
+
+    # no sample is lost when a pipeline is replaced
+    assert len(delivered) == count
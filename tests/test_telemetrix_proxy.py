@@ -0,0 +1,260 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_proxy import ProxyClient, TelemetrixProxy
+from telemetrix_esp32_common.private_constants import PrivateConstants
+
+ANALOG_PIN = 36
+
+DIGITAL_PIN = 4
+
+OUTPUT_PIN = 32
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def frame(*command):
+    return bytes([len(command)]) + bytes(command)
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(.005)
+
+
+async def read_available(reader, wait=.2):
+    data = b''
+    while True:
+        try:
+            chunk = await asyncio.wait_for(reader.read(4096), wait)
+        except asyncio.TimeoutError:
+            return data
+        if not chunk:
+            return data
+        data += chunk
+
+
+async def start_proxy(board, **kwargs):
+    proxy = TelemetrixProxy(listen_port=0, transport_address='127.0.0.1',
+                            ip_port=board.port, restart_on_shutdown=False,
+                            shutdown_on_exception=False, **kwargs)
+    await proxy.start()
+    port = proxy.server.sockets[0].getsockname()[1]
+    return proxy, port
+
+
+async def connect(port, proxy):
+    clients = len(proxy.clients)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    await wait_for(lambda: len(proxy.clients) == clients + 1)
+    return reader, writer
+
+
+def test_clients_only_receive_subscribed_reports(board):
+    async def run():
+        proxy, port = await start_proxy(board)
+        analog_reader, analog_writer = await connect(port, proxy)
+        digital_reader, digital_writer = await connect(port, proxy)
+
+        analog_writer.write(frame(PrivateConstants.SET_PIN_MODE, ANALOG_PIN,
+                                  PrivateConstants.AT_ANALOG, 0, 0, 1))
+        digital_writer.write(frame(PrivateConstants.SET_PIN_MODE, DIGITAL_PIN,
+                                   PrivateConstants.AT_INPUT, 1))
+        await wait_for(lambda: len(board.received(PrivateConstants.SET_PIN_MODE)) == 2)
+
+        board.send_report(PrivateConstants.ANALOG_REPORT, [ANALOG_PIN, 1, 2])
+        board.send_report(PrivateConstants.DIGITAL_REPORT, [DIGITAL_PIN, 1])
+        board.send_report(PrivateConstants.ANALOG_REPORT, [ANALOG_PIN + 1, 3, 4])
+
+        analog_data = await read_available(analog_reader)
+        digital_data = await read_available(digital_reader)
+        statistics = proxy.statistics()
+
+        analog_writer.close()
+        digital_writer.close()
+        await proxy.shutdown()
+        return analog_data, digital_data, statistics
+
+    analog_data, digital_data, statistics = asyncio.run(run())
+    assert analog_data == frame(PrivateConstants.ANALOG_REPORT, ANALOG_PIN, 1, 2)
+    assert digital_data == frame(PrivateConstants.DIGITAL_REPORT, DIGITAL_PIN, 1)
+    assert statistics['reports_sent'] == 2
+
+
+def test_unfiltered_clients_receive_every_report(board):
+    async def run():
+        proxy, port = await start_proxy(board, filter_reports=False)
+        reader, writer = await connect(port, proxy)
+
+        board.send_report(PrivateConstants.ANALOG_REPORT, [ANALOG_PIN, 1, 2])
+        data = await read_available(reader)
+
+        writer.close()
+        await proxy.shutdown()
+        return data
+
+    assert asyncio.run(run()) == frame(PrivateConstants.ANALOG_REPORT,
+                                       ANALOG_PIN, 1, 2)
+
+
+def test_output_pins_belong_to_the_first_client(board):
+    async def run():
+        proxy, port = await start_proxy(board)
+        _, owner = await connect(port, proxy)
+        _, other = await connect(port, proxy)
+
+        owner.write(frame(PrivateConstants.SET_PIN_MODE, OUTPUT_PIN,
+                          PrivateConstants.AT_OUTPUT))
+        owner.write(frame(PrivateConstants.DIGITAL_WRITE, OUTPUT_PIN, 1))
+        await wait_for(lambda: board.received(PrivateConstants.DIGITAL_WRITE))
+
+        other.write(frame(PrivateConstants.DIGITAL_WRITE, OUTPUT_PIN, 0))
+        await wait_for(lambda: proxy.commands_rejected == 1)
+        writes_while_owned = len(board.received(PrivateConstants.DIGITAL_WRITE))
+
+        # the pin is released when its owner disconnects
+        owner.close()
+        await wait_for(lambda: len(proxy.clients) == 1)
+        other.write(frame(PrivateConstants.DIGITAL_WRITE, OUTPUT_PIN, 0))
+        await wait_for(lambda: len(board.received(PrivateConstants.DIGITAL_WRITE)) == 2)
+
+        other.close()
+        await proxy.shutdown()
+        return writes_while_owned
+
+    assert asyncio.run(run()) == 1
+    assert [command for _, command in board.received(PrivateConstants.DIGITAL_WRITE)] == \
+        [bytes([PrivateConstants.DIGITAL_WRITE, OUTPUT_PIN, 1]),
+         bytes([PrivateConstants.DIGITAL_WRITE, OUTPUT_PIN, 0])]
+
+
+def test_shared_commands_are_answered_or_rejected(board):
+    async def run():
+        proxy, port = await start_proxy(board)
+        reader, writer = await connect(port, proxy)
+
+        writer.write(frame(PrivateConstants.GET_FIRMWARE_VERSION))
+        writer.write(frame(PrivateConstants.RESET))
+        writer.write(frame(PrivateConstants.STOP_ALL_REPORTS))
+        data = await read_available(reader)
+        statistics = proxy.statistics()
+        forwarded = board.received(PrivateConstants.RESET) + \
+            board.received(PrivateConstants.STOP_ALL_REPORTS)
+
+        writer.close()
+        await proxy.shutdown()
+        return data, statistics, forwarded
+
+    data, statistics, forwarded = asyncio.run(run())
+    assert data == frame(PrivateConstants.FIRMWARE_REPORT, *FakeBoard.FIRMWARE)
+    assert statistics['commands_answered'] == 1
+    assert statistics['commands_rejected'] == 2
+    assert not forwarded
+
+
+def test_loop_back_replies_return_to_the_requesting_client(board):
+    async def run():
+        proxy, port = await start_proxy(board)
+        first_reader, first_writer = await connect(port, proxy)
+        second_reader, second_writer = await connect(port, proxy)
+
+        first_writer.write(frame(PrivateConstants.LOOP_COMMAND, ord('A')))
+        second_writer.write(frame(PrivateConstants.LOOP_COMMAND, ord('B')))
+        first_writer.write(frame(PrivateConstants.LOOP_COMMAND, ord('C')))
+
+        first_data = await read_available(first_reader)
+        second_data = await read_available(second_reader)
+
+        first_writer.close()
+        second_writer.close()
+        await proxy.shutdown()
+        return first_data, second_data
+
+    first_data, second_data = asyncio.run(run())
+    assert first_data == frame(PrivateConstants.LOOP_COMMAND, ord('A')) + \
+        frame(PrivateConstants.LOOP_COMMAND, ord('C'))
+    assert second_data == frame(PrivateConstants.LOOP_COMMAND, ord('B'))
+
+
+class FakeTransport:
+    def __init__(self, buffered):
+        self.buffered = buffered
+
+    def is_closing(self):
+        return False
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+
+class FakeWriter:
+    def __init__(self, buffered):
+        self.transport = FakeTransport(buffered)
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+
+def test_reports_for_a_slow_client_are_dropped(board):
+    async def run():
+        proxy, port = await start_proxy(board, max_client_buffer=100)
+        fast = ProxyClient(None, FakeWriter(0))
+        slow = ProxyClient(None, FakeWriter(101))
+        for client in (fast, slow):
+            client.subscriptions.add((PrivateConstants.ANALOG_REPORT, ANALOG_PIN))
+            proxy.clients.append(client)
+
+        board.send_report(PrivateConstants.ANALOG_REPORT, [ANALOG_PIN, 1, 2])
+        await wait_for(lambda: fast.reports_sent + slow.reports_dropped == 2)
+        statistics = proxy.statistics()
+
+        proxy.clients.clear()
+        await proxy.shutdown()
+        return fast, slow, statistics
+
+    fast, slow, statistics = asyncio.run(run())
+    assert fast.writer.written == [frame(PrivateConstants.ANALOG_REPORT, ANALOG_PIN, 1, 2)]
+    assert not slow.writer.written
+    assert statistics['reports_sent'] == 1
+    assert statistics['reports_dropped'] == 1
+
+
+def test_shutdown_closes_client_connections(board):
+    async def run():
+        proxy, port = await start_proxy(board)
+        reader, writer = await connect(port, proxy)
+        await proxy.shutdown()
+        closed = await asyncio.wait_for(reader.read(), 2) == b''
+        writer.close()
+        return closed, proxy.server.is_serving()
+
+    closed, serving = asyncio.run(run())
+    assert closed
+    assert not serving
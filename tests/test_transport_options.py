@@ -0,0 +1,150 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import socket
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.transport_options import TransportOptions
+
+PIN = 36
+
+# the frame of an analog report, split after its length byte
+FRAME = bytes([4, PrivateConstants.ANALOG_REPORT, PIN, 0x01, 0x02])
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(.005)
+
+
+def test_options_are_applied():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        TransportOptions(receive_buffer_size=65536).apply(sock)
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 65536
+    finally:
+        sock.close()
+
+
+def test_sync_read_timeout_spans_a_split_frame(board):
+    reports = []
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False,
+                             transport_options=TransportOptions(read_timeout=.02))
+    try:
+        client.set_pin_mode_analog_input(PIN, callback=reports.append)
+        board.send_raw(FRAME[:1])
+        time.sleep(.2)
+        board.send_raw(FRAME[1:])
+        wait_for(lambda: reports)
+    finally:
+        client.shutdown()
+    assert reports[0][:3] == [PrivateConstants.AT_ANALOG, PIN, 0x0102]
+
+
+def test_sync_read_timeout_does_not_limit_writes(board):
+    # the board reads one byte every .2 seconds, so the send buffers fill
+    board.read_size = 1
+    board.read_delay = .2
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False,
+                             transport_options=TransportOptions(read_timeout=.01,
+                                                                write_timeout=.5))
+    start = time.monotonic()
+    try:
+        with pytest.raises(socket.timeout):
+            client._write_to_link(bytes(1 << 26))
+    finally:
+        elapsed = time.monotonic() - start
+        client.shutdown_flag = True
+        client._stop_threads()
+        client._close_link()
+    assert elapsed >= .5
+
+
+def test_aio_read_timeout_spans_a_split_frame(board):
+    async def run():
+        reports = []
+
+        async def analog_callback(data):
+            reports.append(data)
+
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False,
+                                    transport_options=TransportOptions(
+                                        read_timeout=.02))
+        await client.start_aio()
+        await client.set_pin_mode_analog_input(PIN, callback=analog_callback)
+        board.send_raw(FRAME[:1])
+        await asyncio.sleep(.2)
+        board.send_raw(FRAME[1:])
+        for _ in range(200):
+            if reports:
+                break
+            await asyncio.sleep(.01)
+        await client.shutdown()
+        return reports
+
+    reports = asyncio.run(run())
+    assert reports[0][:3] == [PrivateConstants.AT_ANALOG, PIN, 0x0102]
+
+
+def test_aio_write_timeout(board):
+    board.read_size = 1
+    board.read_delay = .2
+
+    async def run():
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False,
+                                    transport_options=TransportOptions(
+                                        read_timeout=.01, write_timeout=.5))
+        await client.start_aio()
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await client.transport.write(bytes(1 << 23))
+        elapsed = time.monotonic() - start
+        client.shutdown_flag = True
+        client.the_task.cancel()
+        client.writer_task.cancel()
+        await client.transport.close()
+        return elapsed
+
+    assert asyncio.run(run()) >= .5
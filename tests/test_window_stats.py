@@ -0,0 +1,144 @@
+"""
+ Copyright (c) 2022-2024 Alan Yorinks All rights reserved.
+
+ This program is free software; you can redistribute it and/or
+ modify it under the terms of the GNU AFFERO GENERAL PUBLIC LICENSE
+ Version 3 as published by the Free Software Foundation; either
+ or (at your option) any later version.
+ This library is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+ General Public License for more details.
+
+ You should have received a copy of the GNU AFFERO GENERAL PUBLIC LICENSE
+ along with this library; if not, write to the Free Software
+ Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from fake_board import FakeBoard
+from telemetrix_aio_esp32.telemetrix_aio_esp32 import TelemetrixAioEsp32
+from telemetrix_esp32.telemetrix_esp32 import TelemetrixEsp32
+from telemetrix_esp32_common.private_constants import PrivateConstants
+from telemetrix_esp32_common.window_stats import WindowStats
+
+PIN = 36
+
+WINDOW = .1
+
+
+@pytest.fixture
+def stats():
+    stats = WindowStats()
+    stats.configure('analog', PIN, 1.0)
+    return stats
+
+
+def test_sample_after_the_end_completes_the_window(stats):
+    assert stats.add('analog', PIN, 10, 100.0) is None
+    assert stats.add('analog', PIN, 30, 100.5) is None
+    assert stats.add('analog', PIN, 20, 101.0) == (10, 30, 20, 2, 100.0, 100.5)
+    # the completing sample starts the next window
+    assert stats.add('analog', PIN, 40, 102.0) == (20, 20, 20, 1, 101.0, 101.0)
+
+
+def test_expire_completes_a_window_without_later_samples(stats):
+    stats.add('analog', PIN, 10, 100.0)
+    stats.add('analog', PIN, 20, 100.2)
+    assert stats.expire(100.9) == []
+    assert stats.wait_time(100.9) == pytest.approx(.1)
+
+    assert stats.expire(101.0) == [('analog', PIN, (10, 20, 15, 2, 100.0, 100.2))]
+    # a window is only reported once
+    assert stats.expire(105.0) == []
+    # the next sample starts a new window
+    assert stats.add('analog', PIN, 50, 105.0) is None
+    assert stats.expire(106.0) == [('analog', PIN, (50, 50, 50, 1, 105.0, 105.0))]
+
+
+def test_expire_handles_each_kind_and_pin(stats):
+    stats.configure('touch', 4, .5)
+    stats.configure('sonar', 5, 2.0)
+    stats.add('analog', PIN, 1, 100.0)
+    stats.add('touch', 4, 2, 100.0)
+    stats.add('sonar', 5, 3, 100.0)
+
+    assert stats.expire(100.5) == [('touch', 4, (2, 2, 2, 1, 100.0, 100.0))]
+    assert stats.wait_time(100.5) == pytest.approx(.5)
+    assert sorted(stats.expire(102.0)) == [('analog', PIN, (1, 1, 1, 1, 100.0, 100.0)),
+                                           ('sonar', 5, (3, 3, 3, 1, 100.0, 100.0))]
+
+
+def test_disabled_pins_are_not_expired(stats):
+    stats.add('analog', PIN, 1, 100.0)
+    stats.configure('analog', PIN, None)
+    assert stats.expire(200.0) == []
+    assert stats.wait_time(200.0) is None
+
+
+def analog_report(value):
+    return [PIN, value >> 8, value & 0xff]
+
+
+@pytest.fixture
+def board():
+    board = FakeBoard()
+    yield board
+    board.close()
+
+
+def test_sync_last_window_is_reported_when_reports_stop(board):
+    windows = []
+    client = TelemetrixEsp32(transport_address='127.0.0.1', ip_port=board.port,
+                             restart_on_shutdown=False,
+                             shutdown_on_exception=False)
+    try:
+        client.set_pin_mode_analog_input(PIN, callback=windows.append,
+                                         aggregate=WINDOW)
+        for value in (100, 200, 300):
+            board.send_report(PrivateConstants.ANALOG_REPORT, analog_report(value))
+        start = time.monotonic()
+        while not windows and time.monotonic() - start < 2:
+            time.sleep(.005)
+        waited = time.monotonic() - start
+    finally:
+        client.shutdown()
+
+    assert len(windows) == 1
+    assert windows[0][:6] == [PrivateConstants.AT_ANALOG, PIN, 100, 300, 200, 3]
+    assert waited < WINDOW + .2
+
+
+def test_aio_last_window_is_reported_when_reports_stop(board):
+    async def run():
+        windows = []
+
+        async def window_callback(data):
+            windows.append(data)
+
+        client = TelemetrixAioEsp32(transport_address='127.0.0.1',
+                                    ip_port=board.port, autostart=False,
+                                    restart_on_shutdown=False,
+                                    shutdown_on_exception=False)
+        await client.start_aio()
+        await client.set_pin_mode_analog_input(PIN, callback=window_callback,
+                                               aggregate=WINDOW)
+        for value in (100, 200, 300):
+            board.send_report(PrivateConstants.ANALOG_REPORT, analog_report(value))
+        start = time.monotonic()
+        while not windows and time.monotonic() - start < 2:
+            await asyncio.sleep(.005)
+        waited = time.monotonic() - start
+        await client.shutdown()
+        # a later aggregated input starts a new expiry task
+        assert client.window_task is None
+        return windows, waited
+
+    windows, waited = asyncio.run(run())
+    assert len(windows) == 1
+    assert windows[0][:6] == [PrivateConstants.AT_ANALOG, PIN, 100, 300, 200, 3]
+    assert waited < WINDOW + .2